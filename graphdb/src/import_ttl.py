@@ -14,7 +14,10 @@ if __name__ == '__main__':
     graph = Graph()
     graph.parse('../../data/meta/LBNL_FDD_Data_Sets_FCU.ttl', format='n3')
 
-    full_object_names = {}
+    node_repository.create_indexes()
+
+    nodes = []
+    edges = []
     for statement in graph:
         subject = str(statement[0]).split("/")[-1].split('#')[-1]
         predicate = str(statement[1]).split("/")[-1].split('#')[-1]
@@ -23,12 +26,14 @@ if __name__ == '__main__':
         if subject != 'fcu':
             object = subject + "_" + object
 
-        node_repository.create_node(subject, {'name': subject, 'type': subject})
-        node_repository.create_node(object, {'name': object, 'type': subject})
-        edge_repository.create_edge(predicate, subject, object)
+        nodes.append((subject, {'name': subject, 'type': subject}))
+        nodes.append((object, {'name': object, 'type': subject}))
+        edges.append((predicate, subject, object))
+
+    node_repository.create_nodes(nodes)
+    edge_repository.create_edges(edges)
 
     file = open("../../data/meta/lbnl_binding.json")
     binding = json.load(file)
-    for key in binding:
-        node_repository.mark_sensors(key, binding[key], "Sensor")
+    node_repository.mark_sensors(binding, "Sensor")
     file.close()
@@ -20,6 +20,7 @@ if __name__ == '__main__':
     edge_repository = LinkRepository()
 
     node_repository.clean_up_db()
+    node_repository.create_indexes()
     node_repository.add_nodes(wn_json["nodes"])
     edge_repository.add_links(wn_json["links"])
 
@@ -17,6 +17,7 @@ class BaseRepository:
         password = os.getenv("NEO4J_PASSWORD")
 
         self.driver = GraphDatabase.driver(url, auth=(user, password))
+        self.batch_size = int(os.getenv("NEO4J_BATCH_SIZE", 1000))
 
     def close(self):
         """
@@ -40,6 +41,28 @@ class BaseRepository:
 
         return result
 
+    def run_batched_query(self, query, rows):
+        """
+        Run a given UNWIND query over the given rows in batches of self.batch_size, each batch in a single transaction
+        :param query: neo4j db query that refers to the batch as $rows, e.g. "UNWIND $rows AS row ..."
+        :param rows: list of query parameters per row
+        :return:
+        """
+        with self.driver.session() as session:
+            for batch_start in range(0, len(rows), self.batch_size):
+                batch = rows[batch_start:batch_start + self.batch_size]
+                session.execute_write(lambda tx: tx.run(query, rows=batch).consume())
+
+    def create_indexes(self):
+        """
+        Create the constraint and the index that are used to look up nodes by name and id during the import. All the
+        imported nodes have the common "Node" label next to their type specific label for this purpose
+        :return:
+        """
+        with self.driver.session() as session:
+            session.run("CREATE CONSTRAINT node_name IF NOT EXISTS FOR (n:Node) REQUIRE n.name IS UNIQUE")
+            session.run("CREATE INDEX node_id IF NOT EXISTS FOR (n:Node) ON (n.id)")
+
     def clean_up_db(self):
         """
         Delete all nodes and edges in the graph db
@@ -7,41 +7,48 @@ from src.repository.BaseRepository import BaseRepository
 class LinkRepository(BaseRepository):
     def add_links(self, links):
         """
-        add links for the water network dataset
+        add links for the water network dataset. Links are created as nodes in batches per link type, and then
+        connected to their start and end nodes in batches
         """
-        with self.driver.session() as session:
-            for link in links:
-                link = linearize(link)
-                link["id"] = link["name"]
-                link["type"] = link["link_type"]
-                link["name"] = link["link_type"] + "_" + link["name"]
-                query = "WITH apoc.convert.fromJsonMap($link) AS document CREATE(p:" + link[
-                    "type"] + ") SET p = document"
-                session.run(query, {
-                    "link": json.dumps(link)
-                })
-
-                if link["start_node_name"] == link["id"] or link["end_node_name"] == link["id"]:
-                    query = "match (n1 {id: $source})\n" \
-                            "match (n2 {id: $destination})\n" \
-                            "MERGE (n1)-[:connectedTo]->(n2)\n"
-                    session.run(query, {
-                        "destination": link["end_node_name"],
-                        "source": link["start_node_name"]
-                    })
-                else:
-                    query = "match (n1 {id: $source})\n" \
-                            "match (n2 {id: $destination})\n" \
-                            "match (l:" + link["type"] + " {id: $pipe_name})\n" \
-                                                         "MERGE (n1)-[:connectedTo]->(l)\n" \
-                                                         "MERGE (l)-[:connectedTo]->(n2)\n"
-                    session.run(query, {
-                        "destination": link["end_node_name"],
-                        "source": link["start_node_name"],
-                        "pipe_name": link["id"]
-                    })
+        links_by_type = {}
+        direct_connections = []
+        link_connections = []
+        for link in links:
+            link = linearize(link)
+            link["id"] = link["name"]
+            link["type"] = link["link_type"]
+            link["name"] = link["link_type"] + "_" + link["name"]
+            links_by_type.setdefault(link["type"], []).append(json.dumps(link))
+
+            connection = {
+                "destination": link["end_node_name"],
+                "source": link["start_node_name"],
+                "link_name": link["name"]
+            }
+            if link["start_node_name"] == link["id"] or link["end_node_name"] == link["id"]:
+                direct_connections.append(connection)
+            else:
+                link_connections.append(connection)
+
+        for link_type in links_by_type:
+            query = "UNWIND $rows AS link\n" \
+                    "WITH apoc.convert.fromJsonMap(link) AS document CREATE(p:Node:" + link_type + ") SET p = document"
+            self.run_batched_query(query, links_by_type[link_type])
 
+        # start and end nodes are looked up among the water network nodes only, as links can have the same id
+        query = "UNWIND $rows AS row\n" \
+                "match (n1:Node {id: row.source}) WHERE n1.node_type IS NOT NULL\n" \
+                "match (n2:Node {id: row.destination}) WHERE n2.node_type IS NOT NULL\n" \
+                "MERGE (n1)-[:connectedTo]->(n2)\n"
+        self.run_batched_query(query, direct_connections)
 
+        query = "UNWIND $rows AS row\n" \
+                "match (n1:Node {id: row.source}) WHERE n1.node_type IS NOT NULL\n" \
+                "match (n2:Node {id: row.destination}) WHERE n2.node_type IS NOT NULL\n" \
+                "match (l:Node {name: row.link_name})\n" \
+                "MERGE (n1)-[:connectedTo]->(l)\n" \
+                "MERGE (l)-[:connectedTo]->(n2)\n"
+        self.run_batched_query(query, link_connections)
 
     def create_edge(self, edge_label, source_node_name, destination_node_name):
         with self.driver.session() as session:
@@ -51,3 +58,20 @@ class LinkRepository(BaseRepository):
                 'source': source_node_name,
                 'destination': destination_node_name
             })
+
+    def create_edges(self, edges):
+        """
+        same as create_edge, for a list of (edge_label, source_node_name, destination_node_name) tuples
+        """
+        edges_by_label = {}
+        for edge_label, source_node_name, destination_node_name in edges:
+            edges_by_label.setdefault(edge_label, []).append({
+                'source': source_node_name,
+                'destination': destination_node_name
+            })
+
+        for edge_label in edges_by_label:
+            query = "UNWIND $rows AS row\n" \
+                    "match (n1:Node {name: row.source}), (n2:Node {name: row.destination})\n" \
+                    "merge (n1)-[r:" + edge_label + "]->(n2)"
+            self.run_batched_query(query, edges_by_label[edge_label])
@@ -7,20 +7,20 @@ from src.repository.BaseRepository import BaseRepository
 class NodeRepository(BaseRepository):
     def add_nodes(self, nodes):
         """
-        add nodes for water network dataset
+        add nodes for water network dataset, nodes of the same type are created in batches
         """
+        nodes_by_type = {}
         for node in nodes:
             node = linearize(node)
             node["id"] = node["name"]
             node["type"] = node["node_type"]
             node["name"] = node["node_type"] + "_" + node["name"]
-            with self.driver.session() as session:
-                query = 'WITH apoc.convert.fromJsonMap($node) AS document CREATE(p:' + node[
-                    'type'] + ') SET p = document'
-                session.run(query, {
-                    "node": json.dumps(node),
-                    "node_type": node["type"]
-                })
+            nodes_by_type.setdefault(node["type"], []).append(json.dumps(node))
+
+        for node_type in nodes_by_type:
+            query = "UNWIND $rows AS node\n" \
+                    "WITH apoc.convert.fromJsonMap(node) AS document CREATE(p:Node:" + node_type + ") SET p = document"
+            self.run_batched_query(query, nodes_by_type[node_type])
 
     def create_node(self, label, properties):
         with self.driver.session() as session:
@@ -29,11 +29,34 @@ class NodeRepository(BaseRepository):
                 'properties': properties
             })
 
-    def mark_sensors(self, node_name, new_name, label):
-        with self.driver.session() as session:
-            query = "match (n {name: $name}) set n.type = $type, n.name = $new_name, n:" + label
-            session.run(query, {
-                'name': node_name,
-                'type': new_name.replace('_', ''),
-                'new_name': 's_' + new_name
-            })
+    def create_nodes(self, nodes):
+        """
+        same as create_node, for a list of (label, properties) pairs. A node is identified by its name, and in case
+        of duplicates the properties of the last pair are used
+        """
+        nodes_by_name = {}
+        for label, properties in nodes:
+            nodes_by_name[properties['name']] = (str(label), properties)
+
+        nodes_by_label = {}
+        for label, properties in nodes_by_name.values():
+            nodes_by_label.setdefault(label, []).append(properties)
+
+        for label in nodes_by_label:
+            query = "UNWIND $rows AS properties\n" \
+                    "MERGE (n:Node {name: properties.name}) SET n = properties, n:" + label
+            self.run_batched_query(query, nodes_by_label[label])
+
+    def mark_sensors(self, sensors, label):
+        """
+        mark the given nodes as sensors
+        :param sensors: dictionary of node names to new sensor names
+        :param label: label to add to the sensor nodes, e.g. Sensor
+        """
+        query = "UNWIND $rows AS row\n" \
+                "match (n:Node {name: row.name}) set n.type = row.type, n.name = row.new_name, n:" + label
+        self.run_batched_query(query, [{
+            'name': node_name,
+            'type': new_name.replace('_', ''),
+            'new_name': 's_' + new_name
+        } for node_name, new_name in sensors.items()])
@@ -1,12 +1,15 @@
-import random
+import os
 import time
 import numpy as np
 import torch
 
 from itertools import chain, combinations
 from torch import nn
-from src.algorithm.our_ae_based_arm.autoencoder import AutoEncoder
+from torch.utils.data import DataLoader
+from src.algorithm.aerial.autoencoder import AutoEncoder
 from src.preprocessing.semantic_enrichment import *
+from src.util.discretization_util import Discretizer
+from src.util.transactions_util import calculate_discrete_boundaries
 from src.util.rule_quality import *
 
 
@@ -15,140 +18,217 @@ class Aerial:
     Implementation of our Autoencoder-based (AE-based) ARM method as part of our proposed pipeline
     """
 
-    def __init__(self, num_bins=10, num_neighbors=1, max_antecedents=2, similarity_threshold=0.8, noise_factor=0.5):
+    def __init__(self, num_bins=10, num_neighbors=1, max_antecedents=2, similarity_threshold=0.8, noise_factor=0.5,
+                 epochs=2, batch_size=64, sparse=False, fine_tune_epochs=1, drift_threshold=0.05):
         """
         @param num_bins: number of bins to discretize numerical data into
         @param num_neighbors: number of neighbors to consider when enriching time series data with semantics
         @param noise_factor: amount of noise introduced for the one-hot encoded input of denoising Autoencoder
         @param similarity_threshold: feature similarity threshold
         @param max_antecedents: maximum number of antecedents that the learned rules will have
+        @param epochs: number of training epochs of the Autoencoder
+        @param batch_size: number of input vectors per training step of the Autoencoder
+        @param sparse: store the one-hot encoded input vectors as the indices of their active class values, and pass
+        noise-free inputs (e.g. the test vectors) through the Autoencoder in the sparse form
+        @param fine_tune_epochs: number of training epochs on the new transactions, when a checkpoint is fine-tuned
+        @param drift_threshold: minimum total variation distance between the class value distributions of a feature
+        in the new and in the already trained transactions, for the rules of the feature to be regenerated
         """
         self.training_time = 0
+        self.training_throughput = 0
+        self.epochs = epochs
+        self.batch_size = batch_size
         self.noise_factor = noise_factor
         self.num_bins = num_bins
         self.num_neighbors = num_neighbors
         self.similarity_threshold = similarity_threshold
         self.max_antecedents = max_antecedents
+        self.sparse = sparse
+        self.fine_tune_epochs = fine_tune_epochs
+        self.drift_threshold = drift_threshold
 
         self.model = None
         self.input_vectors = None
+        self.vocabulary = None
+        self.timestamps = []
+        self.discretizer = None
+        # incremental training state, see train
+        self.checkpoint = None
+        self.checkpoint_path = None
+        self.affected_features = None
+        self.rule_cache = {}
         self.softmax = nn.Softmax(dim=0)
 
-    def create_input_vectors(self, knowledge_graph, transactions):
+    def create_input_vectors(self, knowledge_graph, transactions, discretizer=None, neighborhood_index=None,
+                             sensor_nodes=None, node_encoder=None):
         """
         semantically enrich the given transactions using the knowledge graph, and apply one-hot encoding
         @param knowledge_graph: knowledge graph
-        @param transactions: discrete sensor measurements in the form of transactions
+        @param transactions: discrete sensor measurements in the form of SensorTransactions
+        @param discretizer: Discretizer with already fitted boundaries per sensor type, calculated if not given
+        @param neighborhood_index: NeighborhoodIndex of the knowledge graph, built if not given
+        @param sensor_nodes: SensorNodeTable of the sensors in the transactions, built if not given
+        @param node_encoder: NodeFeatureEncoder of the knowledge graph attributes, built if not given
         """
+        self.vocabulary = transactions.vocabulary
+        self.timestamps = transactions.timestamps
+        if discretizer is None:
+            discretizer = calculate_discrete_boundaries(transactions, self.num_bins)
+        # the boundaries are stored in the checkpoint, to bin the new transactions in the same way when fine-tuning
+        self.discretizer = discretizer
         # get input vectors in the form of one-hot encoded vectors
         self.input_vectors = semantic_enrichment_our_ae_based_arm(knowledge_graph, transactions, self.num_bins,
-                                                                  self.num_neighbors)
+                                                                  self.num_neighbors, discretizer, self.sparse,
+                                                                  neighborhood_index, sensor_nodes, node_encoder)
 
-    def generate_rules(self):
+    def generate_rules(self, batch_size=4096):
         """
         Extract association rules from the Autoencoder
+        @param batch_size: number of test vectors that are passed through the Autoencoder in a single forward run
         """
         association_rules = []
+        category_indices = self.input_vectors['category_indices'][0]
         input_vector_size = len(self.input_vectors['vector_tracker_list'][0])
 
         start = time.time()
+        # a vector with equal probabilities per feature class values for all the features, marked features are
+        # reset per feature combination below
+        equal_probabilities = self.initialize_input_vector(input_vector_size, category_indices, [])
         # feature combinations to be tested based on the self.max_antecedents parameter
         feature_combinations = list(chain.from_iterable(
-            combinations(self.input_vectors['category_indices'][0], r) for r in range(self.max_antecedents + 1)))
+            combinations(category_indices, r) for r in range(self.max_antecedents + 1)))
+        rule_cache = {}
         for category_list in feature_combinations[1:]:
-            # create a vector with equal probabilities per feature class values
-            unmarked_features = self.initialize_input_vectors(input_vector_size,
-                                                              self.input_vectors["category_indices"][0], category_list)
-            # mark feature class values in category_list in the unmarked_features
-            test_vectors = self.mark_features(unmarked_features, list(category_list))
-            for test_vector in test_vectors:
-                # marked features are the candidate antecedents
-                candidate_antecedents = [index for index, value in enumerate(test_vector) if value == 1]
-                # perform a forward run on the trained Autoencoder
-                implication_probabilities = self.model(torch.FloatTensor(test_vector),
-                                                       self.input_vectors['category_indices'][0]) \
-                    .detach().numpy().tolist()
-                # make sure that the marked features have higher output probability than the similarity threshold
-                high_support = True
-                for ant in candidate_antecedents:
-                    if implication_probabilities[ant] < self.similarity_threshold:
-                        high_support = False
-                        break
-                if not high_support:
-                    continue
-                # go through the output probabilities (implication_probabilities) and check if they have higher
-                # probability then the given similarity threshold, except the candidate antecedents to prevent
-                # self implication
-                consequent_list = []
-                for prob_index in range(len(implication_probabilities)):
-                    if prob_index not in candidate_antecedents:
-                        # store the feature class values with high output probability
-                        if implication_probabilities[prob_index] >= self.similarity_threshold:
-                            consequent_list.append(prob_index)
-                if len(consequent_list) > 0:
-                    # format the rule based indices in consequent_list and candidate_antecedents list
-                    new_rule = self.get_rule(candidate_antecedents, consequent_list)
-                    # form rules one by one making sure each rule has one item in the consequent
-                    # because p -> q ∧ r is equal to p -> q AND p -> r anyways
-                    for consequent in new_rule['consequents']:
-                        # Not used in the AE-based ARM evaluation, but for feature use cases accept only rules with
-                        # dynamic values (sensor measurements) in the consequent part as they are more interesting
-                        # if "_range_" in consequent:
-                        association_rules.append({'antecedents': new_rule['antecedents'], 'consequent': consequent})
+            # the rules of the feature combinations that are not affected by the new transactions are taken from the
+            # checkpoint, when the Autoencoder is fine-tuned incrementally
+            key = tuple((category['start'], category['end']) for category in category_list)
+            if key in self.rule_cache and not self.is_affected(category_list):
+                vector_rules = self.rule_cache[key]
+            else:
+                vector_rules = self.generate_vector_rules(equal_probabilities, category_list, batch_size)
+            rule_cache[key] = vector_rules
+            for candidate_antecedents, consequent_list in vector_rules:
+                # format the rule based indices in consequent_list and candidate_antecedents list
+                new_rule = self.get_rule(candidate_antecedents, consequent_list)
+                # form rules one by one making sure each rule has one item in the consequent
+                # because p -> q ∧ r is equal to p -> q AND p -> r anyways
+                for consequent in new_rule['consequents']:
+                    # Not used in the AE-based ARM evaluation, but for feature use cases accept only rules
+                    # with dynamic values (sensor measurements) in the consequent part as they are more
+                    # interesting
+                    # if "_range_" in consequent:
+                    association_rules.append({'antecedents': new_rule['antecedents'],
+                                              'consequent': consequent})
+        self.rule_cache = rule_cache
+        if self.checkpoint_path is not None:
+            self.save_checkpoint(self.checkpoint_path)
         execution_time = time.time() - start
         return association_rules, execution_time, self.training_time
 
+    def generate_vector_rules(self, equal_probabilities, category_list, batch_size):
+        """
+        Extract the rules of a single feature combination from the Autoencoder
+        @return: list of (candidate antecedent vector indices, consequent vector indices) pairs
+        """
+        vector_rules = []
+        with torch.no_grad():
+            for antecedent_mask, implication_probabilities in self.get_test_batches(equal_probabilities,
+                                                                                    category_list, batch_size):
+                # make sure that the marked features have higher output probability than the similarity threshold
+                high_support = ~(antecedent_mask & (implication_probabilities < self.similarity_threshold)).any(dim=1)
+                # store the feature class values with high output probability, except the candidate antecedents
+                # to prevent self implication
+                consequent_mask = (implication_probabilities >= self.similarity_threshold) & ~antecedent_mask
+                consequent_mask &= high_support.unsqueeze(1)
+                for vector_index in consequent_mask.any(dim=1).nonzero().flatten().tolist():
+                    vector_rules.append((antecedent_mask[vector_index].nonzero().flatten().tolist(),
+                                         consequent_mask[vector_index].nonzero().flatten().tolist()))
+        return vector_rules
+
+    def is_affected(self, category_list):
+        """
+        whether the rules of a feature combination have to be regenerated after incremental training
+        """
+        return self.affected_features is None or \
+            any(category['start'] in self.affected_features for category in category_list)
+
+    def get_test_batches(self, equal_probabilities, features, batch_size):
+        """
+        Pass the test vectors of the given feature combination through the Autoencoder in batches
+        @return: generator of (mask of the candidate antecedents, output probabilities) per batch
+        """
+        if self.sparse:
+            # test vectors are passed as their sparse differences from the vector with equal probabilities
+            base_vector = torch.FloatTensor(equal_probabilities)
+            base_antecedents = np.array(equal_probabilities) == 1
+            test_indices, test_weights, marked_indices = self.create_sparse_test_vectors(features)
+            for batch_start in range(0, len(test_indices), batch_size):
+                batch_marked_indices = marked_indices[batch_start:batch_start + batch_size]
+                # marked features are the candidate antecedents
+                antecedent_mask = np.tile(base_antecedents, (len(batch_marked_indices), 1))
+                antecedent_mask[np.arange(len(batch_marked_indices))[:, None], batch_marked_indices] = True
+                implication_probabilities = self.model.forward_sparse(
+                    torch.from_numpy(test_indices[batch_start:batch_start + batch_size]),
+                    weights=torch.from_numpy(test_weights[batch_start:batch_start + batch_size]),
+                    base_vector=base_vector).double()
+                yield torch.from_numpy(antecedent_mask), implication_probabilities
+        else:
+            # create all test vectors for the feature combination at once, as a matrix
+            test_vectors = self.create_test_vectors(equal_probabilities, features)
+            for batch_start in range(0, len(test_vectors), batch_size):
+                batch = torch.from_numpy(test_vectors[batch_start:batch_start + batch_size])
+                # marked features are the candidate antecedents
+                antecedent_mask = batch == 1
+                # perform a forward run on the trained Autoencoder, the probabilities are compared in double
+                # precision as before
+                yield antecedent_mask, self.model(batch.float()).double()
+
     @staticmethod
-    def initialize_input_vectors(input_vector_size, categories, marked_categories) -> list:
+    def create_sparse_test_vectors(features):
         """
-        initialize an input vector with all equal probabilities
-        @param input_vector_size: input vector size
-        @param categories: list of features and their start and end indices in the input vector
-        @param marked_categories: features to be marked so that we don't initialize them with equal probs
+        Sparse version of create_test_vectors, each test vector is given as a bag of indices and weights that is
+        the difference from the vector with equal probabilities: +1 for the marked class value and -1/(number of
+        class values) for all the class values of each marked feature
+        @return: (indices, weights, marked indices) matrices with a row per test vector, in the same order as
+        create_test_vectors
         """
-        vector_with_unmarked_features = np.zeros(input_vector_size)
-        for category in categories:
-            if category not in marked_categories:
-                # assign equal probabilities
-                vector_with_unmarked_features[category['start']:category['end']] = 1 / (
-                        category['end'] - category['start'])
-        return list(vector_with_unmarked_features)
+        feature_sizes = [feature['end'] - feature['start'] for feature in features]
+        num_test_vectors = int(np.prod(feature_sizes))
+        marked_values = np.unravel_index(np.arange(num_test_vectors), feature_sizes)
+        marked_indices = np.stack([feature['start'] + class_values for feature, class_values in
+                                   zip(features, marked_values)], axis=1)
+        indices = [marked_indices]
+        weights = [np.ones(marked_indices.shape)]
+        for feature, feature_size in zip(features, feature_sizes):
+            indices.append(np.tile(np.arange(feature['start'], feature['end']), (num_test_vectors, 1)))
+            weights.append(np.full((num_test_vectors, feature_size), -1 / feature_size))
+        return np.concatenate(indices, axis=1), np.concatenate(weights, axis=1).astype(np.float32), marked_indices
 
-    def mark_features(self, unmarked_test_vector, features, test_vectors=[]):
+    @staticmethod
+    def create_test_vectors(equal_probabilities, features):
         """
-        Create a list of test vectors by marking the given features in the unmarked test vector
+        Create a matrix of test vectors by marking the given features in the vector with equal probabilities
         Marking is done by assigning the probability of 1 (100%)
-        @param unmarked_test_vector: vector with equal probabilities
+        @param equal_probabilities: vector with equal probabilities per feature class values
         @param features: features to be marked
-        @param test_vectors: existing test vectors
-        """
-        # Features are recursively marked. For instance, if features f1, f2, and f3 will be marked, then first
-        # mark class values of f1 in separate vectors (test_vectors list version one), and then do a recursive call
-        # and mark the features of f2 inside test_vectors and then repeat for f3. If f1, f2, and f3 have 3 possible
-        # class values each, then the end result will contain 3x3x3=27 test vectors.
-        if len(features) == 0:
-            return test_vectors
-        feature = features.pop()
-        new_test_vectors = []
-        for i in range(feature['end'] - feature['start']):
-            if len(test_vectors) > 0:
-                # for each of the existing test vectors, mark
-                for vector in test_vectors:
-                    new_vector = vector.copy()
-                    # mark indices of class values in "feature" in the existing list of test vectors
-                    new_vector[feature['start'] + i] = 1
-                    new_test_vectors.append(new_vector)
-            else:
-                new_vector = unmarked_test_vector.copy()
-                # mark indices of class values in "feature" in the new test vector
-                new_vector[feature['start'] + i] = 1
-                new_test_vectors.append(new_vector)
-        #
-        return self.mark_features(unmarked_test_vector, features, new_test_vectors)
+        """
+        # each row marks one class value per feature. If features f1, f2, and f3 will be marked and have 3 possible
+        # class values each, then the result contains 3x3x3=27 test vectors, where the class values of f1 change
+        # the slowest and the class values of f3 change the fastest
+        feature_sizes = [feature['end'] - feature['start'] for feature in features]
+        num_test_vectors = int(np.prod(feature_sizes))
+        test_vectors = np.tile(np.array(equal_probabilities), (num_test_vectors, 1))
+        marked_values = np.unravel_index(np.arange(num_test_vectors), feature_sizes)
+        rows = np.arange(num_test_vectors)
+        for feature, class_values in zip(features, marked_values):
+            test_vectors[:, feature['start']:feature['end']] = 0
+            test_vectors[rows, feature['start'] + class_values] = 1
+        return test_vectors
 
     def reformat_rules(self, association_rules):
         """
-        convert given association rules from vector format to text
+        convert given association rules from vector format to text, the rules that are the same in text format (e.g.
+        the same rule for sensors with the same attributes) are only kept once
         """
         for rule_index in range(len(association_rules)):
             rule = association_rules[rule_index]
@@ -156,55 +236,38 @@ class Aerial:
             association_rules[rule_index]['antecedents'] = deconstructed_rule['antecedents']
             association_rules[rule_index]['consequent'] = deconstructed_rule['consequent']
             association_rules[rule_index]['consequent_index'] = deconstructed_rule['consequent_index']
-        return association_rules
+        return RuleIndex(association_rules).rules
 
     def calculate_stats(self, rules, transactions):
         """
         calculate rule quality stats for the given set of rules based on the input transactions
         """
-        dataset_coverage = np.zeros(len(transactions))
-        for rule_index in range(len(rules)):
-            rule = rules[rule_index]
-            antecedents_occurrence_count = 0
-            consequents_occurrence_count = 0
-            co_occurrence_count = 0
-            only_antecedence_occurrence_count = 0
-            only_consequence_occurrence_count = 0
-            no_ant_no_cons_count = 0
-            for index in range(len(self.input_vectors['vector_list'])):
-                encoded_transaction = self.input_vectors['vector_list'][index]
-                antecedent_match = True
-                for antecedent in rule['antecedents']:
-                    if encoded_transaction[self.input_vectors['vector_tracker_list'][index].index(antecedent)] == 0:
-                        antecedent_match = False
-                        break
-                if antecedent_match:
-                    dataset_coverage[index] = 1
-                    antecedents_occurrence_count += 1
-                if encoded_transaction[self.input_vectors['vector_tracker_list'][index].
-                        index(rule['consequent'])] == 1:
-                    consequents_occurrence_count += 1
-                    if antecedent_match:
-                        co_occurrence_count += 1
-                    else:
-                        only_consequence_occurrence_count += 1
-                elif antecedent_match:
-                    only_antecedence_occurrence_count += 1
-                else:
-                    no_ant_no_cons_count += 1
-
-            num_transactions = len(transactions)
-            support_body = antecedents_occurrence_count / num_transactions
-
-            rule['support'] = co_occurrence_count / num_transactions
-            rule['confidence'] = rule['support'] / support_body if support_body != 0 else 0
-            rule['coverage'] = antecedents_occurrence_count / num_transactions
-            rule["zhangs_metric"] = calculate_zhangs_metric(rule["support"],
-                                                            (antecedents_occurrence_count / num_transactions),
-                                                            (consequents_occurrence_count / num_transactions))
+        # all the input vectors share the same layout, therefore the item indices are taken from the first one
+        item_indices = {item: index for index, item in enumerate(self.input_vectors['vector_tracker_list'][0])}
+        item_matrix = self.get_item_matrix()
+        rule_stats, dataset_coverage = calculate_rule_stats(
+            item_matrix, [[item_indices[antecedent] for antecedent in rule['antecedents']] for rule in rules],
+            [item_indices[rule['consequent']] for rule in rules])
+        for rule, stats in zip(rules, rule_stats):
+            rule['support'] = stats['support']
+            rule['confidence'] = stats['confidence']
+            rule['coverage'] = stats['coverage']
+            rule['zhangs_metric'] = stats['zhangs_metric']
 
         return rules, dataset_coverage.sum() / len(transactions)
 
+    def get_item_matrix(self):
+        """
+        get the item x transaction bool matrix of the input vectors, where items are the vector indices
+        """
+        if not self.sparse:
+            return np.asarray(self.input_vectors['vector_list']).T == 1
+        active_indices = self.input_vectors['active_indices']
+        item_matrix = np.zeros((len(self.input_vectors['vector_tracker_list'][0]), len(active_indices)), dtype=bool)
+        for transaction_index, indices in enumerate(active_indices):
+            item_matrix[indices, transaction_index] = True
+        return item_matrix
+
     @staticmethod
     def initialize_input_vector(input_vector_size, categories, exceptions) -> list:
         """
@@ -218,7 +281,7 @@ class Aerial:
 
     def get_rule(self, antecedents, consequents):
         """
-        find the string form of a given rule in vector form
+        find the item (vector index) ids of a given rule in vector form
         @param antecedents: antecedents of th rule
         @param consequents: consequents of the rule
         """
@@ -231,98 +294,271 @@ class Aerial:
 
         return rule
 
-    @staticmethod
-    def get_deconstructed_rule(antecedents, consequent):
+    def get_deconstructed_rule(self, antecedents, consequent):
         """
-        convert rules in string form in the vector form back into string form
+        convert rules in the form of vector index ids back into readable form, using the vocabulary
         """
         rule = {'antecedents': [], 'consequent': None}
+        # each vector index is a ('column', position, item id) item, where position refers to the position of the
+        # sensor in the transaction (an item refers to a sensor measurement together with associated semantics)
+        # or to a (sensor position, degree, neighbor index) triple for the neighbors of the sensor's node
         groups = {}
-        unique_item_list = []
-        item_index = -1
         for antecedent in antecedents:
-            # item indices (items refers a sensor measurement together with associated semantics) are marked with
-            # "_item_" string
-            split_antecedent = antecedent.split('_item_')
-            if split_antecedent[1] not in unique_item_list:
-                unique_item_list.append(split_antecedent[1])
-                item_index += 1
-                groups[str(item_index)] = []
-            groups[str(item_index)].append(split_antecedent[0])
-
-        for key in groups:
-            antecedent = {}
-            for sub_item in groups[key]:
-                if sub_item.startswith('sensor'):
-                    # measurement aspect (e.g. water pressure, water flow rate) is stored in measurement_aspect
-                    # property, while its range is stored in "measurement_range" property, which are marked in the
-                    # vector_tracker_list with "_type_" and "_end_" keys.
-                    antecedent['measurement_aspect'] = sub_item.split('_type_')[1].split('_end_')[0]
-                    antecedent['measurement_range'] = sub_item.split('_range_')[1].split('_end_')[0]
-                else:
-                    split_item = sub_item.split('_')
-                    antecedent[split_item[0]] = '_'.join(split_item[1:])
+            _, position, item_id = self.vocabulary.decode(antecedent)
+            groups.setdefault(position, []).append(item_id)
 
-            rule['antecedents'].append(antecedent)
+        for position in groups:
+            rule['antecedents'].append(self.get_readable_item(groups[position], position))
 
-        split_consequent = consequent.split('_item_')
-        if split_consequent[1] in groups:
-            postfix = int(split_consequent[1])
-        else:
-            postfix = item_index + 1
-
-        formatted_consequent = {}
-        if consequent.startswith('sensor'):
-            formatted_consequent['measurement_aspect'] = consequent.split('_type_')[1].split('_end_')[0]
-            formatted_consequent['measurement_range'] = consequent.split('_range_')[1].split('_end_')[0]
-        else:
-            split_item = split_consequent[0].split("_")
-            formatted_consequent[split_item[0]] = '_'.join(split_item[1:])
+        _, consequent_position, consequent_item_id = self.vocabulary.decode(consequent)
+        positions = list(groups.keys())
+        postfix = positions.index(consequent_position) if consequent_position in groups else len(positions)
 
         # if the items in the consequent corresponds to one of the antecedents, then mark this with consequent_index
         # e.g. if a.feature1 & b.feature1 --> a.feature2, then antecedents = [a.feature1, b.feature1]
         # and consequent_index = 1
         rule['consequent_index'] = postfix
-        rule['consequent'] = formatted_consequent
+        rule['consequent'] = self.get_readable_item([consequent_item_id], consequent_position)
 
         return rule
 
-    def train(self, model):
+    def get_readable_item(self, item_ids, position=None):
+        """
+        decode the given measurement range and knowledge graph attribute item ids into a single dictionary
+        @param position: position of the items in the vectors, the degree of the neighbor is added for neighbor items
+        """
+        readable_item = {}
+        if isinstance(position, tuple):
+            readable_item['neighbor_degree'] = position[1] + 1
+        for item_id in item_ids:
+            item = self.vocabulary.decode(item_id)
+            if item[0] == 'range':
+                # measurement aspect (e.g. water pressure, water flow rate) is stored in measurement_aspect
+                # property, while its range is stored in "measurement_range" property
+                readable_item['measurement_aspect'] = item[1]
+                readable_item['measurement_range'] = item[2]
+            else:
+                readable_item[item[1]] = item[2]
+        return readable_item
+
+    def train(self, model, incremental=False, registry=None):
         """
         train the autoencoder
+        @param model: name (path prefix) of the stored model
+        @param incremental: warm start from the checkpoint of the model, if its input layout is the same, and fine-tune
+        it only on the transactions that are newer than the ones it is trained on. The checkpoint is updated after
+        the rules are generated, together with the rules per feature combination
+        @param registry: ModelRegistry to reuse a model from, if one is trained with the same feature schema,
+        parameters and data, and to store the newly trained model in. Not used when training incrementally
         """
-        self.model = AutoEncoder(max(len(x) for x in self.input_vectors['vector_list']))
+        self.model = AutoEncoder(len(self.input_vectors['vector_tracker_list'][0]),
+                                 self.input_vectors['category_indices'][0])
+        if not incremental:
+            if registry is None:
+                self.train_ae_model(epochs=self.epochs, batch_size=self.batch_size)
+                return
+            layout = self.get_layout()
+            key = registry.get_key({'layout': layout, 'category_indices': self.input_vectors['category_indices'][0]},
+                                   self.get_training_parameters(), self.get_fingerprint(registry))
+            artifact = registry.load(model, key, layout)
+            if artifact is not None:
+                self.model.load_state_dict(artifact['model'])
+                # the training time of the stored model is reported, as the model is not trained in this run
+                self.training_time = artifact['metadata']['training_time']
+                print("Loaded the Autoencoder from the model registry, trained on",
+                      artifact['metadata']['created'], "in", round(self.training_time, 2), "seconds")
+                return
+            self.train_ae_model(epochs=self.epochs, batch_size=self.batch_size)
+            registry.save(model, key, self.model.state_dict(), layout,
+                          {'parameters': self.get_training_parameters(),
+                           'num_transactions': self.get_num_transactions(), 'training_time': self.training_time})
+            return
+
+        self.checkpoint_path = model
+        self.checkpoint = self.load_checkpoint(model)
+        if self.checkpoint is None:
+            self.train_ae_model(epochs=self.epochs, batch_size=self.batch_size)
+            return
+
+        self.model.load_state_dict(self.checkpoint['model'])
+        last_timestamp = self.checkpoint['last_timestamp']
+        new_rows = [row for row in range(self.get_num_transactions()) if
+                    last_timestamp is None or row >= len(self.timestamps) or self.timestamps[row] > last_timestamp]
+        self.affected_features = self.get_affected_features(new_rows)
+        if self.checkpoint['rule_parameters'] == self.get_rule_parameters():
+            self.rule_cache = self.checkpoint['rules']
+        self.training_time = 0
+        if len(new_rows) > 0:
+            self.train_ae_model(epochs=self.fine_tune_epochs, batch_size=self.batch_size, rows=new_rows)
+        print("Fine-tuned the Autoencoder on", len(new_rows), "new transactions,", len(self.affected_features),
+              "affected features")
+
+    def get_num_transactions(self):
+        if self.sparse:
+            return len(self.input_vectors['active_indices'])
+        return len(self.input_vectors['vector_list'])
 
-        if not self.model.load(model):
-            self.train_ae_model()
-            # self.model.save(model)
+    def get_layout(self):
+        """
+        get the layout of the input vectors independent of the item ids of the vocabulary, as (position, item) pairs
+        """
+        layout = []
+        for vector_index in self.input_vectors['vector_tracker_list'][0]:
+            _, position, item_id = self.vocabulary.decode(vector_index)
+            layout.append((position, self.vocabulary.decode(item_id)))
+        return layout
+
+    def get_training_parameters(self):
+        return {'num_bins': self.num_bins, 'num_neighbors': self.num_neighbors, 'noise_factor': self.noise_factor,
+                'epochs': self.epochs, 'batch_size': self.batch_size, 'sparse': self.sparse}
+
+    def get_fingerprint(self, registry):
+        """
+        fingerprint of the input vectors that the Autoencoder is trained on
+        """
+        if self.sparse:
+            active_indices = self.input_vectors['active_indices']
+            lengths = np.array([len(indices) for indices in active_indices], dtype=np.int64)
+            return registry.get_fingerprint([lengths, np.concatenate(
+                [np.asarray(indices, dtype=np.int64) for indices in active_indices] + [np.zeros(0, dtype=np.int64)])])
+        return registry.get_fingerprint([np.asarray(self.input_vectors['vector_list'], dtype=float)])
+
+    def get_rule_parameters(self):
+        return {'max_antecedents': self.max_antecedents, 'similarity_threshold': self.similarity_threshold}
+
+    def get_value_counts(self, rows):
+        """
+        count the transactions that each class value is active in, among the given transactions
+        """
+        if self.sparse:
+            active_indices = [self.input_vectors['active_indices'][row] for row in rows]
+            return np.bincount(np.concatenate(active_indices + [np.zeros(0, dtype=np.int64)]),
+                               minlength=len(self.input_vectors['vector_tracker_list'][0]))
+        return (np.asarray(self.input_vectors['vector_list'])[rows] == 1).sum(axis=0)
 
-    def train_ae_model(self, loss_function=torch.nn.BCELoss(), lr=5e-3, epochs=2):
+    def get_affected_features(self, new_rows):
+        """
+        find the features whose class value distribution in the new transactions differs from the distribution in
+        the transactions that the checkpoint is trained on by more than the drift threshold (total variation distance)
+        @return: set of the start indices of the affected features
+        """
+        new_counts = self.get_value_counts(new_rows)
+        old_counts = self.checkpoint['value_counts']
+        affected_features = set()
+        if len(new_rows) == 0:
+            return affected_features
+        for category in self.input_vectors['category_indices'][0]:
+            new_frequencies = new_counts[category['start']:category['end']] / len(new_rows)
+            old_frequencies = old_counts[category['start']:category['end']] / max(self.checkpoint['num_transactions'],
+                                                                                  1)
+            if 0.5 * np.abs(new_frequencies - old_frequencies).sum() > self.drift_threshold:
+                affected_features.add(category['start'])
+        return affected_features
+
+    def load_discretizer(self, model, transactions):
+        """
+        load the discretizer that the checkpoint of the given model is trained with. The measurement range items of
+        the input layout are labeled by their boundaries, and the boundaries that are fitted again on a longer history
+        differ, therefore the new transactions have to be binned with the same boundaries to fine-tune the checkpoint
+        @param transactions: SensorTransactions to bin with the discretizer
+        @return: the Discretizer, or None if the checkpoint doesn't exist or doesn't cover all the sensor types of
+        the transactions with the same number of bins
+        """
+        path = model + '_discretizer.json'
+        if not os.path.isfile(path) or not os.path.isfile(model + '_checkpoint.pt'):
+            return None
+        discretizer = Discretizer.load(path)
+        if discretizer.num_bins != self.num_bins or \
+                any(sensor_type not in discretizer for sensor_type in transactions.get_sensor_type_names()):
+            return None
+        return discretizer
+
+    def load_checkpoint(self, model):
+        """
+        load the checkpoint of the given model, if it exists and it has the same input layout
+        """
+        path = model + '_checkpoint.pt'
+        if not os.path.isfile(path):
+            return None
+        checkpoint = torch.load(path, weights_only=False)
+        if checkpoint['layout'] != self.get_layout() or \
+                checkpoint['category_indices'] != self.input_vectors['category_indices'][0]:
+            print("The input layout of the checkpoint", path, "is different, training from scratch")
+            return None
+        return checkpoint
+
+    def save_checkpoint(self, model):
+        """
+        save the model weights, together with the state that is needed to fine-tune it on new transactions later:
+        input layout, discretizer, timestamp of the last trained transaction, class value counts and the rules per
+        feature combination
         """
-        train the encoder on the semantically enriched transaction dataset
+        value_counts = self.get_value_counts(range(self.get_num_transactions()))
+        num_transactions = self.get_num_transactions()
+        last_timestamp = max(self.timestamps) if len(self.timestamps) > 0 else None
+        if self.checkpoint is not None:
+            # the value counts of the already trained transactions are kept, and the new ones are added
+            new_rows = [row for row in range(num_transactions) if self.checkpoint['last_timestamp'] is None or
+                        row >= len(self.timestamps) or self.timestamps[row] > self.checkpoint['last_timestamp']]
+            value_counts = self.checkpoint['value_counts'] + self.get_value_counts(new_rows)
+            num_transactions = self.checkpoint['num_transactions'] + len(new_rows)
+            if self.checkpoint['last_timestamp'] is not None and last_timestamp is not None:
+                last_timestamp = max(last_timestamp, self.checkpoint['last_timestamp'])
+        self.discretizer.save(model + '_discretizer.json')
+        torch.save({'model': self.model.state_dict(), 'layout': self.get_layout(),
+                    'category_indices': self.input_vectors['category_indices'][0], 'last_timestamp': last_timestamp,
+                    'value_counts': value_counts, 'num_transactions': num_transactions,
+                    'rule_parameters': self.get_rule_parameters(), 'rules': self.rule_cache},
+                   model + '_checkpoint.pt')
+
+    def train_ae_model(self, loss_function=torch.nn.BCELoss(), lr=5e-3, epochs=2, batch_size=1, rows=None):
+        """
+        train the encoder on the semantically enriched transaction dataset, in mini-batches
+        @param rows: indices of the transactions to train on, all the transactions if not given
         """
         optimizer = torch.optim.Adam(self.model.parameters(), lr=lr, weight_decay=2e-8)
-        vectors = self.input_vectors['vector_list']
-        random.shuffle(vectors)
+        if rows is None:
+            rows = range(self.get_num_transactions())
+        if self.sparse:
+            # only the mini-batches are materialized as dense vectors (the reconstruction targets)
+            vectors = [torch.from_numpy(self.input_vectors['active_indices'][row]) for row in rows]
+            data_loader = DataLoader(vectors, batch_size=batch_size, shuffle=True, collate_fn=self.collate_sparse)
+        else:
+            vectors = torch.FloatTensor(np.asarray(self.input_vectors['vector_list'])[list(rows)])
+            data_loader = DataLoader(vectors, batch_size=batch_size, shuffle=True)
 
         training_start_time = time.time()
         for epoch in range(epochs):
-            for index in range(len(vectors)):
-                print("Training progress:", (index + 1 + (epoch * len(vectors))), "/", (len(vectors) * epochs),
-                      end="\r")
-                cat_vector = torch.FloatTensor(vectors[index])
-                noisy_cat_vector = (cat_vector + torch.normal(0, self.noise_factor, cat_vector.shape)).clip(0, 1)
-
-                reconstructed = self.model(noisy_cat_vector, self.input_vectors['category_indices'][index])
-                loss = loss_function(reconstructed, cat_vector)
-                # partial_losses = []
-                # for category_range in self.input_vectors['category_indices'][index]:
-                #     start = category_range['start']
-                #     end = category_range['end']
-                #     partial_losses.append(loss_function(reconstructed[start:end], cat_vector[start:end]))
-
-                # loss = sum(partial_losses)
+            epoch_start_time = time.time()
+            for batch in data_loader:
+                if self.sparse:
+                    indices, offsets, cat_vectors = batch
+                else:
+                    cat_vectors = batch
+                if self.sparse and self.noise_factor == 0:
+                    reconstructed = self.model.forward_sparse(indices, offsets)
+                else:
+                    # the gaussian noise makes the input dense
+                    noisy_cat_vectors = (cat_vectors + torch.normal(0, self.noise_factor, cat_vectors.shape)) \
+                        .clip(0, 1)
+                    reconstructed = self.model(noisy_cat_vectors)
+                loss = loss_function(reconstructed, cat_vectors)
                 optimizer.zero_grad()
                 loss.backward()
                 optimizer.step()
+            print("Training epoch", (epoch + 1), "/", epochs, "-",
+                  round(len(vectors) / (time.time() - epoch_start_time), 2), "samples/sec")
         self.training_time = time.time() - training_start_time
+        self.training_throughput = (len(vectors) * epochs) / self.training_time if self.training_time > 0 else 0
+
+    def collate_sparse(self, bags):
+        """
+        combine the active indices of the input vectors in a mini-batch into EmbeddingBag style (indices, offsets),
+        together with the dense input vectors
+        """
+        lengths = torch.tensor([len(bag) for bag in bags])
+        indices = torch.cat(bags)
+        offsets = torch.cumsum(lengths, 0) - lengths
+        cat_vectors = torch.zeros(len(bags), len(self.input_vectors['vector_tracker_list'][0]))
+        cat_vectors[torch.repeat_interleave(torch.arange(len(bags)), lengths), indices] = 1
+        return indices, offsets, cat_vectors
@@ -1,6 +1,34 @@
 import torch
 import os
 from torch import nn
+from torch.nn import functional
+
+
+class SparseInputLinear(nn.Module):
+    """
+    A Linear layer that also accepts sparse input in the form of bags of indices, like an EmbeddingBag. The weight
+    is stored as in_features x out_features (the transpose of nn.Linear), so that the rows of the weight for the
+    non-zero input values can be gathered and summed directly
+    """
+
+    def __init__(self, in_features, out_features):
+        super().__init__()
+        self.weight = nn.Parameter(torch.empty(in_features, out_features))
+        self.bias = nn.Parameter(torch.zeros(out_features))
+
+    def forward(self, x):
+        return torch.matmul(x, self.weight) + self.bias
+
+    def forward_sparse(self, indices, offsets=None, weights=None):
+        """
+        same as forward without the bias, for sparse input vectors, each given as a bag of the indices of its non-zero
+        values. The cost depends on the number of non-zero values instead of the number of input features
+        :param indices: 1D tensor of the indices of all the bags together with offsets, or a 2D tensor of equally sized
+        bags (one bag per row)
+        :param offsets: start of each bag in a 1D indices tensor
+        :param weights: values at the indices (per_sample_weights of the EmbeddingBag), 1 if not given
+        """
+        return functional.embedding_bag(indices, self.weight, offsets, mode='sum', per_sample_weights=weights)
 
 
 class AutoEncoder(nn.Module):
@@ -8,14 +36,16 @@ class AutoEncoder(nn.Module):
     An Autoencoder model for our AE-based ARM approach
     """
 
-    def __init__(self, data_size):
+    def __init__(self, data_size, category_indices):
         """
         :param data_size: number of features after one-hot encoding in the input data
+        :param category_indices: start and end indices of the class values of each feature (category) in the input
         """
         super().__init__()
         self.data_size = data_size
+        # the first layer accepts both dense and sparse input vectors
         self.encoder = nn.Sequential(
-            nn.Linear(self.data_size, int(1 * self.data_size / 8)),
+            SparseInputLinear(self.data_size, int(1 * self.data_size / 8)),
             nn.Tanh(),
             nn.Linear(int(1 * self.data_size / 8), int(1 * self.data_size / 32)),
             nn.Tanh(),
@@ -31,16 +61,22 @@ class AutoEncoder(nn.Module):
 
         self.encoder.apply(self.init_weights)
         self.decoder.apply(self.init_weights)
-        self.softmax = nn.Softmax(dim=0)
         self.batch_norm = nn.BatchNorm1d(self.data_size)
 
+        # index of the category that each of the class values belong to, used to apply softmax per category in one go
+        category_index = torch.zeros(self.data_size, dtype=torch.long)
+        for index, category_range in enumerate(category_indices):
+            category_index[category_range['start']:category_range['end']] = index
+        self.num_categories = len(category_indices)
+        self.register_buffer('category_index', category_index)
+
     @staticmethod
     def init_weights(m):
         """
         all weights are initialized with values sampled from uniform distributions with the Xavier initialization
         and the biases are set to 0, as described in the paper by Delong et al. (2023)
         """
-        if isinstance(m, nn.Linear):
+        if isinstance(m, (nn.Linear, SparseInputLinear)):
             torch.nn.init.xavier_uniform_(m.weight)
             m.bias.data.zero_()
 
@@ -64,14 +100,33 @@ class AutoEncoder(nn.Module):
         else:
             return False
 
-    def forward(self, x, input_vector_category_indices):
+    def segmented_softmax(self, y):
+        """
+        apply softmax to class values of each feature (category) individually, for all the categories at once
+        the last dimension holds the features so that both single vectors and batches of vectors can be given
+        """
+        index = self.category_index.expand_as(y)
+        segments_shape = y.shape[:-1] + (self.num_categories,)
+        # subtract the maximum of each category for numerical stability
+        maximum = torch.full(segments_shape, -torch.inf, dtype=y.dtype, device=y.device) \
+            .scatter_reduce(-1, index, y.detach(), reduce='amax')
+        exponentials = torch.exp(y - maximum.gather(-1, index))
+        sums = torch.zeros(segments_shape, dtype=y.dtype, device=y.device).scatter_add(-1, index, exponentials)
+        return exponentials / sums.gather(-1, index)
+
+    def forward(self, x):
         y = self.encoder(x)
         y = self.decoder(y)
+        return self.segmented_softmax(y)
 
-        # apply softmax to class values of each feature (category) individually
-        for category_index in range(len(input_vector_category_indices)):
-            category_range = input_vector_category_indices[category_index]
-            y[category_range['start']:category_range['end']] = \
-                self.softmax(y[category_range['start']:category_range['end']])
-
-        return y
+    def forward_sparse(self, indices, offsets=None, weights=None, base_vector=None):
+        """
+        same as forward, for sparse input vectors given as bags of indices (see SparseInputLinear.forward_sparse)
+        :param base_vector: optional dense vector that is added to all the input vectors, so that inputs that differ
+        from a common dense vector in a few values only can be given as sparse differences
+        """
+        y = self.encoder[0].forward_sparse(indices, offsets, weights)
+        y = y + (self.encoder[0](base_vector) if base_vector is not None else self.encoder[0].bias)
+        y = self.encoder[1:](y)
+        y = self.decoder(y)
+        return self.segmented_softmax(y)
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import time
+import torch
+
+
+class ModelRegistry:
+    """
+    Registry of the trained Autoencoder models. Each model is stored as a single artifact that holds the weights, the
+    feature vocabulary (input layout) and the training metadata, under a key that is the hash of the feature schema,
+    the preprocessing (and training) parameters and a fingerprint of the training data. A model is therefore only
+    reused when all of them are unchanged, and a changed configuration is trained again instead of loading stale
+    weights
+    """
+
+    def __init__(self, directory="models"):
+        """
+        @param directory: directory that the model artifacts are stored in
+        """
+        self.directory = directory
+
+    @staticmethod
+    def get_key(schema, parameters, fingerprint):
+        """
+        calculate the registry key of a model
+        @param schema: feature schema (JSON serializable), e.g. the feature vocabulary and the feature ranges
+        @param parameters: dictionary of the preprocessing and training parameters
+        @param fingerprint: fingerprint of the training data, see get_fingerprint
+        """
+        content = json.dumps({'schema': schema, 'parameters': parameters, 'fingerprint': fingerprint},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @staticmethod
+    def get_fingerprint(arrays):
+        """
+        calculate a fingerprint of the training data
+        @param arrays: numpy arrays that the training data consists of
+        """
+        digest = hashlib.sha256()
+        for array in arrays:
+            digest.update(str((array.dtype, array.shape)).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def get_path(self, name, key):
+        return os.path.join(self.directory, name + "_" + key[:16] + ".pt")
+
+    def load(self, name, key, vocabulary):
+        """
+        load the artifact of the model with the given key, if it exists and it is trained on the same feature
+        vocabulary
+        @param name: name of the model, e.g. the name of the dataset
+        @return: the artifact dictionary with the 'model' (state dict), 'vocabulary' and 'metadata' keys, or None
+        """
+        path = self.get_path(name, key)
+        if not os.path.isfile(path):
+            return None
+        artifact = torch.load(path, weights_only=False)
+        if artifact['key'] != key or artifact['vocabulary'] != vocabulary:
+            return None
+        return artifact
+
+    def save(self, name, key, state_dict, vocabulary, metadata):
+        """
+        store the weights, the feature vocabulary and the training metadata of a model as a single artifact
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        metadata = dict(metadata, created=time.strftime("%Y-%m-%dT%H:%M:%S"), torch_version=torch.__version__)
+        path = self.get_path(name, key)
+        # write to a temporary file first, so that a partially written artifact is never loaded
+        torch.save({'key': key, 'model': state_dict, 'vocabulary': vocabulary, 'metadata': metadata},
+                   path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return path
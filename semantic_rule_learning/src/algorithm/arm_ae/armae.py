@@ -10,8 +10,8 @@ from src.algorithm.arm_ae.autoencoder import AutoEncoder
 from src.util.rule_quality import *
 from src.preprocessing.base_preprocessing import *
 
-import copy
 import time
+from itertools import combinations
 
 
 class ARMAE:
@@ -38,6 +38,9 @@ class ARMAE:
         self.optimizer = torch.optim.Adam(
             self.model.parameters(), lr=self.learningRate)
         self.dataset_coverage = []
+        self.itemMatrixData = None
+        self.itemMatrix = None
+        self.packedItems = None
 
         self.results = []
 
@@ -49,6 +52,14 @@ class ARMAE:
         torch.nan_to_num(x, nan=0.0, posinf=0.0)
         return dataLoader
 
+    def getItemMatrix(self, data):
+        # item x transaction bool matrix of the data and its packed bitsets, cached for repeated measure computations
+        if self.itemMatrixData is not data:
+            self.itemMatrixData = data
+            self.itemMatrix = data.values.T.astype(bool)
+            self.packedItems = pack_item_matrix(self.itemMatrix)
+        return self.itemMatrix
+
     def save(self, p):
         self.model.save(p)
 
@@ -71,100 +82,92 @@ class ARMAE:
 
         self.arm_ae_training_time = time.time() - armae_training_start
 
-    def computeMeasures(self, antecedent, consequent, data):
+    def computeMeasures(self, stats):
         # individual rule coverage of ARM-AE is not considered in the evaluation
         # instead, only the total data coverage of the final rules will be calculated
         measures = {"support": 0, "confidence": 0, "zhangs_metric": 0, "coverage": 0}
-        self.dataset_coverage[antecedent] = 1
 
         if 'support' in self.IM:
-            rules = copy.deepcopy(antecedent)
-            rules.append(consequent)
-            PAC = data[data.columns[rules]]
-            PAC = np.sum(PAC, axis=1)
-            PAC = PAC == len(rules)
-            PAC = np.sum(PAC)
-            PAC = PAC / len(data)
-            support = round(PAC, 2)
-            measures["support"] = support
+            measures["support"] = round(stats['support'], 2)
         if 'confidence' in self.IM:
-            PA = data[data.columns[antecedent]]
-            PA = np.sum(PA, axis=1)
-            PA = PA == len(antecedent)
-            PA = np.sum(PA)
-            PA = PA / len(data)
-            if PA != 0:
-                conf = PAC / PA
-            else:
-                conf = 0
-            confidence = round(conf, 2)
-            measures["confidence"] = confidence
+            measures["confidence"] = round(stats['confidence'], 2)
         # the zhang's metric calculation is added to ARM-AE later on by us
         if 'zhangs_metric' in self.IM:
-            PA = data[data.columns[antecedent]]
-            PA = np.sum(PA, axis=1)
-            PA = PA == len(antecedent)
-            PA = np.sum(PA)
-            PC = data[data.columns[antecedent]]
-            PC = np.sum(PC, axis=1)
-            PC = PC == len(antecedent)
-            PC = np.sum(PC)
-            zhangs = calculate_zhangs_metric(support, (PA / len(data)), (PC / len(data)))
-            measures["zhangs_metric"] = zhangs
+            measures["zhangs_metric"] = stats['zhangs_metric']
         return measures
 
-    def computeSimilarity(self, allAntecedents, antecedentsArray, nbantecedent):
-        onlySameSize = [x for x in allAntecedents if len(x) >= len(antecedentsArray)]
-        maxSimilarity = 0
-        for antecedentIndex in range(len(onlySameSize)):
-            antecedents = onlySameSize[antecedentIndex]
-            similarity = 0
-            for item in antecedents:
-                if item in antecedentsArray:
-                    similarity += 1
-            similarity /= nbantecedent
-            if similarity > maxSimilarity:
-                maxSimilarity = similarity
-        return maxSimilarity
+    def getMinOverlap(self, nbAntecedent):
+        # smallest number of shared items that makes two antecedent sets more similar than the likeness
+        # (nbAntecedent + 1 means that no antecedent set can be too similar)
+        return next((overlap for overlap in range(nbAntecedent + 1) if overlap / nbAntecedent > self.likeness),
+                    nbAntecedent + 1)
+
+    @staticmethod
+    def addAntecedents(previousAntecedents, antecedents, minOverlap):
+        # hashed version of the previous antecedents of a consequent, each subset of minOverlap items is mapped
+        # to the size of the largest previous antecedent set that contains it
+        for subset in combinations(antecedents, minOverlap):
+            previousAntecedents[subset] = max(previousAntecedents.get(subset, 0), len(antecedents))
+
+    @staticmethod
+    def isTooSimilar(previousAntecedents, antecedents, minOverlap):
+        # the antecedents are too similar if their similarity to a previous antecedent set of at least the same
+        # size (the number of shared items / nbAntecedent) is above the likeness, i.e. they share minOverlap or
+        # more items. The similarity is never below 0, so with a negative likeness (minOverlap = 0) all antecedents
+        # are too similar
+        if minOverlap == 0:
+            return True
+        for subset in combinations(antecedents, minOverlap):
+            if previousAntecedents.get(subset, 0) >= len(antecedents):
+                return True
+        return False
 
     def generateRules(self, data, numberOfRules=2, nbAntecedent=2):
-        timeCreatingRule = 0
         timeComputingMeasure = 0
-        self.dataset_coverage = np.zeros(len(data.loc[0]))
-
-        for consequent in range(self.dataSize):
-            allAntecedents = []
+        firstRuleIndex = len(self.results)
+        minOverlap = self.getMinOverlap(nbAntecedent)
+
+        t1 = time.time()
+        # all the consequents are processed at once, row c of the input matrix is the input of consequent c
+        consequents = np.arange(self.dataSize)
+        rules = [[] for _ in consequents]
+        previousAntecedents = [{} for _ in consequents]
+        with torch.no_grad():
             for j in range(numberOfRules):
-                antecedentsArray = []
+                antecedentsArrays = [[] for _ in consequents]
                 for i in range(nbAntecedent):
-                    t1 = time.time()
-                    consequentArray = np.zeros(self.dataSize)
-                    consequentArray[consequent] = 1
-                    consequentArray[antecedentsArray] = 1
-                    consequentArray = torch.tensor(consequentArray)
-                    consequentArray = consequentArray.unsqueeze(0)
-                    output = self.model(consequentArray.float())
-                    output = output.cpu()
-                    output = np.array(output.detach().numpy())
-                    output = pd.DataFrame(output.reshape(self.dataSize, -1))
-                    potentialAntecedentsArray = output[0].nlargest(len(data.loc[0]))
-                    for antecedent in potentialAntecedentsArray.keys():
-                        potentialAntecedents = copy.deepcopy(antecedentsArray)
-                        potentialAntecedents.append(antecedent)
-                        potentialAntecedents = sorted(potentialAntecedents)
-                        if antecedent != consequent and antecedent not in antecedentsArray and self.computeSimilarity(
-                                allAntecedents, potentialAntecedents, nbAntecedent) <= self.likeness:
-                            antecedentsArray.append(antecedent)
-                            break
-                    t2 = time.time()
-                    measures = self.computeMeasures(copy.deepcopy(antecedentsArray), consequent, data)
-                    t3 = time.time()
-                    ruleProperties = {"antecedents": list(sorted(copy.deepcopy(antecedentsArray))),
-                                      "consequent": [consequent]}
-                    ruleProperties = ruleProperties | measures
-                    self.results.append(ruleProperties)
-                    allAntecedents.append(sorted(copy.deepcopy(antecedentsArray)))
-                    timeCreatingRule += t2 - t1
-                    timeComputingMeasure += t3 - t2
+                    consequentArray = torch.zeros(self.dataSize, self.dataSize)
+                    consequentArray[consequents, consequents] = 1
+                    for consequent in consequents:
+                        consequentArray[consequent, antecedentsArrays[consequent]] = 1
+                    output = self.model(consequentArray)[0]
+                    # potential antecedents of each consequent in the order of decreasing output
+                    potentialAntecedentsArrays = torch.topk(output, self.dataSize, dim=1).indices.numpy()
+                    for consequent in consequents:
+                        antecedentsArray = antecedentsArrays[consequent]
+                        for antecedent in potentialAntecedentsArrays[consequent]:
+                            if antecedent == consequent or antecedent in antecedentsArray:
+                                continue
+                            potentialAntecedents = tuple(sorted(antecedentsArray + [antecedent]))
+                            if not self.isTooSimilar(previousAntecedents[consequent], potentialAntecedents,
+                                                     minOverlap):
+                                antecedentsArray.append(int(antecedent))
+                                break
+                        antecedents = sorted(antecedentsArray)
+                        rules[consequent].append({"antecedents": antecedents, "consequent": [int(consequent)]})
+                        self.addAntecedents(previousAntecedents[consequent], tuple(antecedents), minOverlap)
+        for consequentRules in rules:
+            self.results += consequentRules
+        timeCreatingRule = time.time() - t1
+
+        # compute the measures of all the new rules at once
+        t3 = time.time()
+        newRules = self.results[firstRuleIndex:]
+        ruleStats, self.dataset_coverage = calculate_rule_stats(
+            self.getItemMatrix(data), [rule["antecedents"] for rule in newRules],
+            [rule["consequent"][0] for rule in newRules], packed_items=self.packedItems)
+        for rule, stats in zip(newRules, ruleStats):
+            rule.update(self.computeMeasures(stats))
+        timeComputingMeasure += time.time() - t3
 
         self.exec_time = timeCreatingRule
@@ -1,7 +1,7 @@
 import time
 import numpy as np
 from mlxtend.frequent_patterns import association_rules, fpgrowth, hmine
-from mlxtend.preprocessing import TransactionEncoder
+from scipy.sparse import csr_matrix
 
 from src.preprocessing.semantic_enrichment import *
 from src.util.rule_quality import *
@@ -12,29 +12,56 @@ class NaiveSemRL:
     Implementation of Naive SemRL from Karabulut et. al (2023), using MLxtend Python package
     """
 
-    def __init__(self, min_support, min_confidence, num_bins, max_antecedent, algorithm):
+    def __init__(self, min_support, min_confidence, num_bins, max_antecedent, algorithm, sparse=False):
         """
         Initialize algorithm parameters
         :param min_support:
         :param min_confidence:
         :param num_bins: number of bins to discretize numerical values into
+        :param sparse: whether to one-hot encode the transactions into a sparse DataFrame, if they are not encoded yet
         """
         self.min_support = min_support
         self.min_confidence = min_confidence
         self.num_bins = num_bins
         self.max_antecedent = max_antecedent
         self.algorithm = algorithm
+        self.sparse = sparse
         self.rules = []
 
-    def mine_rules(self, transactions):
+    @staticmethod
+    def encode_transactions(transactions, sparse=False):
+        """
+        one-hot encode the transactions into a transactions x items DataFrame, which can be computed once and shared by
+        FP-Growth and H-Mine. The columns of the DataFrame are the positions of the items in the returned item array,
+        as MLxtend requires the integer column names of a sparse DataFrame to start from 0
+        :param transactions: semantically enriched sensor data, in the form of item id arrays
+        :param sparse: if True, the DataFrame is backed by sparse boolean columns instead of a dense boolean matrix
+        :return: (DataFrame, item ids per column)
+        """
+        lengths = [len(transaction) for transaction in transactions]
+        all_items = np.concatenate(list(transactions) + [np.zeros(0, dtype=np.int32)])
+        items, columns = np.unique(all_items, return_inverse=True)
+        item_matrix = csr_matrix((np.ones(len(all_items), dtype=bool), columns, np.cumsum([0] + lengths)),
+                                 shape=(len(transactions), len(items)))
+        # an item may occur more than once in a transaction, e.g. the same range of two sensors of the same type
+        item_matrix.sum_duplicates()
+        if sparse:
+            frame = pd.DataFrame.sparse.from_spmatrix(item_matrix, columns=range(len(items)))
+        else:
+            frame = pd.DataFrame(item_matrix.toarray(), columns=range(len(items)))
+        return frame, items
+
+    def mine_rules(self, transactions, vocabulary, encoded_transactions=None):
         """
         Learn semantic association rules from discrete sensor data and knowledge graph using exhaustive ARM methods
-        :param transactions: semantically enriched sensor data
+        :param transactions: semantically enriched sensor data, in the form of item id arrays
+        :param vocabulary: ItemVocabulary to decode the item ids with
+        :param encoded_transactions: (DataFrame, items) output of encode_transactions, encoded here if not given
         :return:
         """
-        te = TransactionEncoder()
-        te_ary = te.fit(transactions).transform(transactions)
-        df = pd.DataFrame(te_ary, columns=te.columns_)
+        if encoded_transactions is None:
+            encoded_transactions = self.encode_transactions(transactions, self.sparse)
+        df, items = encoded_transactions
         start = time.time()
 
         # mine frequent items
@@ -49,55 +76,45 @@ class NaiveSemRL:
         self.rules = association_rules(frq_items, metric="confidence", min_threshold=self.min_confidence)
         execution_time = time.time() - start
 
+        # map the column positions in the rules back to item ids
+        for side in ["antecedents", "consequents"]:
+            self.rules[side] = [frozenset(items[list(item_set)].tolist()) for item_set in self.rules[side]]
+
+        # calculate rule quality stats for all the rules at once, using the encoded transactions
+        item_indices = {item: index for index, item in enumerate(items.tolist())}
+        item_matrix = df.sparse.to_coo().T.tocsr() if hasattr(df, "sparse") else df.to_numpy().T
+        rule_stats, dataset_coverage = calculate_rule_stats(
+            item_matrix, [[item_indices[item] for item in antecedents] for antecedents in self.rules["antecedents"]],
+            [item_indices[list(consequents)[0]] for consequents in self.rules["consequents"]])
+
         # from now on, format each rule in a way that is generic and compatible with the other approaches
         formatted_rules = []
-        dataset_coverage = np.zeros(len(transactions))
         for i in range(len(self.rules["antecedents"])):
             consequent = list(self.rules["consequents"][i])[0]
             antecedents = list(self.rules["antecedents"][i])
-            stats = self.calculate_stats(antecedents, consequent, transactions, dataset_coverage)
+            stats = rule_stats[i]
 
+            # items are decoded from the vocabulary, and grouped by their measurement aspect and range
             groups = {}
-            unique_item_list = []
-            item_index = -1
             for antecedent in antecedents:
-                measurement_range = antecedent.split('_range_')[1].split('_end_')[0]
-                type = antecedent.split('_type_')[1].split('_end_')[0]
-                if type + "-" + measurement_range not in unique_item_list:
-                    unique_item_list.append(type + "-" + measurement_range)
-                    item_index += 1
-                    groups[str(item_index)] = []
-
-                groups[str(item_index)].append(antecedent)
+                item = vocabulary.decode(antecedent)
+                groups.setdefault((item[1], item[2]), []).append(item)
 
             antecedent_list = []
             for key in groups:
                 new_antecedent = {}
                 for sub_item in groups[key]:
-                    if "_attribute_" in sub_item:
-                        attribute = sub_item.split('_attribute_')[1]
-                        key = attribute.split('_key_')[1].split('_end_')[0]
-                        value = attribute.split('_value_')[1].split('_end_')[0]
-                        new_antecedent[key] = value
-                    new_antecedent['measurement_aspect'] = sub_item.split('_type_')[1].split('_end_')[0]
-                    new_antecedent['measurement_range'] = sub_item.split('_range_')[1].split('_end_')[0]
-
+                    self.add_item_properties(new_antecedent, sub_item)
                 antecedent_list.append(new_antecedent)
 
             new_consequent = {}
-            measurement_range = consequent.split("_range_")[1].split('_end_')[0]
-            type = consequent.split("_type_")[1].split('_end_')[0]
-            if type + "-" + measurement_range in unique_item_list:
-                postfix = unique_item_list.index(type + "-" + measurement_range)
+            consequent_item = vocabulary.decode(consequent)
+            unique_item_list = list(groups.keys())
+            if (consequent_item[1], consequent_item[2]) in groups:
+                postfix = unique_item_list.index((consequent_item[1], consequent_item[2]))
             else:
-                postfix = item_index + 1
-            if "_attribute_" in consequent:
-                attribute = consequent.split('_attribute_')[1]
-                key = attribute.split('_key_')[1].split('_end_')[0]
-                value = attribute.split('_value_')[1].split('_end_')[0]
-                new_consequent[key] = value
-            new_consequent['measurement_aspect'] = consequent.split('_type_')[1].split('_end_')[0]
-            new_consequent['measurement_range'] = consequent.split('_range_')[1].split('_end_')[0]
+                postfix = len(unique_item_list)
+            self.add_item_properties(new_consequent, consequent_item)
 
             # if the items in the consequent corresponds to one of the antecedents, then mark this with consequent_index
             # e.g. if a.feature1 & b.feature1 --> a.feature2, then antecedents = [a.feature1, b.feature1]
@@ -112,64 +129,11 @@ class NaiveSemRL:
         return formatted_rules, execution_time, dataset_coverage.sum() / len(transactions)
 
     @staticmethod
-    def deconstruct_rule_string(rule_string, postfix):
-        split_string = rule_string.split("_")
-        sensor_type = split_string[1]
-        measurement_range = '_'.join(split_string[2:4])
-
-        rule = {
-            'type' + postfix: sensor_type,
-            'measurement_range' + postfix: measurement_range
-        }
-        if len(split_string) > 4:
-            rule['attribute' + postfix] = '_'.join(split_string[4:]).replace('s_', '')
-
-        return rule
-
-    @staticmethod
-    def calculate_stats(antecedents, consequent, enriched_transactions, dataset_coverage):
-        antecedents_occurrence_count = 0
-        consequents_occurrence_count = 0
-        co_occurrence_count = 0
-        only_antecedence_occurrence_count = 0
-        only_consequence_occurrence_count = 0
-        no_ant_no_cons_count = 0
-        for transaction_index in range(len(enriched_transactions)):
-            transaction = enriched_transactions[transaction_index]
-            antecedent_match = True
-            for antecedent in antecedents:
-                if antecedent not in transaction:
-                    antecedent_match = False
-                    break
-            if antecedent_match:
-                dataset_coverage[transaction_index] = 1
-                antecedents_occurrence_count += 1
-            if consequent in transaction:
-                consequents_occurrence_count += 1
-                if antecedent_match:
-                    co_occurrence_count += 1
-                else:
-                    only_consequence_occurrence_count += 1
-            elif antecedent_match:
-                only_antecedence_occurrence_count += 1
-            else:
-                no_ant_no_cons_count += 1
-
-        stats = {}
-        num_transactions = len(enriched_transactions)
-
-        support_body = antecedents_occurrence_count / num_transactions
-
-        stats['support'] = co_occurrence_count / num_transactions
-        stats['confidence'] = stats['support'] / support_body
-        stats['coverage'] = support_body
-        stats["yulesq"] = calculate_yulesq(co_occurrence_count, no_ant_no_cons_count,
-                                           only_consequence_occurrence_count,
-                                           only_antecedence_occurrence_count)
-        stats["interestingness"] = calculate_interestingness(stats['confidence'], stats['support'],
-                                                             (consequents_occurrence_count / num_transactions),
-                                                             num_transactions)
-        stats["zhangs_metric"] = calculate_zhangs_metric(stats["support"],
-                                                         (antecedents_occurrence_count / num_transactions),
-                                                         (consequents_occurrence_count / num_transactions))
-        return stats
+    def add_item_properties(rule_item, item):
+        """
+        add the properties of a decoded ('range', ...) or ('range_attribute', ...) item to the given rule item
+        """
+        if item[0] == 'range_attribute':
+            rule_item[item[3]] = item[4]
+        rule_item['measurement_aspect'] = item[1]
+        rule_item['measurement_range'] = item[2]
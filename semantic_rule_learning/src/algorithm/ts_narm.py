@@ -1,11 +1,126 @@
-from niaarm import get_rules, Dataset
+import time
+import warnings
+
+import niaarm
+from niaarm import Dataset
+from niaarm.niaarm import NiaARM
+from niaarm.rule import Rule
+from niapy.task import OptimizationType, Task
 
 from src.preprocessing.semantic_enrichment import *
+from src.util.rule_quality import calculate_rule_stats
 
 import numpy as np
 import pandas as pd
 
 
+# NiaARM versions that the rules and the counts of the vectorized fitness evaluation are verified against, the
+# evaluation of NiaARM itself is used with the other versions
+VERIFIED_NIAARM_VERSIONS = ("0.3.7", "0.4.7")
+# metrics of niaarm.Rule that depend on more than the transaction counts of the rule
+NON_COUNT_METRICS = ("inclusion", "amplitude")
+
+
+class TSNARMProblem(NiaARM):
+    """
+    NiaARM association rule mining problem with a vectorized fitness evaluation. The columns of the dataset are
+    encoded into NumPy arrays once (categorical columns as category codes), and the transaction counts of the rules
+    are calculated over these arrays instead of the pandas DataFrame of the dataset. The rules and their fitness are
+    the same as in NiaARM. Only the metrics that are calculated from the counts (e.g. support and confidence) are
+    vectorized, NiaARM evaluates the rules if inclusion or amplitude is used
+    """
+
+    def __init__(self, dataset, metrics):
+        """
+        :param dataset: NiaARM Dataset of the enriched transactions
+        :param metrics: metrics to calculate the fitness of a rule with, e.g. support and confidence
+        """
+        super().__init__(dataset.dimension, dataset.features, dataset.transactions, metrics)
+        self.vectorized = niaarm.__version__ in VERIFIED_NIAARM_VERSIONS and \
+            not any(metric in NON_COUNT_METRICS for metric in self.metrics)
+        if niaarm.__version__ not in VERIFIED_NIAARM_VERSIONS:
+            warnings.warn("The vectorized TS-NARM evaluation is not verified with NiaARM " + niaarm.__version__ +
+                          ", NiaARM evaluates the rules instead")
+        self.num_transactions = len(dataset.transactions)
+        self.column_indices = {feature.name: index for index, feature in enumerate(self.features)}
+        self.columns = []
+        for feature in self.features:
+            column = dataset.transactions[feature.name]
+            if feature.dtype == "cat":
+                self.columns.append(column.cat.codes.to_numpy())
+            else:
+                self.columns.append(column.to_numpy(dtype=float))
+        # start of each feature in the solution vectors, which NiaARM recalculates for every feature of every rule
+        self.positions = [super(TSNARMProblem, self).feature_position(index) for index in range(self.num_features)]
+        self.rule_keys = set()
+
+    def feature_position(self, feature):
+        return self.positions[feature]
+
+    def get_transactions_mask(self, features):
+        """
+        :return: mask of the transactions that contain all the given features
+        """
+        mask = np.ones(self.num_transactions, dtype=bool)
+        for feature in features:
+            index = self.column_indices[feature.name]
+            column = self.columns[index]
+            if feature.dtype == "cat":
+                mask &= column == self.features[index].categories.index(feature.categories[0])
+            else:
+                mask &= (column <= feature.max_val) & (column >= feature.min_val)
+        return mask
+
+    def get_cut_point(self, value):
+        """
+        position in the solution vector where the antecedent ends and the consequent starts, as in NiaARM
+        """
+        cut = int(value * self.num_features)
+        if cut == 0:
+            cut = 1
+        if cut > self.num_features - 1:
+            cut = self.num_features - 2
+        return cut
+
+    @staticmethod
+    def get_rule_key(rule):
+        return tuple((feature.name, tuple(feature.categories) if feature.dtype == "cat" else
+                      (feature.min_val, feature.max_val)) for feature in rule.antecedent + [None] + rule.consequent
+                     if feature is not None) + (len(rule.antecedent),)
+
+    def _evaluate(self, sol):
+        if not self.vectorized:
+            return super()._evaluate(sol)
+        cut = self.get_cut_point(sol[self.dimension - 1])
+        rule = self.build_rule(sol[:-1])
+        antecedent = [feature for feature in rule[:cut] if feature]
+        consequent = [feature for feature in rule[cut:] if feature]
+        if not antecedent or not consequent:
+            return -1.0
+
+        contains_antecedent = self.get_transactions_mask(antecedent)
+        contains_consequent = self.get_transactions_mask(consequent)
+        # the counts of the rule are calculated as in niaarm.Rule, and the metrics are derived from them
+        rule = Rule(antecedent, consequent)
+        rule.num_transactions = self.num_transactions
+        rule.antecedent_count = contains_antecedent.sum()
+        rule.consequent_count = contains_consequent.sum()
+        rule.full_count = (contains_antecedent & contains_consequent).sum()
+        rule.ant_not_con = (contains_antecedent & ~contains_consequent).sum()
+        rule.con_not_ant = (contains_consequent & ~contains_antecedent).sum()
+        rule.not_ant_not_con = self.num_transactions - rule.full_count - rule.ant_not_con - rule.con_not_ant
+        metrics = [getattr(rule, metric) for metric in self.metrics]
+        rule.fitness = np.dot(self.weights, metrics) / self.sum_weights
+
+        # the rules are deduplicated by a key instead of a linear search in the rule list
+        if rule.support > 0.0 and rule.confidence > 0.0:
+            rule_key = self.get_rule_key(rule)
+            if rule_key not in self.rule_keys:
+                self.rule_keys.add(rule_key)
+                self.rules.append(rule)
+        return rule.fitness
+
+
 class TSNARM:
     """
     An implementation/adaptation of the TS-NARM from Fister et. al using NiaARM and NiaPy
@@ -15,50 +130,81 @@ class TSNARM:
         self.max_evaluations = max_evaluations
         self.optimization_algorithm = optimization_algorithm
 
-    def learn_rules(self, knowledge_graph, transactions):
+    @staticmethod
+    def create_dataset(knowledge_graph, transactions, sensor_nodes=None):
+        """
+        semantically enrich the transactions and create the NiaARM Dataset, which can be shared by all the
+        optimization algorithms that run on the same transactions
+        :param sensor_nodes: SensorNodeTable of the sensors in the transactions, built if not given
+        """
+        enriched_transactions = enrich_transactions_tsnarm(knowledge_graph, transactions, sensor_nodes)
+        return Dataset(pd.DataFrame(enriched_transactions[1:], columns=enriched_transactions[0]))
+
+    def learn_rules(self, knowledge_graph, transactions, sensor_nodes=None, dataset=None):
         """
         Learn association rules using nature-inspired optimization-based methods from semantically enriched sensor data
+        :param sensor_nodes: SensorNodeTable of the sensors in the transactions, built if not given
+        :param dataset: NiaARM Dataset of the enriched transactions from create_dataset, created if not given
         """
-        enriched_transactions = enrich_transactions_tsnarm(knowledge_graph, transactions)
+        if dataset is None:
+            dataset = self.create_dataset(knowledge_graph, transactions, sensor_nodes)
         metrics = ['support', 'confidence']
 
-        frame = pd.DataFrame(enriched_transactions[1:], columns=enriched_transactions[0])
-        dataset = Dataset(frame)
-        rules, run_time = get_rules(dataset=dataset, algorithm=self.optimization_algorithm, metrics=metrics,
-                                    max_evals=self.max_evaluations, logging=False)
+        problem = TSNARMProblem(dataset, metrics)
+        task = Task(problem, max_evals=self.max_evaluations, optimization_type=OptimizationType.MAXIMIZATION)
+        start = time.perf_counter()
+        self.optimization_algorithm.run(task)
+        run_time = time.perf_counter() - start
+        rules = problem.rules
+        rules.sort()
         if len(rules) == 0:
             return False, False
 
-        data_coverage = self.calculate_coverage(rules, enriched_transactions)
+        data_coverage = self.calculate_coverage(rules, dataset.transactions)
         support, confidence, rule_coverage, zhangs = \
             rules.mean("support"), rules.mean("confidence"), rules.mean("coverage"), rules.mean("zhang")
         # return 0 for training time
         return [len(rules), 0, run_time, support, confidence, rule_coverage, zhangs, data_coverage], rules
 
     @staticmethod
-    def calculate_coverage(rules, dataset):
+    def calculate_coverage(rules, frame):
+        """
+        calculate coverage of the given rule set on the transactions of the dataset
+        """
+        # each distinct feature condition in the rules becomes an item (row) of the item x transaction matrix
+        conditions = {}
+        antecedents = []
+        consequents = []
+        for rule in rules:
+            antecedents.append([TSNARM.get_condition_index(conditions, item) for item in rule.antecedent])
+            # consequents with multiple features are covered when all of their features are covered
+            consequents.append(TSNARM.get_condition_index(
+                conditions, tuple(TSNARM.get_condition_index(conditions, item) for item in rule.consequent)))
+
+        item_matrix = np.zeros((len(conditions), len(frame)), dtype=bool)
+        for condition, index in conditions.items():
+            if condition[0] == 'all':
+                item_matrix[index] = item_matrix[list(condition[1])].all(axis=0)
+            elif condition[0] == 'cat':
+                item_matrix[index] = frame[condition[1]] == condition[2]
+            else:
+                item_matrix[index] = frame[condition[1]].between(condition[2], condition[3])
+
+        _, dataset_coverage = calculate_rule_stats(item_matrix, antecedents, consequents)
+        return dataset_coverage.sum() / len(frame)
+
+    @staticmethod
+    def get_condition_index(conditions, item):
         """
-        calculate coverage of the given rule set on the dataset
+        get the item index of a feature condition, or of a conjunction of feature conditions given as a tuple of
+        item indices
         """
-        rule_coverage = np.zeros(len(dataset))
-        data_headers = dataset[0]
-        for index in range(1, len(dataset)):
-            transaction = dataset[index]
-            for rule in rules:
-                covered = True
-                for item in rule.antecedent:
-                    if item.categories:
-                        if transaction[data_headers.index(item.name)] != item.categories[0]:
-                            covered = False
-                            break
-                    else:
-                        covered = False
-                        value = transaction[data_headers.index(item.name)]
-                        if item.min_val <= value <= item.max_val:
-                            covered = True
-                            break
-                if covered:
-                    rule_coverage[index] = 1
-                    break
-
-        return sum(rule_coverage) / len(dataset)
+        if isinstance(item, tuple):
+            condition = ('all', item)
+        elif item.categories:
+            condition = ('cat', item.name, item.categories[0])
+        else:
+            condition = ('num', item.name, item.min_val, item.max_val)
+        if condition not in conditions:
+            conditions[condition] = len(conditions)
+        return conditions[condition]
@@ -0,0 +1,314 @@
+"""
+Offline benchmark of the pipeline stages on synthetic water networks, without Neo4j and TimescaleDB. The knowledge
+graph is a random water network (or a WNTR .inp model, if given) with sensors placed on its junctions and pipes, and
+the sensor data is a synthetic daily demand pattern with noise. Each stage is timed separately per configuration, and
+the wall time, the peak (Python heap) memory and the scaling curves are written as JSON, e.g.:
+
+    python -m src.benchmark --sensors 10 20 40 --timestamps 200 --bins 5 --repeats 2 --output benchmark.json
+
+With multiple repeats, the minimum wall time and the maximum peak memory of the repeats are reported, so that one-off
+costs such as the lazy initialization of PyTorch in the first run don't distort the scaling curves.
+
+Peak memory is measured with tracemalloc, which includes the numpy and pandas buffers but not the memory that
+PyTorch allocates natively, and it slows down pure Python code. Use --no-memory to measure the wall time only.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timedelta
+
+import networkx as nx
+import numpy as np
+import torch
+from niapy.algorithms.basic import DifferentialEvolution
+
+from src.algorithm.aerial.aerial import Aerial
+from src.algorithm.arm_ae.armae import ARMAE
+from src.algorithm.naive_semrl import NaiveSemRL
+from src.algorithm.ts_narm import TSNARM
+from src.preprocessing.base_preprocessing import categorical_attributes, numerical_attributes, \
+    filter_knowledge_graph_props
+from src.preprocessing.semantic_enrichment import enrich_transactions_arm_ae, enrich_transactions_naivesemrl
+from src.util.converter_util import timeseries_to_transactions
+from src.util.graph_util import NeighborhoodIndex, NodeFeatureEncoder, SensorNodeTable, \
+    discretize_numerical_attributes
+from src.util.transactions_util import calculate_discrete_boundaries
+
+warnings.filterwarnings("ignore")
+
+algorithms = ["naive_semrl", "tsnarm", "aerial", "arm_ae"]
+
+
+def add_node(graph, name, node_type, **properties):
+    graph.add_node(name, labels=node_type, properties=dict(name=name, type=node_type, **properties))
+
+
+def add_relation(graph, source, destination):
+    """
+    add a relation in both directions, as the relations are returned by the undirected query of the NodeRepository
+    """
+    graph.add_edge(source, destination, type=graph.nodes[source]['labels'] + "_" + graph.nodes[destination]['labels'])
+    graph.add_edge(destination, source, type=graph.nodes[destination]['labels'] + "_" + graph.nodes[source]['labels'])
+
+
+def add_link(graph, name, link_type, start_node, end_node, **properties):
+    """
+    add a link (pipe, pump or valve) as a node that is related to its start and end nodes, as in the knowledge graph
+    """
+    add_node(graph, name, link_type, **properties)
+    add_relation(graph, start_node, name)
+    add_relation(graph, name, end_node)
+
+
+def generate_water_network(num_junctions, loop_ratio=0.1, seed=None):
+    """
+    generate a random water network knowledge graph, a random tree of pipes between the junctions with a reservoir at
+    the root, and additional pipes that form loops
+    :param num_junctions: number of junctions in the network
+    :param loop_ratio: number of the additional pipes relative to the number of junctions
+    :param seed: seed of the random number generator
+    :return: knowledge graph in NetworkX format
+    """
+    random_generator = random.Random(seed)
+    graph = nx.MultiDiGraph()
+    add_node(graph, "R1", "Reservoir", elevation=random_generator.uniform(50, 100))
+    junctions = []
+    pipes = [(junction, random_generator.randrange(junction) if junction > 0 else None) for junction in
+             range(num_junctions)]
+    pipes += [tuple(random_generator.sample(range(num_junctions), 2)) for _ in
+              range(int(num_junctions * loop_ratio)) if num_junctions > 1]
+    for junction in range(num_junctions):
+        junctions.append("J" + str(junction))
+        add_node(graph, junctions[-1], "Junction", elevation=random_generator.uniform(0, 50))
+    for pipe, (start, end) in enumerate(pipes):
+        add_link(graph, "P" + str(pipe), "Pipe", junctions[start], "R1" if end is None else junctions[end],
+                 diameter=random_generator.choice([0.1, 0.15, 0.2, 0.3, 0.5]),
+                 length=random_generator.uniform(10, 1000), roughness=random_generator.choice([100, 120, 130]))
+    return graph
+
+
+def load_water_network(inp_file):
+    """
+    load a water network knowledge graph from an EPANET .inp model, as imported into Neo4j by the graphdb module
+    :param inp_file: path of the .inp file
+    """
+    # wntr is only needed to benchmark on real network models
+    import wntr
+
+    water_network = wntr.network.WaterNetworkModel(inp_file).to_dict()
+    graph = nx.MultiDiGraph()
+    for node in water_network['nodes']:
+        add_node(graph, node['name'], node['node_type'], elevation=node.get('elevation', 0))
+    for link in water_network['links']:
+        properties = {key: link[key] for key in ['diameter', 'length', 'roughness'] if key in link}
+        add_link(graph, link['name'], link['link_type'], link['start_node_name'], link['end_node_name'], **properties)
+    return graph
+
+
+def add_sensors(graph, num_sensors, seed=None):
+    """
+    place pressure sensors on the junctions and flow sensors on the pipes of the network, alternately
+    :return: list of (sensor name, measurement aspect) pairs
+    """
+    random_generator = random.Random(seed)
+    objects = {'pressure': [name for name in graph.nodes if graph.nodes[name]['labels'] == 'Junction'],
+               'flow': [name for name in graph.nodes if graph.nodes[name]['labels'] == 'Pipe']}
+    for measurement_aspect in objects:
+        random_generator.shuffle(objects[measurement_aspect])
+    sensors = []
+    for sensor in range(num_sensors):
+        measurement_aspect = ['pressure', 'flow'][sensor % 2]
+        object_name = objects[measurement_aspect][sensor // 2 % len(objects[measurement_aspect])]
+        sensor_name = "s_" + object_name + measurement_aspect + ("" if sensor < 2 * len(objects[measurement_aspect])
+                                                               else "_" + str(sensor))
+        add_node(graph, sensor_name, "Sensor", measurement_aspect=measurement_aspect)
+        add_relation(graph, sensor_name, object_name)
+        sensors.append((sensor_name, measurement_aspect))
+    return sensors
+
+
+def generate_sensor_data(sensors, num_timestamps, seed=None):
+    """
+    generate hourly sensor measurements that follow a daily demand pattern, scaled per sensor, with noise
+    :return: (time_interval, average, name, sensor_type) rows ordered by time, as returned by TimescaleDB
+    """
+    random_generator = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    demand = 1 + 0.5 * np.sin(2 * math.pi * np.arange(num_timestamps) / 24)
+    scales = random_generator.uniform(0.5, 2, len(sensors))
+    values = demand[:, None] * scales[None, :] + random_generator.normal(0, 0.1, (num_timestamps, len(sensors)))
+    values[:, [measurement_aspect == 'pressure' for _, measurement_aspect in sensors]] *= 30
+    return [(start + timedelta(hours=timestamp), float(values[timestamp, column]), sensor_name, measurement_aspect)
+            for timestamp in range(num_timestamps) for column, (sensor_name, measurement_aspect) in enumerate(sensors)]
+
+
+def measure(stages, stage, function, *args, trace_memory=True, **kwargs):
+    """
+    run a stage and store its wall time and peak memory in stages
+    :return: return value of the function
+    """
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    stages[stage] = {'wall_time': time.perf_counter() - start}
+    if trace_memory:
+        stages[stage]['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run_benchmark(num_sensors, num_timestamps, num_bins, args):
+    """
+    run all the stages of the pipeline once on a synthetic dataset
+    :return: wall time and peak memory per stage
+    """
+    stages = {}
+    measured = dict(trace_memory=not args.no_memory)
+    if args.inp_file:
+        graph = load_water_network(args.inp_file)
+    else:
+        graph = generate_water_network(args.junctions or max(num_sensors, 10), seed=args.seed)
+    sensors = add_sensors(graph, num_sensors, seed=args.seed)
+    sensor_data = generate_sensor_data(sensors, num_timestamps, seed=args.seed)
+
+    transactions = measure(stages, 'timeseries_to_transactions', timeseries_to_transactions, sensor_data, **measured)
+    knowledge_graph = measure(stages, 'kg_preprocessing', lambda: discretize_numerical_attributes(
+        filter_knowledge_graph_props(graph, categorical_attributes + numerical_attributes + ["name"]),
+        numerical_attributes, num_bins), **measured)
+    discretizer = measure(stages, 'sensor_discretization', calculate_discrete_boundaries, transactions, num_bins,
+                          **measured)
+    sensor_nodes = measure(stages, 'sensor_node_table', SensorNodeTable, knowledge_graph, transactions, **measured)
+    node_encoder = measure(stages, 'node_feature_encoder', NodeFeatureEncoder, knowledge_graph,
+                           categorical_attributes + numerical_attributes, transactions.vocabulary, **measured)
+    neighborhood_index = measure(stages, 'neighborhood_index', NeighborhoodIndex, knowledge_graph,
+                                 args.neighbors, **measured) if args.neighbors > 0 else None
+
+    if "naive_semrl" in args.algorithms:
+        naive_transactions = measure(stages, 'enrichment_naive_semrl', enrich_transactions_naivesemrl,
+                                     knowledge_graph, transactions, num_bins, discretizer, sensor_nodes, **measured)
+        encoding = measure(stages, 'encoding_naive_semrl', NaiveSemRL.encode_transactions, naive_transactions,
+                           args.naive_semrl_sparse, **measured)
+        naive_semrl = NaiveSemRL(args.min_support, args.min_confidence, num_bins, args.max_antecedents, "fpgrowth",
+                                 sparse=args.naive_semrl_sparse)
+        measure(stages, 'naive_semrl', naive_semrl.mine_rules, naive_transactions, transactions.vocabulary, encoding,
+                **measured)
+
+    if "tsnarm" in args.algorithms:
+        dataset = measure(stages, 'enrichment_tsnarm', TSNARM.create_dataset, knowledge_graph, transactions,
+                          sensor_nodes, **measured)
+        tsnarm = TSNARM(DifferentialEvolution(args.population_size, differential_weight=0.5,
+                                              crossover_probability=0.9), args.max_evaluations)
+        measure(stages, 'tsnarm', tsnarm.learn_rules, knowledge_graph, transactions, sensor_nodes, dataset,
+                **measured)
+
+    if "aerial" in args.algorithms:
+        aerial = Aerial(num_bins, args.neighbors, args.max_antecedents, args.similarity_threshold,
+                        epochs=args.epochs, batch_size=args.batch_size, sparse=args.aerial_sparse)
+        measure(stages, 'enrichment_aerial', aerial.create_input_vectors, knowledge_graph, transactions, discretizer,
+                neighborhood_index, sensor_nodes, node_encoder, **measured)
+        # without a model registry, the Autoencoder is always trained from scratch
+        measure(stages, 'aerial_training', aerial.train, "benchmark", **measured)
+        rules = measure(stages, 'aerial_rule_extraction', lambda: aerial.generate_rules()[0], **measured)
+        measure(stages, 'aerial_rule_quality', aerial.calculate_stats, rules, transactions, **measured)
+
+    if "arm_ae" in args.algorithms:
+        input_vectors = measure(stages, 'enrichment_arm_ae', enrich_transactions_arm_ae, knowledge_graph,
+                                transactions, num_bins, args.neighbors, discretizer=discretizer,
+                                neighborhood_index=neighborhood_index, sensor_nodes=sensor_nodes,
+                                node_encoder=node_encoder, **measured)
+        arm_ae = ARMAE(len(input_vectors.loc[0]))
+        measure(stages, 'arm_ae_training', lambda: arm_ae.train(arm_ae.dataPreprocessing(input_vectors)), **measured)
+        measure(stages, 'arm_ae_rule_extraction', arm_ae.generateRules, input_vectors, numberOfRules=2,
+                nbAntecedent=args.max_antecedents, **measured)
+    return stages
+
+
+def get_scaling_curves(results, dimensions):
+    """
+    wall time of each stage per value of each dimension (number of sensors, timestamps or bins), while the other
+    dimensions are at their first value, and the exponent of the power law fitted to the curve (the slope in log-log
+    scale), e.g. 1 for linear and 2 for quadratic scaling
+    """
+    scaling = {}
+    for dimension, values in dimensions.items():
+        if len(values) < 2:
+            continue
+        curve = [result for result in results if all(
+            result[other] == dimensions[other][0] for other in dimensions if other != dimension)]
+        scaling[dimension] = {}
+        for stage in curve[0]['stages']:
+            points = [[result[dimension], result['stages'][stage]['wall_time']] for result in curve]
+            scaling[dimension][stage] = {'points': points}
+            if all(wall_time > 0 for _, wall_time in points):
+                scaling[dimension][stage]['exponent'] = float(np.polyfit(
+                    np.log([value for value, _ in points]), np.log([wall_time for _, wall_time in points]), 1)[0])
+    return scaling
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the semantic rule learning pipeline stages")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[10], help="numbers of sensors")
+    parser.add_argument("--timestamps", type=int, nargs="+", default=[200], help="lengths of the sensor history")
+    parser.add_argument("--bins", type=int, nargs="+", default=[10], help="numbers of bins")
+    parser.add_argument("--junctions", type=int, default=None,
+                        help="number of junctions of the random network, at least the number of sensors by default")
+    parser.add_argument("--inp-file", default=None, help="EPANET .inp model to use instead of a random network")
+    parser.add_argument("--neighbors", type=int, default=0)
+    parser.add_argument("--algorithms", nargs="+", default=algorithms, choices=algorithms)
+    parser.add_argument("--min-support", type=float, default=0.25)
+    parser.add_argument("--min-confidence", type=float, default=0.8)
+    parser.add_argument("--naive-semrl-sparse", action="store_true")
+    parser.add_argument("--population-size", type=int, default=200)
+    parser.add_argument("--max-evaluations", type=int, default=1000)
+    parser.add_argument("--similarity-threshold", type=float, default=0.5)
+    parser.add_argument("--max-antecedents", type=int, default=2)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--aerial-sparse", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeats", type=int, default=1, help="number of runs per configuration")
+    parser.add_argument("--no-memory", action="store_true", help="don't measure the peak memory")
+    parser.add_argument("--output", default="benchmark_" + datetime.now().strftime("%m-%d-%Y_%H:%M:%S") + ".json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    dimensions = {'num_sensors': args.sensors, 'num_timestamps': args.timestamps, 'num_bins': args.bins}
+    results = []
+    for num_sensors in args.sensors:
+        for num_timestamps in args.timestamps:
+            for num_bins in args.bins:
+                print("Benchmarking", num_sensors, "sensors,", num_timestamps, "timestamps,", num_bins, "bins")
+                random.seed(args.seed)
+                np.random.seed(args.seed)
+                torch.manual_seed(args.seed)
+                stages = {}
+                for _ in range(args.repeats):
+                    for stage, measurement in run_benchmark(num_sensors, num_timestamps, num_bins, args).items():
+                        if stage not in stages:
+                            stages[stage] = measurement
+                        for key, value in measurement.items():
+                            stages[stage][key] = min(stages[stage][key], value) if key == 'wall_time' else \
+                                max(stages[stage][key], value)
+                for stage in stages:
+                    print("  ", stage, round(stages[stage]['wall_time'], 3), "s")
+                results.append({'num_sensors': num_sensors, 'num_timestamps': num_timestamps, 'num_bins': num_bins,
+                                'stages': stages})
+
+    report = {'parameters': vars(args),
+              'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                              'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'torch': torch.__version__},
+              'results': results, 'scaling': get_scaling_curves(results, dimensions)}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print("\nSAVED: The benchmark results are saved into '", args.output, "' file.")
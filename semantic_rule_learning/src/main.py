@@ -2,8 +2,10 @@ import os
 
 import pandas as pd
 import csv
+import torch
 import warnings
-import tracemalloc
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from datetime import datetime
 from dotenv import load_dotenv
@@ -11,15 +13,23 @@ from niapy.algorithms.basic import DifferentialEvolution, GeneticAlgorithm, Part
 from niapy.algorithms.modified import SuccessHistoryAdaptiveDifferentialEvolution, SelfAdaptiveDifferentialEvolution
 
 from src.repository.graphdb.node_repository import NodeRepository
+from src.repository.file.node_file_repository import NodeFileRepository
+from src.repository.file.sensor_data_file_repository import SensorDataFileRepository
 from src.preprocessing.base_preprocessing import filter_knowledge_graph_props
-from src.util.graph_util import discretize_numerical_attributes
+from src.util.graph_util import NeighborhoodIndex, NodeFeatureEncoder, SensorNodeTable, \
+    discretize_numerical_attributes
 from src.repository.timescaledb.sensor_data_repository import SensorDataRepository
 from src.preprocessing.semantic_enrichment import *
 from src.algorithm.naive_semrl import NaiveSemRL
 from src.algorithm.ts_narm import TSNARM
-from src.algorithm.our_ae_based_arm.our_ae_based_arm import OurAEBasedARM
+from src.algorithm.aerial.aerial import Aerial
+from src.algorithm.aerial.model_registry import ModelRegistry
 from src.algorithm.arm_ae.armae import ARMAE
 from src.util.converter_util import *
+from src.util.discretization_util import Discretizer
+from src.util.cache_util import DataCache
+from src.util.item_vocabulary import ItemVocabulary
+from src.util.profiling_util import StageProfiler
 from src.util.rule_quality import *
 
 # load environment parameters
@@ -36,11 +46,25 @@ def print_params():
     print("NAIVE_SEMRL_MIN_CONFIDENCE:", os.getenv("NAIVE_SEMRL_MIN_CONFIDENCE"))
     print("(OUR AE-based ARM)SIMILARITY_THRESHOLD:", os.getenv("SIMILARITY_THRESHOLD"))
     print("MAX_ANTECEDENT:", os.getenv("MAX_ANTECEDENT"))
+    print("AERIAL_EPOCHS:", os.getenv("AERIAL_EPOCHS"))
+    print("AERIAL_BATCH_SIZE:", os.getenv("AERIAL_BATCH_SIZE"))
+    print("AERIAL_SPARSE:", os.getenv("AERIAL_SPARSE"))
+    print("AERIAL_INCREMENTAL:", os.getenv("AERIAL_INCREMENTAL"))
+    print("AERIAL_FINE_TUNE_EPOCHS:", os.getenv("AERIAL_FINE_TUNE_EPOCHS"))
+    print("AERIAL_MODEL_REGISTRY_DIR:", os.getenv("AERIAL_MODEL_REGISTRY_DIR"))
+    print("NAIVE_SEMRL_SPARSE:", os.getenv("NAIVE_SEMRL_SPARSE"))
     print("TS_NARM_POPULATION_SIZE:", os.getenv("TS_NARM_POPULATION_SIZE"))
     print("TS_NARM_MAX_EVALUATIONS:", os.getenv("TS_NARM_MAX_EVALUATIONS"))
     print("TRANSACTION_PERIOD_LENGTH_IN_MINUTES:", os.getenv("TRANSACTION_PERIOD_LENGTH_IN_MINUTES"))
     print("NUM_OF_BINS:", os.getenv("NUM_OF_BINS"))
     print("NUM_OF_NEIGHBORS:", os.getenv("NUM_OF_NEIGHBORS"))
+    print("SENSOR_SUBSAMPLE:", os.getenv("SENSOR_SUBSAMPLE"))
+    print("SUBSAMPLE_SEED:", os.getenv("SUBSAMPLE_SEED"))
+    print("MAX_WORKERS:", os.getenv("MAX_WORKERS"))
+    print("DATA_SOURCE:", os.getenv("DATA_SOURCE"))
+    print("SERVER_SIDE_DISCRETIZATION:", os.getenv("SERVER_SIDE_DISCRETIZATION"))
+    print("PROFILE_TRACE_MEMORY:", os.getenv("PROFILE_TRACE_MEMORY"))
+    print("PROFILE_DIRECTORY:", os.getenv("PROFILE_DIRECTORY"))
     print("----------------------------------------------------\n")
 
 
@@ -50,18 +74,282 @@ min_support = float(os.getenv("NAIVE_SEMRL_MIN_SUPPORT"))
 min_confidence = float(os.getenv("NAIVE_SEMRL_MIN_CONFIDENCE"))
 similarity_threshold = float(os.getenv("SIMILARITY_THRESHOLD"))
 max_antecedent = int(os.getenv("MAX_ANTECEDENT"))
+aerial_epochs = int(os.getenv("AERIAL_EPOCHS", 2))
+aerial_batch_size = int(os.getenv("AERIAL_BATCH_SIZE", 64))
+aerial_sparse = os.getenv("AERIAL_SPARSE", "false").lower() == "true"
+aerial_incremental = os.getenv("AERIAL_INCREMENTAL", "false").lower() == "true"
+aerial_fine_tune_epochs = int(os.getenv("AERIAL_FINE_TUNE_EPOCHS", 1))
+# trained models are stored in and reused from the registry only if its directory is given
+model_registry = ModelRegistry(os.getenv("AERIAL_MODEL_REGISTRY_DIR")) if os.getenv("AERIAL_MODEL_REGISTRY_DIR") \
+    else None
+naive_semrl_sparse = os.getenv("NAIVE_SEMRL_SPARSE", "false").lower() == "true"
 population_size = int(os.getenv("TS_NARM_POPULATION_SIZE"))
 max_evals = int(os.getenv("TS_NARM_MAX_EVALUATIONS"))
 transaction_period = int(os.getenv("TRANSACTION_PERIOD_LENGTH_IN_MINUTES"))
 num_bins = int(os.getenv("NUM_OF_BINS"))
 num_neighbors = int(os.getenv("NUM_OF_NEIGHBORS"))
 num_runs = int(os.getenv("NUM_OF_RUNS"))
-dataset = os.getenv("TIMESCALEDB_TABLE")
+# the sensor data and the KG are read from Neo4j and TimescaleDB ("database"), or from local files ("file")
+data_source = os.getenv("DATA_SOURCE", "database")
+# name of the dataset in the results, the name of the sensor data file is used for files if no table name is given
+dataset = os.getenv("TIMESCALEDB_TABLE") if data_source != "file" or os.getenv("TIMESCALEDB_TABLE") else \
+    os.path.splitext(os.path.basename(os.getenv("SENSOR_DATA_FILE")))[0]
+itersize = int(os.getenv("TIMESCALEDB_ITERSIZE", 10000))
+# calculate the sensor bin boundaries and assign the bins in the database, only the bin indices are fetched
+server_side_discretization = os.getenv("SERVER_SIDE_DISCRETIZATION", "false").lower() == "true"
+# number of randomly selected sensors per run, all the sensors are used if 0
+subsample = int(os.getenv("SENSOR_SUBSAMPLE", 10))
+subsample_seed = int(os.getenv("SUBSAMPLE_SEED")) if os.getenv("SUBSAMPLE_SEED") else None
+cache_directory = os.getenv("DATA_CACHE_DIR")
+max_workers = int(os.getenv("MAX_WORKERS", os.cpu_count()))
+# time and memory usage per stage, the cProfile statistics of each stage are dumped if a profile directory is given
+profiler = StageProfiler(os.getenv("PROFILE_TRACE_MEMORY", "false").lower() == "true", os.getenv("PROFILE_DIRECTORY"))
+
+algorithms = ["de", "ga", "pso", "lshade", "jde", "fpgrowth", "hmine", "aerial", "arm_ae"]
+tsnarm_algorithms = ["de", "ga", "pso", "lshade", "jde"]
+# preprocessed data per run (knowledge graph, transactions, sensor discretizer, neighborhood index, sensor node table,
+# node feature encoder and the enriched transactions of TS-NARM and Naive SemRL), shared read-only by the algorithms
+run_data = []
+
+
+def get_knowledge_graph(node_repository, cache, graph_version):
+    """
+    get the knowledge graph in NetworkX format from the cache, or from Neo4j if it is not cached (or no cache is used)
+    """
+    key = DataCache.get_key(graph_version=graph_version)
+    with profiler.stage("kg_cache_load"):
+        knowledge_graph = cache.load_knowledge_graph(key) if cache is not None else None
+    if knowledge_graph is None:
+        with profiler.stage("neo4j_fetch"):
+            knowledge_graph_neo4j = node_repository.get_all_nodes_with_relations()
+        # convert KG to networkx format for ease of processing
+        with profiler.stage("neo4j_to_networkx"):
+            knowledge_graph = neo4j_to_networkx(knowledge_graph_neo4j)
+        if cache is not None:
+            with profiler.stage("kg_cache_save"):
+                cache.save_knowledge_graph(key, knowledge_graph)
+    return knowledge_graph
+
+
+def get_transactions(sensor_data_repository, cache, graph_version, seed):
+    """
+    get the sensor data transactions from the cache, or from TimescaleDB if they are not cached (or no cache is
+    used). Transactions are only cached when the random sensor subsample is seeded (or all the sensors are used), as
+    they differ per call otherwise
+    """
+    parameters = {'table': dataset, 'transaction_period': transaction_period, 'subsample': subsample, 'seed': seed,
+                  'graph_version': graph_version}
+    if server_side_discretization:
+        # the bin indices depend on the number of bins
+        parameters['server_side_bins'] = num_bins
+    key = DataCache.get_key(**parameters)
+    use_cache = cache is not None and (seed is not None or subsample == 0)
+    with profiler.stage("transactions_cache_load"):
+        transactions = cache.load_transactions(key) if use_cache else None
+    if transactions is None:
+        if server_side_discretization:
+            transactions = get_binned_transactions(sensor_data_repository, seed)
+        else:
+            # get grouped sensor data by time, and the function also filters sensors (SENSOR_SUBSAMPLE) due to time
+            # and space complexity of the FP-growth-based Naive SemRL algorithm, unless its sparse encoding is used.
+            # the data is streamed from the database one time bucket at a time
+            sensor_data = sensor_data_repository.stream_grouped_data_by_time(transaction_period, subsample=subsample,
+                                                                             itersize=itersize, seed=seed)
+            # encode sensor data as transactions, by coupling sensor measurements with sensor id and sensor type, the
+            # sensors and sensor types are interned in an item vocabulary that is used by all the algorithms in this
+            # run. the query is streamed during the conversion, therefore the stage includes both
+            with profiler.stage("timescaledb_fetch_and_conversion"):
+                transactions = grouped_timeseries_to_transactions(sensor_data, ItemVocabulary())
+        if use_cache:
+            with profiler.stage("transactions_cache_save"):
+                cache.save_transactions(key, transactions)
+    return transactions
+
+
+def get_binned_transactions(sensor_data_repository, seed):
+    """
+    get the sensor data transactions with bin indices that are assigned in the database, the equal-frequency
+    boundaries of each sensor type are calculated once in the database as well
+    """
+    sensor_name_list = sensor_data_repository.get_sensor_name_list(subsample, seed)
+    with profiler.stage("timescaledb_discretization"):
+        discretizer = Discretizer(num_bins, boundaries=sensor_data_repository.get_discrete_boundaries(
+            transaction_period, num_bins, sensor_name_list))
+    sensor_data = sensor_data_repository.stream_binned_data_by_time(transaction_period, discretizer.boundaries,
+                                                                    sensor_name_list, itersize=itersize)
+    with profiler.stage("timescaledb_fetch_and_conversion"):
+        return grouped_binned_timeseries_to_transactions(sensor_data, discretizer, ItemVocabulary())
+
+
+def create_tsnarm(algorithm):
+    if algorithm == "de":
+        optimizer = DifferentialEvolution(population_size, differential_weight=0.5, crossover_probability=0.9)
+    elif algorithm == "ga":
+        optimizer = GeneticAlgorithm(population_size, mutation_rate=0.01, crossover_rate=0.8)
+    elif algorithm == "pso":
+        optimizer = ParticleSwarmOptimization(population_size, c1=0.1, c2=0.1, w=0.8)
+    elif algorithm == "lshade":
+        optimizer = SuccessHistoryAdaptiveDifferentialEvolution(population_size)
+    else:
+        optimizer = SelfAdaptiveDifferentialEvolution(population_size, tao1=0.1, crossover_probability=0.9,
+                                                      differential_weight=0.5)
+    return TSNARM(optimizer, max_evals)
+
+
+def run_algorithm(algorithm, run_index):
+    """
+    run a single algorithm on the preprocessed data of the given run
+    :return: (rules, stats) of the algorithm, stats is None if no rules are found
+    """
+    with profiler.stage("total", algorithm, run_index):
+        return execute_algorithm(algorithm, run_index)
+
+
+def execute_algorithm(algorithm, run_index):
+    """
+    run_algorithm without the total time measurement, each stage of the algorithm is measured separately
+    """
+    data = run_data[run_index]
+    knowledge_graph, transactions = data['knowledge_graph'], data['transactions']
+    print("Running", algorithm, "- run", (run_index + 1), "/", num_runs)
+
+    if algorithm in tsnarm_algorithms:
+        # optimization-based ARM
+        with profiler.stage("rule_mining", algorithm, run_index):
+            algorithm_stats, rules = create_tsnarm(algorithm).learn_rules(knowledge_graph, transactions,
+                                                                          data['sensor_nodes'],
+                                                                          data['tsnarm_dataset'])
+        if rules is False or len(rules) == 0:
+            return [], None
+        return rules, algorithm_stats
+
+    if algorithm in ["fpgrowth", "hmine"]:
+        # Naive SemRL with FP-Growth and HMine, on the transactions that are enriched and encoded once per run
+        # this line just changes the encoding of the transactions in a way that is easier to deconstruct rules
+        # non_enriched_transactions = transactions_without_semantics(transactions, num_bins)
+        naive_semrl = NaiveSemRL(min_support, min_confidence, num_bins, max_antecedent, algorithm,
+                                 sparse=naive_semrl_sparse)
+        with profiler.stage("rule_mining", algorithm, run_index):
+            rules, exec_time, coverage = naive_semrl.mine_rules(data['naive_semrl_transactions'],
+                                                                transactions.vocabulary, data['naive_semrl_encoding'])
+        if len(rules) == 0:
+            return [], None
+        with profiler.stage("evaluation", algorithm, run_index):
+            algorithm_stats = evaluate_rules(rules, exec_time, 0)
+        if algorithm == "fpgrowth":
+            return rules, algorithm_stats + [coverage]
+        return rules, algorithm_stats
+
+    if algorithm == "aerial":
+        # Our AE-based ARM approach
+        our_ae_based_arm = Aerial(num_bins, num_neighbors, max_antecedent, similarity_threshold, epochs=aerial_epochs,
+                                  batch_size=aerial_batch_size, sparse=aerial_sparse,
+                                  fine_tune_epochs=aerial_fine_tune_epochs)
+        # each run has its own checkpoint, as the (subsampled) sensors and therefore the input layout differ per run
+        model = dataset + "_" + str(run_index) if aerial_incremental else dataset
+        sensor_discretizer = data['sensor_discretizer']
+        if aerial_incremental:
+            # the transactions are binned with the boundaries of the checkpoint, if there is one, so that the input
+            # layout stays the same when new transactions are added
+            checkpoint_discretizer = our_ae_based_arm.load_discretizer(model, transactions)
+            if checkpoint_discretizer is not None:
+                sensor_discretizer = checkpoint_discretizer
+        with profiler.stage("enrichment", algorithm, run_index):
+            our_ae_based_arm.create_input_vectors(knowledge_graph, transactions, sensor_discretizer,
+                                                  data['neighborhood_index'], data['sensor_nodes'],
+                                                  data['node_encoder'])
+        with profiler.stage("training", algorithm, run_index):
+            our_ae_based_arm.train(model, incremental=aerial_incremental, registry=model_registry)
+        with profiler.stage("rule_extraction", algorithm, run_index):
+            rules, ae_exec_time, ae_training_time = our_ae_based_arm.generate_rules()
+        with profiler.stage("rule_quality", algorithm, run_index):
+            rules, ae_coverage = our_ae_based_arm.calculate_stats(rules, transactions)
+        with profiler.stage("reformat", algorithm, run_index):
+            rules = our_ae_based_arm.reformat_rules(rules)
+        if len(rules) == 0:
+            return [], None
+        with profiler.stage("evaluation", algorithm, run_index):
+            return rules, evaluate_rules(rules, ae_exec_time, ae_training_time) + [ae_coverage]
+
+    # ARM-AE from Berteloot et al. (2023)
+    with profiler.stage("enrichment", algorithm, run_index):
+        input_vectors = enrich_transactions_arm_ae(knowledge_graph, transactions, num_bins, num_neighbors,
+                                                   discretizer=data['sensor_discretizer'],
+                                                   neighborhood_index=data['neighborhood_index'],
+                                                   sensor_nodes=data['sensor_nodes'], node_encoder=data['node_encoder'])
+    with profiler.stage("training", algorithm, run_index):
+        arm_ae = ARMAE(len(input_vectors.loc[0]))
+        dataLoader = arm_ae.dataPreprocessing(input_vectors)
+        arm_ae.train(dataLoader)
+    # rule quality is calculated as part of the rule extraction
+    with profiler.stage("rule_extraction", algorithm, run_index):
+        arm_ae.generateRules(input_vectors, numberOfRules=2, nbAntecedent=max_antecedent)
+    if len(arm_ae.results) == 0:
+        return [], None
+    with profiler.stage("evaluation", algorithm, run_index):
+        arm_ae_stats = evaluate_rules(arm_ae.results, arm_ae.exec_time, arm_ae.arm_ae_training_time)
+    return arm_ae.results, arm_ae_stats + [round((arm_ae.dataset_coverage.sum()) / len(input_vectors), 2)]
+
+
+def collect_stats(stats, algorithm, rules, algorithm_stats):
+    """
+    add the result of a single run of an algorithm to the stats, the rules of all the runs are kept for Naive SemRL
+    and Aerial, and only the rules of the last run for the others
+    """
+    if algorithm_stats is None:
+        return
+    stats[algorithm]["stats"].append(algorithm_stats)
+    if algorithm in ["fpgrowth", "hmine", "aerial"]:
+        stats[algorithm]["rules"].append(rules)
+    else:
+        stats[algorithm]["rules"] = rules
+
+
+def initialize_worker(data):
+    """
+    initialize a worker process with the preprocessed data of all the runs, each worker uses a single thread for
+    PyTorch, as the parallelism comes from the worker processes
+    """
+    global run_data
+    run_data = data
+    torch.set_num_threads(1)
 
 
-def save_results(results):
+def run_job(algorithm, run_index):
+    """
+    run_algorithm in a worker process, the stage measurements of the job are returned together with its result, as
+    each worker has its own copy of the profiler
+    """
+    first_record = len(profiler.records)
+    result = run_algorithm(algorithm, run_index)
+    return result, profiler.records[first_record:]
+
+
+def run_jobs(jobs, workers):
+    """
+    run the given (algorithm, run index) jobs in a pool of "workers" processes, or one after another in the current
+    process if workers is 1
+    :return: dictionary of (rules, stats) per job
+    """
+    if workers <= 1:
+        return {job: run_algorithm(*job) for job in jobs}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker, initargs=(run_data,)) as executor:
+        futures = {executor.submit(run_job, *job): job for job in jobs}
+        for future in as_completed(futures):
+            results[futures[future]], records = future.result()
+            profiler.records += records
+            print("Finished", futures[future][0], "- run", (futures[future][1] + 1), "/", num_runs)
+    return results
+
+
+def save_results(results, stage_profiler=None):
+    """
+    save the rule quality evaluation results, and the time and memory usage per stage if a profiler is given, into
+    CSV files
+    """
     timestamp = datetime.now().strftime("%m-%d-%Y_%H:%M:%S")
-    dataset = os.getenv("TIMESCALEDB_TABLE")
     print("\nRESULTS: Rule quality evaluation results for the dataset", dataset)
     with open(dataset + "_" + timestamp + '.csv', 'w+', newline='') as csvfile:
         writer = csv.writer(csvfile, delimiter=',', quoting=csv.QUOTE_MINIMAL)
@@ -81,122 +369,102 @@ def save_results(results):
             writer.writerow(row)
     print("\nSAVED: The results are saved into '", dataset + "_" + timestamp + ".csv' file.")
 
+    if stage_profiler is not None:
+        print("\nSTAGES: Total wall time per stage (s)")
+        for (algorithm, stage), wall_time in stage_profiler.get_summary().items():
+            print(algorithm or "preprocessing", stage, round(wall_time, 2))
+        stage_profiler.save(dataset + "_" + timestamp + "_stages.csv")
+        print("\nSAVED: The stages are saved into '", dataset + "_" + timestamp + "_stages.csv' file.")
+
 
 if __name__ == "__main__":
     print_params()
-    node_repository = NodeRepository()
-
-    # sensor data
-    sensor_data_repository = SensorDataRepository()
+    if data_source == "file":
+        node_repository = NodeFileRepository()
+        # sensor data
+        sensor_data_repository = SensorDataFileRepository(node_repository=node_repository)
+    else:
+        node_repository = NodeRepository()
+        # sensor data
+        sensor_data_repository = SensorDataRepository()
 
     # create nodes on the KG for sensors, if they don't exist already
     unique_sensor_ids = sensor_data_repository.get_unique_sensor_ids()
-    for sensor in unique_sensor_ids:
-        node_repository.add_sensor(sensor[0], sensor[1])
-
-    # initialize algorithms
-    fp_growth = NaiveSemRL(min_support, min_confidence, num_bins, max_antecedent, "fpgrowth")
-    hmine = NaiveSemRL(min_support, min_confidence, num_bins, max_antecedent, "hmine")
-    our_ae_based_arm = OurAEBasedARM(num_bins, num_neighbors, max_antecedent, similarity_threshold)
-    de = TSNARM(DifferentialEvolution(population_size, differential_weight=0.5, crossover_probability=0.9), max_evals)
-    ga = TSNARM(GeneticAlgorithm(population_size, mutation_rate=0.01, crossover_rate=0.8), max_evals)
-    pso = TSNARM(ParticleSwarmOptimization(population_size, c1=0.1, c2=0.1, w=0.8), max_evals)
-    lshade = TSNARM(SuccessHistoryAdaptiveDifferentialEvolution(population_size), max_evals)
-    jde = TSNARM(SelfAdaptiveDifferentialEvolution(population_size, tao1=0.1, crossover_probability=0.9,
-                                                   differential_weight=0.5), max_evals)
+    node_repository.add_sensors(unique_sensor_ids)
 
-    stats = {"fpgrowth": {'rules': [], 'stats': []}, "hmine": {'rules': [], 'stats': []},
-             "de": {'rules': [], 'stats': []}, "ga": {'rules': [], 'stats': []}, "pso": {'rules': [], 'stats': []},
-             "lshade": {'rules': [], 'stats': []}, "jde": {'rules': [], 'stats': []},
-             "aerial": {'rules': [], 'stats': []}, "arm_ae": {'rules': [], 'stats': []}}
+    # the KG and the transactions are cached on disk per KG version, if a cache directory is given
+    cache = DataCache(cache_directory) if cache_directory else None
+    graph_version = node_repository.get_graph_version()
 
-    # run each of the algorithms "num_runs" time and calculate the average
-    for i in range(num_runs):
-        print("Number of executions: ", (i + 1), "/", os.getenv("NUM_OF_RUNS"))
-        current_iteration_stats = []
-        # knowledge graph
-        knowledge_graph_neo4j = node_repository.get_all_nodes_with_relations()
-        # convert KG to networkx format for ease of processing
-        knowledge_graph_networkx = neo4j_to_networkx(knowledge_graph_neo4j)
+    # the k-hop neighborhoods of the KG nodes are indexed once, as the KG is the same in all the runs
+    neighborhood_index = None
 
-        # get grouped sensor data by time, and the function also filters sensors due to time and space complexity of the
-        # FP-growth-based Naive SemRL algorithm.
-        sensor_data = sensor_data_repository.get_grouped_data_by_time(transaction_period, subsample=10)
-        # encode sensor data as transactions, by coupling sensor measurements with sensor id and sensor type
-        transactions = timeseries_to_transactions(sensor_data)
+    # preprocess the KG and the transactions of each run once, they are shared read-only by all the algorithms
+    for i in range(num_runs):
+        print("Preprocessing run: ", (i + 1), "/", os.getenv("NUM_OF_RUNS"))
+        # knowledge graph and sensor data, each run uses a different (seeded) random sensor subsample
+        with profiler.stage("knowledge_graph", run=i):
+            knowledge_graph_networkx = get_knowledge_graph(node_repository, cache, graph_version)
+        seed = subsample_seed + i if subsample_seed is not None else None
+        with profiler.stage("transactions", run=i):
+            transactions = get_transactions(sensor_data_repository, cache, graph_version, seed)
 
         # filter the kg properties (to include useful props only),
         # but keep the name as an identifier of the nodes which won't be used in the learning
-        knowledge_graph = filter_knowledge_graph_props(knowledge_graph_networkx,
-                                                       categorical_attributes + numerical_attributes + ["name"])
+        with profiler.stage("filter_knowledge_graph_props", run=i):
+            knowledge_graph = filter_knowledge_graph_props(knowledge_graph_networkx,
+                                                           categorical_attributes + numerical_attributes + ["name"])
 
         # discretize numerical attributes in the knowledge graph
-        knowledge_graph = discretize_numerical_attributes(knowledge_graph, numerical_attributes, num_bins)
+        with profiler.stage("kg_discretization", run=i):
+            knowledge_graph = discretize_numerical_attributes(knowledge_graph, numerical_attributes, num_bins)
 
-        tracemalloc.start()
+        # fit the boundaries of the sensor measurement bins once per run, they are shared by all the algorithms
+        with profiler.stage("sensor_discretization", run=i):
+            sensor_discretizer = calculate_discrete_boundaries(transactions, num_bins)
+        if neighborhood_index is None and num_neighbors > 0:
+            with profiler.stage("neighborhood_index", run=i):
+                neighborhood_index = NeighborhoodIndex(knowledge_graph, num_neighbors)
+        # the node of each sensor and its attributes are looked up once per run, as the sensors differ per run
+        with profiler.stage("sensor_node_table", run=i):
+            sensor_nodes = SensorNodeTable(knowledge_graph, transactions)
+        # one-hot encoding of the KG node attributes for the AE-based methods, with the vocabulary of the run
+        with profiler.stage("node_feature_encoder", run=i):
+            node_encoder = NodeFeatureEncoder(knowledge_graph, categorical_attributes + numerical_attributes,
+                                              transactions.vocabulary)
+        data = {'knowledge_graph': knowledge_graph, 'transactions': transactions,
+                'sensor_discretizer': sensor_discretizer, 'neighborhood_index': neighborhood_index,
+                'sensor_nodes': sensor_nodes, 'node_encoder': node_encoder, 'tsnarm_dataset': None,
+                'naive_semrl_transactions': None, 'naive_semrl_encoding': None}
+        # the enriched dataset of TS-NARM is the same for all the optimization algorithms
+        if any(algorithm in tsnarm_algorithms for algorithm in algorithms):
+            with profiler.stage("enrichment", "ts-narm", i):
+                data['tsnarm_dataset'] = TSNARM.create_dataset(knowledge_graph, transactions, sensor_nodes)
+        # the enriched and one-hot encoded transactions of Naive SemRL are shared by FP-Growth and H-Mine
+        if "fpgrowth" in algorithms or "hmine" in algorithms:
+            with profiler.stage("enrichment", "naive_semrl", i):
+                data['naive_semrl_transactions'] = enrich_transactions_naivesemrl(knowledge_graph, transactions,
+                                                                                  num_bins, sensor_discretizer,
+                                                                                  sensor_nodes)
+            with profiler.stage("encoding", "naive_semrl", i):
+                data['naive_semrl_encoding'] = NaiveSemRL.encode_transactions(data['naive_semrl_transactions'],
+                                                                              naive_semrl_sparse)
+        run_data.append(data)
 
-        # optimization-based ARM
-        de_stats, de_rules = de.learn_rules(knowledge_graph, transactions)
-        ga_stats, ga_rules = ga.learn_rules(knowledge_graph, transactions)
-        pso_stats, pso_rules = pso.learn_rules(knowledge_graph, transactions)
-        lshade_stats, lshade_rules = lshade.learn_rules(knowledge_graph, transactions)
-        jde_stats, jde_rules = jde.learn_rules(knowledge_graph, transactions)
-
-        if len(de_rules) > 0:
-            stats["de"]["stats"].append(de_stats)
-            stats["de"]["rules"] = de_rules
-        if len(de_rules) > 0:
-            stats["ga"]["stats"].append(ga_stats)
-            stats["ga"]["rules"] = ga_rules
-        if len(de_rules) > 0:
-            stats["pso"]["stats"].append(pso_stats)
-            stats["pso"]["rules"] = pso_rules
-        if len(de_rules) > 0:
-            stats["lshade"]["stats"].append(lshade_stats)
-            stats["lshade"]["rules"] = lshade_rules
-        if len(de_rules) > 0:
-            stats["jde"]["stats"].append(jde_stats)
-            stats["jde"]["rules"] = jde_rules
-
-        # Naive SemRL with FP-Growth and HMine
-        enriched_transactions = enrich_transactions_naivesemrl(knowledge_graph, transactions, num_bins)
-        # this line just changes the encoding of the transactions in a way that is easier to deconstruct rules
-        # non_enriched_transactions = transactions_without_semantics(transactions, num_bins)
+    # the databases are not used by the algorithms, close the connections before forking the worker processes
+    sensor_data_repository.close_connection_pools()
+    node_repository.close()
 
-        fpgrowth_rules, fpgrowth_exec_time, fpgrowth_coverage = fp_growth.mine_rules(enriched_transactions)
-        if len(fpgrowth_rules) > 0:
-            stats["fpgrowth"]["rules"].append(fpgrowth_rules)
-            stats["fpgrowth"]["stats"].append(
-                evaluate_rules(fpgrowth_rules, fpgrowth_exec_time, 0) + [fpgrowth_coverage])
-
-        hmine_rules, hmine_exec_time, hmine_coverage = hmine.mine_rules(enriched_transactions)
-        if len(hmine_rules) > 0:
-            stats["hmine"]["rules"].append(hmine_rules)
-            stats["hmine"]["stats"].append(evaluate_rules(hmine_rules, hmine_exec_time, 0))
+    stats = {"fpgrowth": {'rules': [], 'stats': []}, "hmine": {'rules': [], 'stats': []},
+             "de": {'rules': [], 'stats': []}, "ga": {'rules': [], 'stats': []}, "pso": {'rules': [], 'stats': []},
+             "lshade": {'rules': [], 'stats': []}, "jde": {'rules': [], 'stats': []},
+             "aerial": {'rules': [], 'stats': []}, "arm_ae": {'rules': [], 'stats': []}}
 
-        # Our AE-based ARM approach
-        our_ae_based_arm.create_input_vectors(knowledge_graph, transactions)
-        our_ae_based_arm.train(dataset)
-        our_ae_based_arm_association_rules, ae_exec_time, ae_training_time = our_ae_based_arm.generate_rules()
-        our_ae_based_arm_association_rules, ae_coverage = our_ae_based_arm.calculate_stats(
-            our_ae_based_arm_association_rules, transactions)
-        our_ae_based_arm_association_rules = our_ae_based_arm.reformat_rules(our_ae_based_arm_association_rules)
-
-        if len(our_ae_based_arm_association_rules) > 0:
-            stats["aerial"]["rules"].append(our_ae_based_arm_association_rules)
-            stats["aerial"]["stats"].append(
-                evaluate_rules(our_ae_based_arm_association_rules, ae_exec_time, ae_training_time) + [ae_coverage])
-
-        # ARM-AE from Berteloot et al. (2023)
-        input_vectors = enrich_transactions_arm_ae(knowledge_graph, transactions, num_bins, num_neighbors=1)
-        arm_ae = ARMAE(len(input_vectors.loc[0]))
-        dataLoader = arm_ae.dataPreprocessing(input_vectors)
-        arm_ae.train(dataLoader)
-        arm_ae.generateRules(input_vectors, numberOfRules=2, nbAntecedent=max_antecedent)
-        arm_ae_stats = evaluate_rules(arm_ae.results, arm_ae.exec_time, arm_ae.arm_ae_training_time)
-        if len(arm_ae.results) > 0:
-            stats["arm_ae"]["stats"].append(
-                arm_ae_stats + [round((arm_ae.dataset_coverage.sum()) / len(input_vectors), 2)])
-            stats["arm_ae"]["rules"] = arm_ae.results
+    # run each of the algorithms "num_runs" time and calculate the average
+    results = run_jobs([(algorithm, i) for i in range(num_runs) for algorithm in algorithms], max_workers)
+    for i in range(num_runs):
+        for algorithm in algorithms:
+            collect_stats(stats, algorithm, *results[(algorithm, i)])
 
-    save_results(stats)
+    save_results(stats, profiler)
+    calculate_rule_overlap(stats)
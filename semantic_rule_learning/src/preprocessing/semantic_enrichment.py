@@ -1,220 +1,211 @@
 """
 This Python script includes functions related to semantic enrichment of sensor data
 """
+import numpy as np
 import pandas as pd
 from src.preprocessing.base_preprocessing import *
-from src.util.graph_util import get_unique_values
-from src.util.transactions_util import calculate_discrete_boundaries
+from src.util.graph_util import NeighborhoodIndex, NodeFeatureEncoder, SensorNodeTable
+from src.util.transactions_util import calculate_discrete_boundaries, discretize_transactions
 from src.util.vector_util import create_vector_rep_node, create_vector_rep_measurement
 
 
-def enrich_transactions_naivesemrl(knowledge_graph, disc_hist_time_series, num_bins):
+def enrich_transactions_naivesemrl(knowledge_graph, disc_hist_time_series, num_bins, discretizer=None,
+                                   sensor_nodes=None, chunk_size=4096):
     """
     Get grouped transactions from the timeseries database and enrich transactions that contains only sensor data with
     semantics from the knowledge graph. This enrichment is specific to the Naive SemRL approach,
-    because all the values are in the string format, so that they can be one-hot encoded for the exhaustive methods.
+    because all the values are encoded as items of the vocabulary, so that they can be one-hot encoded for the
+    exhaustive methods.
     :param knowledge_graph: knowledge graph in NetworkX format
-    :param disc_hist_time_series: discrete time-series sensor data
+    :param disc_hist_time_series: discrete time-series sensor data in the form of SensorTransactions
     :param num_bins: number of bins to discretize sensor values into
-    :return:
+    :param discretizer: Discretizer with already fitted boundaries per sensor type, calculated if not given
+    :param sensor_nodes: SensorNodeTable of the sensors in disc_hist_time_series, built if not given
+    :param chunk_size: number of transactions that are enriched at once
+    :return: list of transactions, each is an integer array of item ids in the vocabulary of disc_hist_time_series
     """
     # calculate boundaries for the ranges of sensor values, per sensor type
-    boundaries = calculate_discrete_boundaries(disc_hist_time_series, num_bins)
+    if discretizer is None:
+        discretizer = calculate_discrete_boundaries(disc_hist_time_series, num_bins)
+    if sensor_nodes is None:
+        sensor_nodes = SensorNodeTable(knowledge_graph, disc_hist_time_series)
+    bin_indices = discretize_transactions(disc_hist_time_series, discretizer)
+    # items of each sensor and measurement range (the range and the node attributes in that range), which are
+    # gathered by the sensor and bin index of each measurement
+    item_table = sensor_nodes.get_item_table(disc_hist_time_series, discretizer)
+    columns = np.arange(len(disc_hist_time_series.sensors))
     enriched_transactions = []
-    for transaction in disc_hist_time_series:
-        new_transaction = []
-        # new_transaction += transaction
-        for item in transaction:
-            sensor_id = item.split("_name_", 1)[1].split('_end_')[0]
-            measurement = float(item.split("_", 1)[0])
-            sensor_type = item.split("_type_")[1].split('_end_')[0]
-            node = knowledge_graph.nodes[list(knowledge_graph.neighbors(sensor_id))[0]]
-            current_node_attributes = [('s_key_' + key + "_end__value_" + str(node['properties'][key]) + "_end_") for
-                                       key in
-                                       node['properties'].keys() if key != 'name']
-
-            for value_index in range(len(boundaries[sensor_type]) - 1):
-                if boundaries[sensor_type][value_index] <= measurement <= boundaries[sensor_type][value_index + 1]:
-                    measurement = str(boundaries[sensor_type][value_index]) + "_" + \
-                                  str(boundaries[sensor_type][value_index + 1])
-                    break
-
-            # neighbors = get_first_neighbor_with_relations(knowledge_graph, node)
-            # topology = get_topology(node, neighbors)
-            # neighbors_attributes = get_attributes([neighbors])
-
-            new_transaction.append("sensor_type_" + sensor_type + "_end__range_" + measurement + "_end_")
-            for attribute in current_node_attributes:
-                if not attribute.startswith('s_name'):
-                    new_transaction.append(
-                        "sensor_type_" + sensor_type + "_end__range_" + measurement + "_end__attribute_" + attribute + "_end_")
-        enriched_transactions.append(new_transaction)
+    for start in range(0, len(bin_indices), chunk_size):
+        chunk = bin_indices[start:start + chunk_size]
+        items = item_table[columns, np.maximum(chunk, 0)]
+        # missing measurements and the padding of the item table are left out
+        valid = (items >= 0) & (chunk >= 0)[:, :, None]
+        counts = valid.reshape(len(chunk), -1).sum(axis=1)
+        enriched_transactions += np.split(items[valid], np.cumsum(counts)[:-1])
 
     return enriched_transactions
 
 
-def enrich_transactions_tsnarm(knowledge_graph, time_series):
+def enrich_transactions_tsnarm(knowledge_graph, time_series, sensor_nodes=None):
     """
     Get grouped transactions from the timeseries database and enrich transactions that contains only sensor data with
     semantics from the knowledge graph. This enrichment is specific to the Naive SemRL (HHO) approach
     :param knowledge_graph: knowledge graph in NetworkX format
-    :param time_series: time series sensor data
+    :param time_series: time series sensor data in the form of SensorTransactions
+    :param sensor_nodes: SensorNodeTable of the sensors in time_series, built if not given
     :return:
     """
-    enriched_transactions = []
+    if sensor_nodes is None:
+        sensor_nodes = SensorNodeTable(knowledge_graph, time_series)
     column_names = []
-    for item in time_series[0]:
-        sensor_id = item.split("_name_", 1)[1].split('_end_')[0]
-        sensor_type = item.split("_type_")[1].split('_end_')[0]
-        node = knowledge_graph.nodes[list(knowledge_graph.neighbors(sensor_id))[0]]
-        current_node_attributes = [(sensor_id + '--' + key) for key in node['properties'].keys() if key != 'name']
+    measurement_columns = []
+    attribute_columns = []
+    attribute_values = []
+    for column in range(len(time_series.sensors)):
+        sensor_id = time_series.get_sensor_name(column)
+        sensor_type = time_series.get_sensor_type(column)
+        measurement_columns.append(len(column_names))
         column_names.append(sensor_id + "--" + sensor_type)
-        column_names += current_node_attributes
-
-    for transaction in time_series:
-        new_transaction = []
-        for item in transaction:
-            sensor_id = item.split("_name_", 1)[1].split('_end_')[0]
-            measurement = float(item.split("_", 1)[0])
-            node = knowledge_graph.nodes[list(knowledge_graph.neighbors(sensor_id))[0]]
-            current_node_attributes = [node['properties'][key] for key in node['properties'].keys() if key != 'name']
+        for key, value in sensor_nodes.attributes[column]:
+            attribute_columns.append(len(column_names))
+            attribute_values.append(value)
+            column_names.append(sensor_id + '--' + key)
 
-            # neighbors = get_first_neighbor_with_relations(knowledge_graph, node)
-            # topology = get_topology(node, neighbors)
-            # neighbors_attributes = get_attributes([neighbors])
-
-            new_transaction.append(measurement)
-            for attribute in current_node_attributes:
-                new_transaction.append(attribute)
-        enriched_transactions.append(new_transaction)
+    # the node attributes are the same in all the transactions, only the measurements differ
+    enriched_transactions = np.empty((len(time_series), len(column_names)), dtype=object)
+    enriched_transactions[:, measurement_columns] = time_series.values
+    enriched_transactions[:, attribute_columns] = np.array(attribute_values, dtype=object)
+    enriched_transactions = enriched_transactions.tolist()
 
     enriched_transactions.insert(0, column_names)
     return enriched_transactions
 
 
-def transactions_without_semantics(disc_hist_time_series, num_bins):
+def transactions_without_semantics(disc_hist_time_series, num_bins, discretizer=None):
     """
     Get grouped transactions from the timeseries database
-    :param disc_hist_time_series: discrete time-series sensor data
+    :param disc_hist_time_series: discrete time-series sensor data in the form of SensorTransactions
     :param num_bins: number of bins to discretize sensor values into
-    :return:
+    :param discretizer: Discretizer with already fitted boundaries per sensor type, calculated if not given
+    :return: list of transactions, each is an integer array of item ids in the vocabulary of disc_hist_time_series
     """
     # calculate boundaries for the ranges of sensor values, per sensor type
-    boundaries = calculate_discrete_boundaries(disc_hist_time_series, num_bins)
+    if discretizer is None:
+        discretizer = calculate_discrete_boundaries(disc_hist_time_series, num_bins)
+    bin_indices = discretize_transactions(disc_hist_time_series, discretizer)
+    vocabulary = disc_hist_time_series.vocabulary
     enriched_transactions = []
-    for transaction in disc_hist_time_series:
+    for transaction in bin_indices.tolist():
         new_transaction = []
-        for item in transaction:
-            sensor_id = item.split("_name_", 1)[1].split('_end_')[0]
-            measurement = float(item.split("_", 1)[0])
-            sensor_type = item.split("_type_")[1].split('_end_')[0]
+        for column, bin_index in enumerate(transaction):
+            if bin_index < 0:
+                continue
+            sensor_id = disc_hist_time_series.get_sensor_name(column)
+            sensor_type = disc_hist_time_series.get_sensor_type(column)
 
-            for value_index in range(len(boundaries[sensor_type]) - 1):
-                if boundaries[sensor_type][value_index] <= measurement <= boundaries[sensor_type][value_index + 1]:
-                    measurement = str(boundaries[sensor_type][value_index]) + "_" + \
-                                  str(boundaries[sensor_type][value_index + 1])
-                    break
+            measurement_range = discretizer.get_labels(sensor_type)[bin_index]
 
-            new_transaction.append("sensor_type_" + sensor_type + "_end__range_" + measurement +
-                                   "_end__attribute__key_id_end__value_" + sensor_id + "_end_")
-        enriched_transactions.append(new_transaction)
+            new_transaction.append(
+                vocabulary.encode(('range_attribute', sensor_type, measurement_range, 'id', sensor_id)))
+        enriched_transactions.append(np.array(new_transaction, dtype=np.int32))
 
     return enriched_transactions
 
 
-def semantic_enrichment_our_ae_based_arm(knowledge_graph, transactions, num_bins, num_neighbors):
+def semantic_enrichment_our_ae_based_arm(knowledge_graph, transactions, num_bins, num_neighbors, discretizer=None,
+                                         sparse=False, neighborhood_index=None, sensor_nodes=None, node_encoder=None):
     """
     discretize all numerical data and apply one-hot encoding to both categorical and discrete numerical data
     :param knowledge_graph: knowledge graph in NetworkX format
-    :param transactions: discrete timeseries data from sensors in the form of list of transactions
+    :param transactions: discrete timeseries data from sensors in the form of SensorTransactions
     :param num_bins: number of bins to discretize the numerical values into categories
-    :param num_neighbors:
-    :return: list of one-hot encoded vectors representing categorical and discrete numerical data
+    :param num_neighbors: number of hops from the node of each sensor, whose nodes are added as features of the sensor
+    :param discretizer: Discretizer with already fitted boundaries per sensor type, calculated if not given
+    :param sparse: if True, the one-hot encoded vectors are not materialized, and only the indices of the active
+    (value 1) class values are returned per vector as 'active_indices'
+    :param neighborhood_index: NeighborhoodIndex of the knowledge graph, built here if not given
+    :param sensor_nodes: SensorNodeTable of the sensors in transactions, built here if not given
+    :param node_encoder: NodeFeatureEncoder of the knowledge graph with the vocabulary of transactions, built here if
+    not given
+    :return: one-hot encoded vectors representing categorical and discrete numerical data, as a transactions x
+    features matrix in 'vector_list' (or 'active_indices' if sparse)
     """
     # calculate boundaries for the ranges of sensor values, per sensor type
-    boundaries = calculate_discrete_boundaries(transactions, num_bins)
-
-    unique_values_per_attribute = {}
-    # apply one-hot encoding on the categorical attributes (as well as numerical as they are discrete from now on)
-    for node_id in knowledge_graph.nodes:
-        new_props = {}
-        for attribute in categorical_attributes + numerical_attributes:
-            # unique values for an attribute can also be taken from the ontology underlying the KG, if defined
-            if attribute in unique_values_per_attribute:
-                unique_values = unique_values_per_attribute[attribute]
-            else:
-                unique_values = get_unique_values(knowledge_graph, attribute)
-                unique_values_per_attribute[attribute] = unique_values
-            # one-hot encoding on the attribute
-            # mark categorical attributes with the "cat_" prefix
-            if attribute in knowledge_graph.nodes[node_id]['properties']:
-                for value in unique_values:
-                    new_props[attribute + "_" + value] = 0
-                new_props[attribute + "_" + knowledge_graph.nodes[node_id]['properties'][attribute]] = 1
-        # the "name" attribute is listed, just to use it as an identifier, when finding the neighbors of each node,
-        # and it won't be included in the learning process
-        new_props['name'] = knowledge_graph.nodes[node_id]['properties']['name']
-        knowledge_graph.nodes[node_id]['properties'] = new_props
+    if discretizer is None:
+        discretizer = calculate_discrete_boundaries(transactions, num_bins)
+    bin_indices = discretize_transactions(transactions, discretizer)
+    vocabulary = transactions.vocabulary
+    if sensor_nodes is None:
+        sensor_nodes = SensorNodeTable(knowledge_graph, transactions)
+    if num_neighbors > 0 and (neighborhood_index is None or neighborhood_index.max_degree < num_neighbors):
+        neighborhood_index = NeighborhoodIndex(knowledge_graph, num_neighbors)
+
+    # one-hot encoding of the categorical attributes (as well as numerical as they are discrete from now on)
+    # the one-hot encoded attributes are keyed by their item id in the vocabulary
+    if node_encoder is None:
+        node_encoder = NodeFeatureEncoder(knowledge_graph, categorical_attributes + numerical_attributes, vocabulary)
 
     # create vector representations of sensor values, numerical and categorical value from the KG
-    vector_list = []
-    vector_tracker_list = []
-    input_vector_category_indices = []
-
-    for transaction in transactions:
-        vector_tracker = []
-        vector = []
-        feature_tracker = []
-        feature_tracker_start_index = 0
-        for index in range(len(transaction)):
-            item = transaction[index]
-            sensor_id = item.split("_name_", 1)[1].split('_end_')[0]
-            measurement = float(item.split("_", 1)[0])
-            sensor_type = item.split("_type_")[1].split('_end_')[0]
-            node = knowledge_graph.nodes[list(knowledge_graph.neighbors(sensor_id))[0]]
-
-            postfix = "_item_" + str(index)
-
-            # neighbors = get_neighbors(knowledge_graph, node, num_neighbors)
-            # for neighbor_degree in neighbors.keys():
-            #     for neighbor_index in range(len(neighbors[neighbor_degree])):
-            #         values, indices = create_vector_rep_node(neighbors[neighbor_degree][neighbor_index],
-            #                                                  "--" + str(neighbor_degree) + "--" + str(
-            #                                                      neighbor_index) + "--" + postfix)
-            #         vector += values
-            #         vector_tracker += indices
-            #         feature_tracker.append(
-            #             {'start': feature_tracker_start_index, 'end': feature_tracker_start_index + len(values)})
-            #         feature_tracker_start_index += len(values)
-
-            values, indices = create_vector_rep_measurement(measurement, boundaries, sensor_type, postfix)
-            vector += values
-            vector_tracker += indices
-            feature_tracker.append(
-                {'start': feature_tracker_start_index, 'end': feature_tracker_start_index + len(values)})
-            feature_tracker_start_index += len(values)
-
-            values, indices = create_vector_rep_node(node, postfix)
-            vector += values
-            vector_tracker += indices
-            feature_tracker.append(
-                {'start': feature_tracker_start_index, 'end': feature_tracker_start_index + len(values)})
-            feature_tracker_start_index += len(values)
-
-        vector_list.append(vector)
-        vector_tracker_list.append(vector_tracker)
-        input_vector_category_indices.append(feature_tracker)
-
-    return {
-        'vector_list': vector_list,
-        'vector_tracker_list': vector_tracker_list,
-        'category_indices': input_vector_category_indices
+    # the layout of the vectors (the vector index and the class values of each feature) is the same for all the
+    # transactions, therefore it is created once, and only the marked measurement ranges differ per transaction
+    vector_tracker = []
+    feature_tracker = []
+    node_vector = []
+    measurement_starts = []
+    for index in range(len(transactions.sensors)):
+        sensor_type = transactions.get_sensor_type(index)
+        node_name = sensor_nodes.node_names[index]
+
+        # features of the k-hop neighbors of the node, each neighbor is a separate feature, positioned by the
+        # position of the sensor, the degree of the neighbor and its index among the neighbors of that degree
+        neighbors = neighborhood_index.get_neighbors(node_name)[:num_neighbors] if num_neighbors > 0 else []
+        for degree, neighbor_names in enumerate(neighbors):
+            for neighbor_index, neighbor_name in enumerate(neighbor_names):
+                values, indices = create_vector_rep_node(neighbor_name, node_encoder, (index, degree, neighbor_index),
+                                                         vocabulary)
+                if len(values) == 0:
+                    continue
+                feature_tracker.append({'start': len(vector_tracker), 'end': len(vector_tracker) + len(values)})
+                vector_tracker += indices
+                node_vector += values
+
+        # the measurement is marked per transaction below
+        values, indices = create_vector_rep_measurement(-1, discretizer, sensor_type, index, vocabulary)
+        measurement_starts.append(len(vector_tracker))
+        feature_tracker.append({'start': len(vector_tracker), 'end': len(vector_tracker) + len(values)})
+        vector_tracker += indices
+        node_vector += values
+
+        values, indices = create_vector_rep_node(node_name, node_encoder, index, vocabulary)
+        feature_tracker.append({'start': len(vector_tracker), 'end': len(vector_tracker) + len(values)})
+        vector_tracker += indices
+        node_vector += values
+
+    # vector index of the marked measurement range per transaction and sensor, missing measurements are not marked
+    measurement_indices = np.array(measurement_starts, dtype=np.int64) + bin_indices
+    measured = bin_indices >= 0
+    node_vector = np.array(node_vector, dtype=float)
+
+    input_vectors = {
+        'vector_tracker_list': [vector_tracker] * len(bin_indices),
+        'category_indices': [feature_tracker] * len(bin_indices)
     }
-
-
-def enrich_transactions_arm_ae(knowledge_graph, transactions, num_bins, num_neighbors):
-    input_vectors = semantic_enrichment_our_ae_based_arm(knowledge_graph, transactions, num_bins, num_neighbors)
-    transactions = []
-    for vector in input_vectors["vector_list"]:
-        transactions.append([True if number != 0 else False for number in vector])
-    return pd.DataFrame(transactions, columns=input_vectors['vector_tracker_list'][0])
+    if sparse:
+        node_indices = np.flatnonzero(node_vector)
+        input_vectors['active_indices'] = [
+            np.sort(np.concatenate([measurement_indices[row][measured[row]], node_indices]))
+            for row in range(len(bin_indices))]
+    else:
+        vectors = np.tile(node_vector, (len(bin_indices), 1))
+        rows = np.broadcast_to(np.arange(len(bin_indices))[:, None], bin_indices.shape)
+        vectors[rows[measured], measurement_indices[measured]] = 1
+        input_vectors['vector_list'] = vectors
+    return input_vectors
+
+
+def enrich_transactions_arm_ae(knowledge_graph, transactions, num_bins, num_neighbors, discretizer=None,
+                               neighborhood_index=None, sensor_nodes=None, node_encoder=None):
+    input_vectors = semantic_enrichment_our_ae_based_arm(knowledge_graph, transactions, num_bins, num_neighbors,
+                                                         discretizer, neighborhood_index=neighborhood_index,
+                                                         sensor_nodes=sensor_nodes, node_encoder=node_encoder)
+    return pd.DataFrame(input_vectors['vector_list'] != 0, columns=input_vectors['vector_tracker_list'][0])
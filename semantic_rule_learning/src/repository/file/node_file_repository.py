@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import random
+
+import networkx as nx
+from networkx.readwrite import json_graph
+
+
+class NodeFileRepository:
+    """
+    File-based alternative of the NodeRepository, with the same interface, that reads the knowledge graph from a
+    GraphML file or a JSON file in the NetworkX node-link format instead of Neo4j. The properties of a node are its
+    attributes in the file, the node id is used as its name if it has neither a name nor an id property, and
+    the "type" property is its label (as in the graphdb module). Sensors that are added are kept in memory only
+    """
+
+    # graphs per file, shared by all the repository instances as the Neo4j database is, so that the sensors added
+    # by one instance are also seen by the others
+    graphs = {}
+
+    def __init__(self, path=None):
+        """
+        :param path: path of the .graphml or .json file, KNOWLEDGE_GRAPH_FILE in .env if not given
+        """
+        self.path = path or os.getenv("KNOWLEDGE_GRAPH_FILE")
+
+    @property
+    def graph(self):
+        """
+        Read the knowledge graph file as an undirected graph, if not read yet
+        """
+        if self.path not in NodeFileRepository.graphs:
+            if self.path.endswith(".json"):
+                with open(self.path) as file:
+                    graph = json_graph.node_link_graph(json.load(file), directed=False, multigraph=False)
+            else:
+                graph = nx.Graph(nx.read_graphml(self.path))
+            for node_id, properties in graph.nodes(data=True):
+                if 'name' not in properties and 'id' not in properties:
+                    properties['name'] = node_id
+                properties.setdefault('type', 'Node')
+            with open(self.path, 'rb') as file:
+                graph.graph['digest'] = hashlib.sha256(file.read()).hexdigest()
+            NodeFileRepository.graphs[self.path] = graph
+        return NodeFileRepository.graphs[self.path]
+
+    def close(self):
+        """
+        Release the graph that is read from the file, it is read again on the next use
+        """
+        NodeFileRepository.graphs.pop(self.path, None)
+
+    def get_all_nodes(self):
+        return json.dumps([{'n': properties} for _, properties in self.graph.nodes(data=True)])
+
+    def get_all_nodes_with_relations(self):
+        """
+        Same as the "MATCH (s)-[r]-(d) RETURN s,r,d" query, each relation is returned in both directions
+        """
+        result = []
+        for source, destination in self.graph.edges():
+            source_properties, destination_properties = self.graph.nodes[source], self.graph.nodes[destination]
+            result.append({'s': source_properties, 'r': (source_properties, destination_properties),
+                           'd': destination_properties})
+            result.append({'s': destination_properties, 'r': (destination_properties, source_properties),
+                           'd': source_properties})
+        return result
+
+    def add_sensor(self, object_id, sensor_type):
+        self.add_sensors([(object_id, sensor_type)])
+
+    def add_sensors(self, sensors):
+        """
+        Add a sensor node for each (object_id, sensor_type) pair, placed in the node that the object id refers to,
+        if the sensor doesn't exist already
+        """
+        node_ids = {properties.get('name', properties.get('id')): node_id for node_id, properties in
+                    self.graph.nodes(data=True)}
+        for object_id, sensor_type in sensors:
+            node_id = node_ids.get(
+                object_id.replace('s_', '', 1).replace('demand', '').replace('pressure', '').replace('flow', ''))
+            if node_id is None or object_id in node_ids:
+                continue
+            self.graph.add_node(object_id, name=object_id, type='Sensor', measurement_aspect=sensor_type)
+            self.graph.add_edge(object_id, node_id)
+            node_ids[object_id] = object_id
+
+    def get_graph_version(self):
+        """
+        Get a fingerprint of the current state of the KG, based on the number of nodes and relations and on the
+        content of the file
+        """
+        return str(self.graph.number_of_nodes()) + "_" + str(self.graph.number_of_edges()) + "_" + \
+            self.graph.graph['digest'][:16]
+
+    def get_random_sensor_subgraph(self, sensor_node_count, seed=None):
+        """
+        Same as NodeRepository.get_random_sensor_subgraph, the sensors closest to a random starting sensor are
+        returned, in the order of their distance (and name)
+        """
+        sensors = sorted((node_id for node_id, properties in self.graph.nodes(data=True) if
+                          properties['type'] == 'Sensor' and self.graph.degree(node_id) > 0), key=str)
+        if len(sensors) == 0:
+            return []
+        start = random.Random(seed).choice(sensors)
+        distances = nx.single_source_shortest_path_length(self.graph, start)
+        neighbors = sorted(((distance, str(node_id)), node_id) for node_id, distance in distances.items() if
+                           node_id != start and self.graph.nodes[node_id]['type'] == 'Sensor')
+        return [self.graph.nodes[node_id].get('name', node_id) for _, node_id in neighbors[:sensor_node_count]]
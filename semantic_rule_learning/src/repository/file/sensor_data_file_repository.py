@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.repository.file.node_file_repository import NodeFileRepository
+
+# time_bucket_gapfill aligns the buckets to this origin by default (a Monday)
+BUCKET_ORIGIN = pd.Timestamp("2000-01-03")
+
+
+class SensorDataFileRepository:
+    """
+    File-based alternative of the SensorDataRepository, with the same interface, that reads the sensor data from a
+    Parquet or CSV file with time, name, value and sensor_type columns (as in the TimescaleDB tables) instead of
+    TimescaleDB. The time bucketing and the gap filling of the time_bucket_gapfill query are done with pandas
+    """
+
+    # sensor data per file, shared by all the repository instances
+    frames = {}
+
+    def __init__(self, path=None, node_repository=None):
+        """
+        :param path: path of the .parquet or .csv file, SENSOR_DATA_FILE in .env if not given
+        :param node_repository: repository of the knowledge graph to take the random sensor subsamples from
+        """
+        self.path = path or os.getenv("SENSOR_DATA_FILE")
+        self.node_repository = node_repository if node_repository is not None else NodeFileRepository()
+
+    @property
+    def data(self):
+        """
+        Read the sensor data file, if not read yet
+        """
+        if self.path not in SensorDataFileRepository.frames:
+            if self.path.endswith(".parquet"):
+                frame = pd.read_parquet(self.path, columns=["time", "name", "value", "sensor_type"])
+            else:
+                frame = pd.read_csv(self.path, usecols=["time", "name", "value", "sensor_type"])
+            frame["time"] = pd.to_datetime(frame["time"])
+            SensorDataFileRepository.frames[self.path] = frame
+        return SensorDataFileRepository.frames[self.path]
+
+    @staticmethod
+    def close_connection_pools():
+        """
+        Release the sensor data that is read from the files, it is read again on the next use
+        """
+        SensorDataFileRepository.frames = {}
+
+    def clear_metadata_cache(self):
+        pass
+
+    def get_all_data(self):
+        return list(self.data[["time", "name", "value", "sensor_type"]].itertuples(index=False, name=None))
+
+    def get_data_by_sensor(self, object_id):
+        data = self.data
+        return list(data.loc[data["name"] == object_id, ["time", "name", "value", "sensor_type"]]
+                    .itertuples(index=False, name=None))
+
+    def get_grouped_data_by_time(self, time_interval_in_minutes: int, precision: int = 0, subsample: int = 0):
+        return [row for _, rows in self.stream_grouped_data_by_time(time_interval_in_minutes, precision, subsample)
+                for row in rows]
+
+    def stream_grouped_data_by_time(self, time_interval_in_minutes: int, precision: int = 0, subsample: int = 0,
+                                    itersize: int = 10000, seed: int = None):
+        """
+        Same as SensorDataRepository.stream_grouped_data_by_time: the average measurement of each sensor per time
+        bucket, rounded to an integer, and 0 for the buckets without measurements, between the first and the last
+        measurement of the table
+        :param itersize: not used, as the whole file is in memory
+        :return: generator of (time_interval, rows of the time bucket) pairs
+        """
+        sensor_name_list = self.get_sensor_name_list(subsample, seed) if subsample > 0 else None
+        buckets, sensors, values = self.get_averages(time_interval_in_minutes, sensor_name_list)
+        for bucket_index, time_interval in enumerate(buckets):
+            yield time_interval, [(time_interval, values[bucket_index, column], name, sensor_type) for
+                                  column, (name, sensor_type) in enumerate(sensors)]
+
+    def get_averages(self, time_interval_in_minutes: int, sensor_name_list=None):
+        """
+        :param sensor_name_list: sensors to include, all the sensors if not given
+        :return: time buckets, (name, sensor_type) pairs and the buckets x sensors matrix of the average measurements
+        """
+        data = self.data
+        if sensor_name_list is not None:
+            data = data[data["name"].isin(sensor_name_list)]
+        start, end = self.get_mix_max_time()
+        if len(data) == 0 or pd.isna(start):
+            return [], [], np.empty((0, 0))
+
+        interval = pd.Timedelta(minutes=time_interval_in_minutes)
+        origin = BUCKET_ORIGIN.tz_localize(start.tz) if start.tz is not None else BUCKET_ORIGIN
+        first_bucket = origin + ((start - origin) // interval) * interval
+        buckets = pd.date_range(first_bucket, end, freq=interval)
+        averages = data["value"].groupby([origin + ((data["time"] - origin) // interval) * interval, data["name"],
+                                          data["sensor_type"]]).mean()
+        sensors = averages.index.droplevel(0).unique().sort_values()
+        # every sensor has a value in every bucket, as with time_bucket_gapfill
+        averages = averages.unstack([1, 2]).reindex(index=buckets, columns=sensors)
+        # round half away from zero, as the numeric round of PostgreSQL
+        values = averages.to_numpy(dtype=float)
+        values = np.where(np.isnan(values), 0, np.sign(values) * np.floor(np.abs(values) + 0.5))
+        return list(buckets.to_pydatetime()), list(sensors), values
+
+    def get_sensor_name_list(self, subsample: int = 0, seed: int = None):
+        if subsample > 0:
+            return self.node_repository.get_random_sensor_subgraph(subsample, seed)
+        return [row[0] for row in self.get_unique_sensor_names()]
+
+    def get_discrete_boundaries(self, time_interval_in_minutes: int, num_bins: int, sensor_name_list):
+        """
+        Same as SensorDataRepository.get_discrete_boundaries, the linear interpolation of np.quantile is the same as
+        percentile_cont
+        """
+        _, sensors, values = self.get_averages(time_interval_in_minutes, sensor_name_list)
+        sensor_types = np.array([sensor_type for _, sensor_type in sensors])
+        return {sensor_type: np.quantile(values[:, sensor_types == sensor_type],
+                                         np.linspace(0, 1, num_bins + 1)).tolist()
+                for sensor_type in dict.fromkeys(sensor_types.tolist())}
+
+    def stream_binned_data_by_time(self, time_interval_in_minutes: int, boundaries, sensor_name_list,
+                                   itersize: int = 10000):
+        """
+        Same as SensorDataRepository.stream_binned_data_by_time, an average that is equal to a boundary is assigned
+        to the lower bin
+        :param itersize: not used, as the whole file is in memory
+        """
+        buckets, sensors, values = self.get_averages(time_interval_in_minutes, sensor_name_list)
+        bins = np.full(values.shape, None, dtype=object)
+        for column, (_, sensor_type) in enumerate(sensors):
+            if sensor_type in boundaries:
+                # number of inner boundaries that are lower than the average
+                bins[:, column] = np.searchsorted(np.asarray(boundaries[sensor_type][1:-1], dtype=float),
+                                                  values[:, column], side='left').tolist()
+        for bucket_index, time_interval in enumerate(buckets):
+            yield time_interval, [(time_interval, bins[bucket_index, column], name, sensor_type) for
+                                  column, (name, sensor_type) in enumerate(sensors)]
+
+    def get_unique_sensor_ids(self):
+        return list(self.data[["name", "sensor_type"]].drop_duplicates().itertuples(index=False, name=None))
+
+    def get_unique_sensor_names(self):
+        return [(name,) for name in self.data["name"].unique()]
+
+    def get_unique_sensor_types(self):
+        return [(sensor_type,) for sensor_type in self.data["sensor_type"].unique()]
+
+    def get_mix_max_time(self):
+        return self.data["time"].min(), self.data["time"].max()
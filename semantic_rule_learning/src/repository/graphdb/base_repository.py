@@ -7,23 +7,31 @@ class BaseRepository:
     This class contains common database operations such as connect, disconnect or run a query
     """
 
-    def __init__(self):
+    # a single Neo4j driver is shared by all the repositories, and it is created when it is used for the first time
+    shared_driver = None
+
+    @property
+    def driver(self):
         """
-        Connect to the neo4j database using the connection parameters in .env file
+        Connect to the neo4j database using the connection parameters in .env file, if not connected yet
         """
-        # get db credentials from environment variables
-        url = os.getenv("NEO4J_URL")
-        user = os.getenv("NEO4J_USERNAME")
-        password = os.getenv("NEO4J_PASSWORD")
+        if BaseRepository.shared_driver is None:
+            # get db credentials from environment variables
+            url = os.getenv("NEO4J_URL")
+            user = os.getenv("NEO4J_USERNAME")
+            password = os.getenv("NEO4J_PASSWORD")
 
-        self.driver = GraphDatabase.driver(url, auth=(user, password))
+            BaseRepository.shared_driver = GraphDatabase.driver(url, auth=(user, password))
+        return BaseRepository.shared_driver
 
     def close(self):
         """
         Close database connection
         :return:
         """
-        self.driver.close()
+        if BaseRepository.shared_driver is not None:
+            BaseRepository.shared_driver.close()
+            BaseRepository.shared_driver = None
 
     def run_query(self, query, parameters):
         """
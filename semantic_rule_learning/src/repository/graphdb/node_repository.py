@@ -1,4 +1,7 @@
 import json
+import random
+
+from neo4j.exceptions import ClientError
 
 from src.repository.graphdb.base_repository import BaseRepository
 from src.util.graph_util import *
@@ -34,21 +37,71 @@ class NodeRepository(BaseRepository):
             })
             session.close()
 
-    def get_random_sensor_subgraph(self, sensor_node_count):
+    def add_sensors(self, sensors):
+        """
+        Same as add_sensor, for a list of (object_id, sensor_type) pairs in a single query
+        """
+        with self.driver.session() as session:
+            query = "UNWIND $sensors AS sensor\n" \
+                    "match (n {name: sensor.id})\n" \
+                    "MERGE (s:Sensor {name: sensor.sensor_id, type: 'Sensor', measurement_aspect: sensor.type})" \
+                    "-[:Placed_In]->(n)"
+            session.run(query, {"sensors": [{
+                "id": object_id.replace('s_', '', 1).replace('demand', '').replace('pressure', '').replace('flow', ''),
+                "sensor_id": object_id,
+                "type": sensor_type
+            } for object_id, sensor_type in sensors]})
+            session.close()
+
+    def get_graph_version(self):
+        """
+        Get a fingerprint of the current state of the KG, based on the number of nodes and relations and on a hash of
+        their properties, so that the version also changes when a property is edited or a relation is replaced by
+        another one. The hash is calculated in the database by APOC (installed by start_graphdb.sh) and only the
+        hash itself is returned. Without APOC, only the numbers of nodes and relations are used, and the cache
+        directory has to be cleared after the KG is edited
+        """
+        with self.driver.session() as session:
+            query = "MATCH (n) WITH count(n) AS nodes " \
+                    "OPTIONAL MATCH ()-[r]->() RETURN nodes, count(r) AS relations"
+            result = session.run(query).single()
+            version = str(result['nodes']) + "_" + str(result['relations'])
+            try:
+                fingerprint = session.run("RETURN apoc.hashing.fingerprintGraph() AS fingerprint").single()
+            except ClientError:
+                print("APOC is not available, the KG version is based on the number of nodes and relations only")
+                return version
+            return version + "_" + fingerprint['fingerprint'][:16]
+
+    def get_random_sensor_subgraph(self, sensor_node_count, seed=None):
         """
         (Random subsampling of the KG) Get a subgraph that has "neighboring_sensor_count" amount of sensors
         Starts from "sensor_name" node and gradually searches 1st, 2nd, 3rd ... neighbors to find
         "neighboring_sensor_count" amount of sensors in total
+        If a seed is given, the random starting sensors are picked by a seeded random number generator, so that the
+        same subgraph is returned for the same seed
         """
         sensor_name_list = []
 
         with self.driver.session() as session:
+            if seed is None:
+                random_sensor = "MATCH (a:Sensor)-[]-(t) " + \
+                                "with a.name as randomSensor, rand() as r " + \
+                                "order by r limit 1 "
+                random_generator = None
+            else:
+                random_sensor = "with $random_sensor as randomSensor "
+                random_generator = random.Random(seed)
+                candidates = [row['name'] for row in session.run(
+                    "MATCH (a:Sensor)-[]-(t) RETURN distinct a.name as name ORDER BY name").data()]
+
             path_length = 2
             paths = []
             while len(paths) < sensor_node_count or path_length > 40:
-                query = "MATCH (a:Sensor)-[]-(t) " + \
-                        "with a.name as randomSensor, rand() as r " + \
-                        "order by r limit 1 " + \
+                parameters = {}
+                if random_generator is not None:
+                    parameters['random_sensor'] = random_generator.choice(candidates)
+                query = random_sensor + \
                         "MATCH (n {name: randomSensor}) " + \
                         "OPTIONAL MATCH p=(n)-[*1.." + str(path_length) + "]-(neighbor) " + \
                         "WHERE neighbor: Sensor " + \
@@ -56,7 +109,7 @@ class NodeRepository(BaseRepository):
                         "return neighbors, length(p) " + \
                         "order by length(p) asc"
                 paths = []
-                results = session.run(query).data()
+                results = session.run(query, parameters).data()
                 for row in results:
                     for neighbor in row['neighbors']:
                         if neighbor not in paths:
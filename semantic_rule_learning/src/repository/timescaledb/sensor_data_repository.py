@@ -1,7 +1,11 @@
+import json
 import os
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
 
-import psycopg2
 from psycopg2.extensions import AsIs
+from psycopg2.pool import ThreadedConnectionPool
 from src.repository.graphdb.node_repository import NodeRepository
 
 
@@ -10,6 +14,9 @@ class SensorDataRepository:
     This class contains TimescaleDB specific database operations about managing sensor data
     """
 
+    # connection pools per database, shared by all the repository instances
+    connection_pools = {}
+
     def __init__(self):
         self.connection = "postgres://{}:{}@{}:{}/{}" \
             .format(os.getenv("TIMESCALEDB_USER"),
@@ -18,72 +25,190 @@ class SensorDataRepository:
                     os.getenv("TIMESCALEDB_PORT"),
                     os.getenv("TIMESCALEDB_DB"))
         self.table_name = os.getenv("TIMESCALEDB_TABLE")
+        self.max_connections = int(os.getenv("TIMESCALEDB_MAX_CONNECTIONS", 4))
         self.node_repository = NodeRepository()
+        # results of the metadata queries (sensor names, types and time range), which don't change during a run
+        self.metadata_cache = {}
+
+    @contextmanager
+    def get_connection(self):
+        """
+        Get a connection from the connection pool of the database, the pool is created on the first use
+        the transaction is committed (or rolled back on error) and the connection is returned to the pool afterwards
+        """
+        connection_pool = SensorDataRepository.connection_pools.get(self.connection)
+        if connection_pool is None:
+            connection_pool = ThreadedConnectionPool(1, self.max_connections, self.connection)
+            SensorDataRepository.connection_pools[self.connection] = connection_pool
+        conn = connection_pool.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            connection_pool.putconn(conn)
+
+    @staticmethod
+    def close_connection_pools():
+        """
+        Close all the connections of all the connection pools, e.g. before forking worker processes, so that no
+        connection is shared between processes. New pools are created on the next use
+        """
+        for connection_pool in SensorDataRepository.connection_pools.values():
+            connection_pool.closeall()
+        SensorDataRepository.connection_pools = {}
+
+    def get_cached_metadata(self, key, query):
+        """
+        Run the given metadata query on the table only once, and return the cached result afterwards
+        """
+        if key not in self.metadata_cache:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (AsIs(self.table_name),))
+                    self.metadata_cache[key] = cur.fetchall()
+        return self.metadata_cache[key]
+
+    def clear_metadata_cache(self):
+        self.metadata_cache = {}
 
     def get_all_data(self):
-        with psycopg2.connect(self.connection) as conn:
+        with self.get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT * FROM %s", (AsIs(self.table_name),))
                 result = cur.fetchall()
                 return result
 
     def get_data_by_sensor(self, object_id):
-        with psycopg2.connect(self.connection) as conn:
+        with self.get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT * FROM %s where name = %s", (AsIs(self.table_name), object_id,))
                 result = cur.fetchall()
                 return result
 
     def get_grouped_data_by_time(self, time_interval_in_minutes: int, precision: int = 0, subsample: int = 0):
+        query, parameters = self.get_grouped_data_query(time_interval_in_minutes, precision, subsample)
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, parameters)
+                result = cur.fetchall()
+                return result
+
+    def stream_grouped_data_by_time(self, time_interval_in_minutes: int, precision: int = 0, subsample: int = 0,
+                                    itersize: int = 10000, seed: int = None):
+        """
+        Same as get_grouped_data_by_time, but the rows are fetched in batches of "itersize" rows through a named
+        (server-side) cursor and yielded per time bucket, so that only a single bucket is held in memory at a time
+        :param seed: seed of the random sensor subsample, a different subsample is taken on every call if not given
+        :return: generator of (time_interval, rows of the time bucket) pairs
+        """
+        query, parameters = self.get_grouped_data_query(time_interval_in_minutes, precision, subsample, seed)
+        with self.get_connection() as conn:
+            with conn.cursor(name="grouped_sensor_data") as cur:
+                cur.itersize = itersize
+                cur.execute(query, parameters)
+                # the rows are ordered by time_interval, therefore consecutive rows form the time buckets
+                for time_interval, rows in groupby(cur, key=itemgetter(0)):
+                    yield time_interval, list(rows)
+
+    def get_grouped_data_query(self, time_interval_in_minutes: int, precision: int = 0, subsample: int = 0,
+                               seed: int = None, sensor_name_list=None):
+        query, parameters = self.get_averages_query(time_interval_in_minutes, precision, subsample, seed,
+                                                    sensor_name_list)
+        return query + " ORDER BY time_interval, name, sensor_type", parameters
+
+    def get_averages_query(self, time_interval_in_minutes: int, precision: int = 0, subsample: int = 0,
+                           seed: int = None, sensor_name_list=None):
+        """
+        Average measurement of each sensor per time bucket, without ordering, so that it can also be used as a subquery
+        :param sensor_name_list: sensors to include, taken from get_sensor_name_list(subsample, seed) if not given
+        """
         # also filter the data due to space and time complexity of Naive SemRL
-        sensor_name_list = []
-        for row in self.get_unique_sensor_names():
-            sensor_name_list.append(row[0])
-        if subsample > 0:
-            sensor_name_list = self.node_repository.get_random_sensor_subgraph(subsample)
+        if sensor_name_list is None:
+            sensor_name_list = self.get_sensor_name_list(subsample, seed)
 
         # this is necessary to fill time gaps, e.g. if we don't have a measurement from a sensor at a specific
         # time frame, then we will put a 0
         time_intervals = self.get_mix_max_time()
-        with psycopg2.connect(self.connection) as conn:
+        query = "SELECT time_bucket_gapfill('%(minutes)s minutes', time) AS time_interval, " \
+                "CASE WHEN avg(value) IS NULL THEN 0 ELSE round(cast(avg(value) as numeric), 0) END as average, " \
+                "name, sensor_type FROM %(table_name)s s " \
+                "where name = ANY(%(sensor_name_list)s) AND " \
+                "time >= %(start_interval)s AND time <= %(end_interval)s " \
+                "GROUP BY time_interval, name, sensor_type"
+        parameters = {'minutes': time_interval_in_minutes, 'precision': precision,
+                      'sensor_name_list': sensor_name_list, 'table_name': AsIs(self.table_name),
+                      'start_interval': time_intervals[0], 'end_interval': time_intervals[1]}
+        return query, parameters
+
+    def get_sensor_name_list(self, subsample: int = 0, seed: int = None):
+        """
+        :return: names of all the sensors, or of a random sensor subsample (subgraph) of the given size
+        """
+        if subsample > 0:
+            return self.node_repository.get_random_sensor_subgraph(subsample, seed)
+        return [row[0] for row in self.get_unique_sensor_names()]
+
+    def get_discrete_boundaries(self, time_interval_in_minutes: int, num_bins: int, sensor_name_list):
+        """
+        Calculate the equal-frequency bin boundaries of the average measurements per sensor type in the database, with
+        percentile_cont over the same (gap filled and rounded) averages that stream_grouped_data_by_time returns
+        :param sensor_name_list: sensors to include, see get_sensor_name_list
+        :return: dictionary of sensor type to its num_bins + 1 boundaries in increasing order
+        """
+        averages_query, parameters = self.get_averages_query(time_interval_in_minutes,
+                                                             sensor_name_list=sensor_name_list)
+        query = "SELECT a.sensor_type, percentile_cont(%(fractions)s::float8[]) " \
+                "WITHIN GROUP (ORDER BY a.average::float8) FROM (" + averages_query + ") a " \
+                "GROUP BY a.sensor_type"
+        parameters['fractions'] = [index / num_bins for index in range(num_bins + 1)]
+        with self.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT time_bucket_gapfill('%(minutes)s minutes', time) AS time_interval, "
-                            "CASE WHEN avg(value) IS NULL THEN 0 ELSE round(cast(avg(value) as numeric), 0) END as average, "
-                            "CONCAT('_name_', name, '_end__type_', sensor_type, '_end_') id FROM %(table_name)s s "
-                            "where name = ANY(%(sensor_name_list)s) AND "
-                            "time >= %(start_interval)s AND time <= %(end_interval)s "
-                            "GROUP BY time_interval, name, sensor_type "
-                            "ORDER BY time_interval, id",
-                            {'minutes': time_interval_in_minutes, 'precision': precision,
-                             'sensor_name_list': sensor_name_list, 'table_name': AsIs(self.table_name),
-                             'start_interval': time_intervals[0], 'end_interval': time_intervals[1]})
-                result = cur.fetchall()
-                return result
+                cur.execute(query, parameters)
+                return {sensor_type: boundaries for sensor_type, boundaries in cur.fetchall()}
+
+    def stream_binned_data_by_time(self, time_interval_in_minutes: int, boundaries, sensor_name_list,
+                                   itersize: int = 10000):
+        """
+        Same as stream_grouped_data_by_time, but the average measurements are assigned to a bin of their sensor type
+        with width_bucket in the database, and only the (small integer) bin index is returned instead of the average.
+        As in Discretizer.transform, an average that is equal to a boundary is assigned to the lower bin, therefore
+        width_bucket is applied on the negated averages and boundaries
+        :param boundaries: dictionary of sensor type to its bin boundaries, e.g. from get_discrete_boundaries
+        :param sensor_name_list: sensors to include, see get_sensor_name_list
+        :return: generator of (time_interval, rows of the time bucket) pairs, with a bin index in place of the average,
+        None if there are no boundaries for the sensor type
+        """
+        averages_query, parameters = self.get_averages_query(time_interval_in_minutes,
+                                                             sensor_name_list=sensor_name_list)
+        # only the inner boundaries separate the bins, the averages out of the outer ones fall into the first or the
+        # last bin
+        parameters['thresholds'] = json.dumps({sensor_type: sorted(-float(boundary) for boundary in
+                                                                   type_boundaries[1:-1])
+                                               for sensor_type, type_boundaries in boundaries.items()})
+        query = "WITH thresholds AS (SELECT t.key AS sensor_type, " \
+                "array(SELECT e.threshold::float8 FROM jsonb_array_elements_text(t.value) " \
+                "WITH ORDINALITY AS e(threshold, position) ORDER BY e.position) AS negated " \
+                "FROM jsonb_each(%(thresholds)s::jsonb) t) " \
+                "SELECT a.time_interval, " \
+                "(cardinality(t.negated) - width_bucket(-a.average::float8, t.negated))::smallint AS bin, " \
+                "a.name, a.sensor_type FROM (" + averages_query + ") a " \
+                "LEFT JOIN thresholds t ON t.sensor_type = a.sensor_type " \
+                "ORDER BY a.time_interval, a.name, a.sensor_type"
+        with self.get_connection() as conn:
+            with conn.cursor(name="binned_sensor_data") as cur:
+                cur.itersize = itersize
+                cur.execute(query, parameters)
+                for time_interval, rows in groupby(cur, key=itemgetter(0)):
+                    yield time_interval, list(rows)
 
     def get_unique_sensor_ids(self):
-        with psycopg2.connect(self.connection) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT distinct name, sensor_type from %s", (AsIs(self.table_name),))
-                result = cur.fetchall()
-                return result
+        return self.get_cached_metadata("sensor_ids", "SELECT distinct name, sensor_type from %s")
 
     def get_unique_sensor_names(self):
-        with psycopg2.connect(self.connection) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT distinct name from %s", (AsIs(self.table_name),))
-                result = cur.fetchall()
-                return result
+        return self.get_cached_metadata("sensor_names", "SELECT distinct name from %s")
 
     def get_unique_sensor_types(self):
-        with psycopg2.connect(self.connection) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT distinct sensor_type from %s", (AsIs(self.table_name),))
-                result = cur.fetchall()
-                return result
+        return self.get_cached_metadata("sensor_types", "SELECT distinct sensor_type from %s")
 
     def get_mix_max_time(self):
-        with psycopg2.connect(self.connection) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT min(time) as min, max(time) as max from %s", (AsIs(self.table_name),))
-                result = cur.fetchall()
-                return result[0]
+        return self.get_cached_metadata("time_range", "SELECT min(time) as min, max(time) as max from %s")[0]
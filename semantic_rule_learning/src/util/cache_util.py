@@ -0,0 +1,103 @@
+"""
+This Python script includes the on-disk cache of the data fetched from the databases (knowledge graph and sensor
+transactions), so that repeated experiments do not query Neo4j and TimescaleDB every time
+"""
+import hashlib
+import json
+import os
+import pickle
+from datetime import datetime
+
+import numpy as np
+
+from src.util.converter_util import SensorTransactions
+from src.util.discretization_util import Discretizer
+from src.util.item_vocabulary import ItemVocabulary
+
+
+class DataCache:
+    """
+    Content-addressed cache, each entry is stored under a hash of the parameters that the data depends on, e.g.
+    table name, transaction period, subsample seed and knowledge graph version. The knowledge graph is pickled and
+    the transactions are stored as a compressed npz file together with their vocabulary
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory to store the cached files in, created if it doesn't exist
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(**parameters):
+        """
+        get the cache key of the given parameters, which is independent of the order of the parameters
+        """
+        content = json.dumps(parameters, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+    def get_path(self, kind, key, extension):
+        return os.path.join(self.directory, kind + "_" + key + "." + extension)
+
+    def load_knowledge_graph(self, key):
+        """
+        :return: the cached NetworkX knowledge graph, or None if it is not cached
+        """
+        path = self.get_path("knowledge_graph", key, "pkl")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+    def save_knowledge_graph(self, key, knowledge_graph):
+        self.write_atomic(self.get_path("knowledge_graph", key, "pkl"),
+                          lambda file: pickle.dump(knowledge_graph, file, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def load_transactions(self, key):
+        """
+        :return: the cached SensorTransactions with a vocabulary of the same item ids, or None if it is not cached
+        """
+        path = self.get_path("transactions", key, "npz")
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            vocabulary = ItemVocabulary()
+            for item in json.loads(str(data['vocabulary'])):
+                vocabulary.encode(tuple(item))
+            timestamps = [datetime.fromisoformat(timestamp) for timestamp in data['timestamps']]
+            # transactions that are discretized in the database are stored with their bin indices and boundaries
+            if 'bin_indices' in data.files:
+                discretizer = json.loads(str(data['discretizer']))
+                return SensorTransactions(vocabulary, data['sensors'], data['sensor_types'], data['values'],
+                                          timestamps, data['bin_indices'],
+                                          Discretizer(discretizer['num_bins'], discretizer['method'],
+                                                      discretizer['boundaries']))
+            return SensorTransactions(vocabulary, data['sensors'], data['sensor_types'], data['values'], timestamps)
+
+    def save_transactions(self, key, transactions):
+        timestamps = np.array([timestamp.isoformat() for timestamp in transactions.timestamps], dtype=str)
+        arrays = {}
+        if transactions.bin_indices is not None:
+            discretizer = transactions.discretizer
+            arrays = {'bin_indices': transactions.bin_indices,
+                      'discretizer': json.dumps({'num_bins': discretizer.num_bins, 'method': discretizer.method,
+                                                 'boundaries': {group: boundaries.tolist() for group, boundaries in
+                                                                discretizer.boundaries.items()}})}
+        self.write_atomic(self.get_path("transactions", key, "npz"),
+                          lambda file: np.savez_compressed(file, values=transactions.values,
+                                                           sensors=transactions.sensors,
+                                                           sensor_types=transactions.sensor_types,
+                                                           timestamps=timestamps,
+                                                           vocabulary=json.dumps(transactions.vocabulary.items),
+                                                           **arrays))
+
+    @staticmethod
+    def write_atomic(path, write):
+        """
+        write a file through a temporary file, so that an interrupted run never leaves a partial cache entry behind
+        """
+        temporary_path = path + ".tmp"
+        with open(temporary_path, 'wb') as file:
+            write(file)
+        os.replace(temporary_path, path)
@@ -1,29 +1,136 @@
-from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
 import networkx as nx
+import numpy as np
+
+from src.util.item_vocabulary import ItemVocabulary
+
+
+class SensorTransactions:
+    """
+    Sensor measurements in the form of transactions, where each transaction holds the (averaged) measurements of the
+    sensors within the same time bucket. Rows of the values matrix are the transactions and the columns are the
+    sensors, and missing measurements are NaN. Sensors and sensor types are stored as integer ids of the vocabulary.
+    """
+
+    def __init__(self, vocabulary, sensors, sensor_types, values, timestamps=None, bin_indices=None,
+                 discretizer=None):
+        """
+        :param vocabulary: ItemVocabulary that holds the ('sensor', name) and ('sensor_type', type) items
+        :param sensors: item id of the sensor per column
+        :param sensor_types: item id of the sensor type per column
+        :param values: transactions x sensors matrix of measurements
+        :param timestamps: start of the time bucket per transaction
+        :param bin_indices: transactions x sensors matrix of bin indices (-1 for missing measurements), if the
+        measurements are already discretized, e.g. in the database
+        :param discretizer: Discretizer with the boundaries that the bin indices are assigned with
+        """
+        self.vocabulary = vocabulary
+        self.sensors = np.asarray(sensors, dtype=np.int32)
+        self.sensor_types = np.asarray(sensor_types, dtype=np.int32)
+        self.values = np.asarray(values, dtype=float).reshape(-1, len(self.sensors))
+        self.timestamps = list(timestamps) if timestamps is not None else []
+        self.bin_indices = np.asarray(bin_indices, dtype=np.int16).reshape(self.values.shape) \
+            if bin_indices is not None else None
+        self.discretizer = discretizer
+
+    def __len__(self):
+        return len(self.values)
+
+    def get_sensor_name(self, column):
+        return self.vocabulary.decode(self.sensors[column])[1]
+
+    def get_sensor_type(self, column):
+        return self.vocabulary.decode(self.sensor_types[column])[1]
+
+    def get_sensor_type_names(self):
+        """
+        :return: distinct sensor types in the order of their first column
+        """
+        return list(dict.fromkeys(self.get_sensor_type(column) for column in range(len(self.sensors))))
 
 
-def timeseries_to_transactions(sensor_data):
+def timeseries_to_transactions(sensor_data, vocabulary=None):
     """
     Convert timescaledb output to transactions that can be processed by an ARM algorithm
-    :param sensor_data: in the form of timescaledb objects
-    :return: list of transactions, list of sensor ids for items in the transactions
-    """
-    # group sensor data based on timestamp
-    groups = defaultdict(list)
-    transaction_list = []
-    for item in sensor_data:
-        if item[1] is None or item[2] is None:
+    :param sensor_data: in the form of timescaledb objects, (time_interval, average, name, sensor_type) rows
+    :param vocabulary: ItemVocabulary to encode the sensors and sensor types with, a new one is created if not given
+    :return: SensorTransactions
+    """
+    return grouped_timeseries_to_transactions(groupby(sensor_data, key=itemgetter(0)), vocabulary)
+
+
+def grouped_timeseries_to_transactions(grouped_sensor_data, vocabulary=None):
+    """
+    Convert timescaledb output that is grouped by time bucket to transactions, one bucket at a time, e.g. the output
+    of SensorDataRepository.stream_grouped_data_by_time, so that only the rows of a single bucket are held in memory
+    :param grouped_sensor_data: iterable of (time_interval, rows of the time bucket) pairs
+    :param vocabulary: ItemVocabulary to encode the sensors and sensor types with, a new one is created if not given
+    :return: SensorTransactions
+    """
+    if vocabulary is None:
+        vocabulary = ItemVocabulary()
+    # sensors are identified by their name and type
+    columns = {}
+    buckets = {}
+    rows = []
+    for time_interval, bucket_data in grouped_sensor_data:
+        column_indices = []
+        measurements = []
+        for item in bucket_data:
+            if item[1] is None or item[2] is None:
+                continue
+            column_indices.append(columns.setdefault((item[2], item[3]), len(columns)))
+            measurements.append(float(item[1]))
+        if len(column_indices) == 0:
             continue
-        groups[item[0]].append(item)
+        # add items with the same timestamp in the same row, the row only covers the sensors seen so far
+        row = np.full(len(columns), np.nan)
+        row[column_indices] = measurements
+        if time_interval in buckets:
+            previous_row = rows[buckets[time_interval]]
+            row[:len(previous_row)] = np.where(np.isnan(row[:len(previous_row)]), previous_row,
+                                               row[:len(previous_row)])
+            rows[buckets[time_interval]] = row
+        else:
+            buckets[time_interval] = len(rows)
+            rows.append(row)
 
-    # add items with the same timestamp in the same list
-    for timestamp in groups:
-        measurement_list = []
-        for measurement in groups[timestamp]:
-            measurement_list.append(str(measurement[1]) + "_" + measurement[2])
-        transaction_list.append(measurement_list)
+    values = np.full((len(rows), len(columns)), np.nan)
+    for row_index, row in enumerate(rows):
+        values[row_index, :len(row)] = row
+    sensors = [vocabulary.encode(('sensor', name)) for name, _ in columns]
+    sensor_types = [vocabulary.encode(('sensor_type', sensor_type)) for _, sensor_type in columns]
+    return SensorTransactions(vocabulary, sensors, sensor_types, values, buckets.keys())
+
+
+def grouped_binned_timeseries_to_transactions(grouped_sensor_data, discretizer, vocabulary=None):
+    """
+    Convert timescaledb output with bin indices in place of the average measurements to transactions, e.g. the output
+    of SensorDataRepository.stream_binned_data_by_time. The bin indices are kept as they are, and the middle of the
+    bin is used as the measurement value, for the algorithms that mine the numerical values (TS-NARM)
+    :param grouped_sensor_data: iterable of (time_interval, rows of the time bucket) pairs
+    :param discretizer: Discretizer with the boundaries that the bin indices are assigned with
+    :param vocabulary: ItemVocabulary to encode the sensors and sensor types with, a new one is created if not given
+    :return: SensorTransactions with bin indices
+    """
+    transactions = grouped_timeseries_to_transactions(grouped_sensor_data, vocabulary)
+    bin_indices = np.where(np.isnan(transactions.values), -1, transactions.values).astype(np.int16)
+    values = np.full(transactions.values.shape, np.nan)
+    for sensor_type_id in dict.fromkeys(transactions.sensor_types.tolist()):
+        sensor_type = transactions.vocabulary.decode(sensor_type_id)[1]
+        columns = transactions.sensor_types == sensor_type_id
+        if sensor_type not in discretizer:
+            bin_indices[:, columns] = -1
+            continue
+        boundaries = discretizer.boundaries[sensor_type]
+        middles = np.append((boundaries[:-1] + boundaries[1:]) / 2, np.nan)
+        # -1 (missing) picks the NaN at the end
+        values[:, columns] = middles[bin_indices[:, columns]]
 
-    return transaction_list
+    return SensorTransactions(transactions.vocabulary, transactions.sensors, transactions.sensor_types, values,
+                              transactions.timestamps, bin_indices, discretizer)
 
 
 def neo4j_to_networkx(neo4j_graph):
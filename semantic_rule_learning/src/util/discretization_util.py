@@ -1,6 +1,8 @@
 """
 This Python script includes functions relevant to numerical data discretization
 """
+import json
+
 import numpy as np
 
 
@@ -19,3 +21,82 @@ def equal_width_discretization(numerical_values, num_bins):
     interval = int((max - min) / num_bins)
     boundaries = [i for i in range(min, max + interval, interval)]
     return boundaries
+
+
+class Discretizer:
+    """
+    Discretizes numerical values into bins, with boundaries that are fitted once per group of values, e.g. per sensor
+    type or per knowledge graph attribute. Bins are assigned to whole arrays at once using np.searchsorted, and the
+    fitted boundaries can be saved and loaded to reuse them across runs.
+    """
+
+    def __init__(self, num_bins, method='equal_frequency', boundaries=None):
+        """
+        :param num_bins: number of bins to discretize the values into
+        :param method: 'equal_frequency' or 'equal_width'
+        :param boundaries: already fitted boundaries per group
+        """
+        self.num_bins = num_bins
+        self.method = method
+        self.boundaries = {}
+        self.labels = {}
+        for group, group_boundaries in (boundaries or {}).items():
+            self.set_boundaries(group, group_boundaries)
+
+    def fit(self, group, numerical_values):
+        """
+        calculate the bin boundaries of the given group of numerical values
+        :return: the boundaries in increasing order
+        """
+        if self.method == 'equal_width':
+            boundaries = equal_width_discretization(numerical_values, self.num_bins)
+        else:
+            boundaries = equal_frequency_discretization(numerical_values, self.num_bins)
+        self.set_boundaries(group, boundaries)
+        return self.boundaries[group]
+
+    def set_boundaries(self, group, boundaries):
+        boundaries = np.asarray(boundaries, dtype=float)
+        self.boundaries[group] = boundaries
+        # bin labels are in the form of "lower_upper" boundaries, and are created only once per group
+        self.labels[group] = [str(boundaries[index]) + "_" + str(boundaries[index + 1]) for index in
+                              range(len(boundaries) - 1)]
+
+    def transform(self, group, numerical_values):
+        """
+        assign each of the given numerical values to a bin of the given group
+        a value that is equal to a boundary is assigned to the lower bin, and values out of the fitted boundaries are
+        assigned to the first or the last bin
+        :return: integer array of bin indices, -1 for missing (NaN) values
+        """
+        numerical_values = np.asarray(numerical_values, dtype=float)
+        boundaries = self.boundaries[group]
+        bin_indices = np.clip(np.searchsorted(boundaries, numerical_values, side='left') - 1, 0, len(boundaries) - 2)
+        return np.where(np.isnan(numerical_values), -1, bin_indices)
+
+    def get_labels(self, group):
+        """
+        :return: list of bin labels of the given group
+        """
+        return self.labels[group]
+
+    def __contains__(self, group):
+        return group in self.boundaries
+
+    def save(self, path):
+        """
+        save the fitted boundaries into a JSON file
+        """
+        with open(path, 'w') as file:
+            json.dump({'num_bins': self.num_bins, 'method': self.method,
+                       'boundaries': {group: boundaries.tolist() for group, boundaries in self.boundaries.items()}},
+                      file)
+
+    @staticmethod
+    def load(path):
+        """
+        load a discretizer with the fitted boundaries from a JSON file
+        """
+        with open(path) as file:
+            content = json.load(file)
+        return Discretizer(content['num_bins'], content['method'], content['boundaries'])
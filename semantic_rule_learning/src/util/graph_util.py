@@ -4,36 +4,169 @@ the extracted data from the graph database. All the functions interacting with t
 are placed under the "repository" package.
 """
 import numpy as np
+from scipy.sparse import csr_matrix
 
+from src.util.discretization_util import Discretizer
 
-def get_neighbors(graph, node, num_of_neighbors):
+
+class NeighborhoodIndex:
+    """
+    Neighborhood index of a knowledge graph, built once per graph. The graph structure is stored as a CSR adjacency
+    matrix over integer node ids, and the k-hop neighbors of a node are found with a breadth-first search over the
+    matrix, up to the given maximum degree, and cached per node. Sensor nodes (with the "s_" name prefix) are neither
+    returned as neighbors nor expanded, as they only carry the measurements
+    """
+
+    def __init__(self, graph, max_degree):
+        """
+        :param graph: a graph in NetworkX format
+        :param max_degree: maximum number of hops from a node to its neighbors
+        """
+        self.max_degree = max_degree
+        self.node_names = list(graph.nodes)
+        self.node_ids = {node_name: node_id for node_id, node_name in enumerate(self.node_names)}
+        self.is_sensor = np.array([str(node_name).startswith('s_') for node_name in self.node_names], dtype=bool)
+
+        edges = np.array([(self.node_ids[source], self.node_ids[destination]) for source, destination in
+                          graph.edges()], dtype=np.int64).reshape(-1, 2)
+        self.adjacency = csr_matrix((np.ones(len(edges), dtype=np.int8), (edges[:, 0], edges[:, 1])),
+                                    shape=(len(self.node_names), len(self.node_names)))
+        self.neighbors = {}
+
+    def get_neighbors(self, node_name):
+        """
+        get the neighbors of the given node per degree
+        :param node_name: name (NetworkX id) of a node in the graph
+        :return: list of neighbor node names per degree, the first list contains the 1-hop neighbors
+        """
+        if node_name in self.neighbors:
+            return self.neighbors[node_name]
+
+        visited = np.zeros(len(self.node_names), dtype=bool)
+        frontier = np.array([self.node_ids[node_name]])
+        visited[frontier] = True
+        neighbors = []
+        for _ in range(self.max_degree):
+            candidates = np.unique(self.adjacency[frontier].indices)
+            frontier = candidates[~visited[candidates] & ~self.is_sensor[candidates]]
+            visited[frontier] = True
+            neighbors.append([self.node_names[node_id] for node_id in frontier])
+        self.neighbors[node_name] = neighbors
+        return neighbors
+
+
+class SensorNodeTable:
+    """
+    Lookup table from the sensors (columns) of the transactions to the node that each sensor is placed on in the
+    knowledge graph, and to the attributes of that node. The table is built once from the knowledge graph, so that the
+    semantic enrichment becomes a gather by sensor index instead of a graph traversal per item of every transaction
+    """
+
+    def __init__(self, knowledge_graph, transactions):
+        """
+        :param knowledge_graph: knowledge graph in NetworkX format
+        :param transactions: sensor data in the form of SensorTransactions
+        """
+        self.node_names = []
+        # (attribute name, attribute value) tuples of the node per sensor, the "name" identifier is not included
+        self.attributes = []
+        for column in range(len(transactions.sensors)):
+            node_name = next(iter(knowledge_graph.neighbors(transactions.get_sensor_name(column))))
+            properties = knowledge_graph.nodes[node_name]['properties']
+            self.node_names.append(node_name)
+            self.attributes.append(tuple((key, properties[key]) for key in properties if key != 'name'))
+
+    def get_item_table(self, transactions, discretizer):
+        """
+        encode the measurement range items of each sensor, followed by the items of the node attributes in that
+        range, as in the Naive SemRL transactions
+        :param transactions: sensor data in the form of SensorTransactions, with the vocabulary to encode the items
+        :param discretizer: Discretizer with boundaries per sensor type
+        :return: sensors x bins x items array of item ids, padded with -1
+        """
+        vocabulary = transactions.vocabulary
+        num_bins = max([len(discretizer.get_labels(sensor_type)) for sensor_type in
+                        transactions.get_sensor_type_names()] + [0])
+        num_items = max([len(attributes) for attributes in self.attributes] + [0]) + 1
+        item_table = np.full((len(self.node_names), num_bins, num_items), -1, dtype=np.int32)
+        for column, attributes in enumerate(self.attributes):
+            sensor_type = transactions.get_sensor_type(column)
+            for bin_index, measurement_range in enumerate(discretizer.get_labels(sensor_type)):
+                item_table[column, bin_index, 0] = vocabulary.encode(('range', sensor_type, measurement_range))
+                for position, (key, value) in enumerate(attributes):
+                    item_table[column, bin_index, position + 1] = vocabulary.encode(
+                        ('range_attribute', sensor_type, measurement_range, key, str(value)))
+        return item_table
+
+
+class NodeFeatureEncoder:
+    """
+    One-hot encoder of the node attributes in a knowledge graph. The values of each attribute are collected in a single
+    pass over the nodes, and the nodes are encoded into a sparse nodes x features matrix, where each feature is an
+    ('attribute', attribute name, value) item of the vocabulary. The knowledge graph itself is not modified, therefore
+    it can be shared by all the algorithms
+    """
+
+    def __init__(self, knowledge_graph, attributes, vocabulary):
+        """
+        :param knowledge_graph: knowledge graph in NetworkX format
+        :param attributes: names of the (categorical or discrete numerical) attributes to encode
+        :param vocabulary: ItemVocabulary to encode the features with
+        """
+        self.attributes = list(attributes)
+        self.node_ids = {node_name: node_id for node_id, node_name in enumerate(knowledge_graph.nodes)}
+        # values of each attribute, in the order of their first appearance, mapped to their index
+        values_per_attribute = [{} for _ in self.attributes]
+        rows, attribute_indices, value_indices = [], [], []
+        for node_name, node_id in self.node_ids.items():
+            properties = knowledge_graph.nodes[node_name]['properties']
+            for attribute_index, attribute in enumerate(self.attributes):
+                if attribute in properties:
+                    values = values_per_attribute[attribute_index]
+                    rows.append(node_id)
+                    attribute_indices.append(attribute_index)
+                    value_indices.append(values.setdefault(properties[attribute], len(values)))
+
+        # features of an attribute are stored consecutively, starting from the offset of the attribute
+        self.offsets = np.cumsum([0] + [len(values) for values in values_per_attribute])
+        self.features = np.array([vocabulary.encode(('attribute', attribute, value)) for attribute, values in
+                                  zip(self.attributes, values_per_attribute) for value in values], dtype=np.int32)
+        self.has_attribute = np.zeros((len(self.node_ids), len(self.attributes)), dtype=bool)
+        self.has_attribute[rows, attribute_indices] = True
+        self.matrix = csr_matrix((np.ones(len(rows), dtype=np.int8),
+                                  (rows, self.offsets[attribute_indices] + np.array(value_indices, dtype=np.int64))),
+                                 shape=(len(self.node_ids), len(self.features)))
+
+    def get_node_features(self, node_name):
+        """
+        get the one-hot encoded attributes of a node, all the values of an attribute are included if the node has
+        that attribute, and the attributes that the node doesn't have are left out
+        :param node_name: name (NetworkX id) of a node in the graph
+        :return: (feature item ids, 0/1 values) of the node
+        """
+        node_id = self.node_ids[node_name]
+        columns = np.concatenate([np.arange(self.offsets[attribute_index], self.offsets[attribute_index + 1]) for
+                                  attribute_index in np.flatnonzero(self.has_attribute[node_id])] +
+                                 [np.zeros(0, dtype=np.int64)])
+        values = self.matrix[node_id].toarray()[0, columns]
+        return self.features[columns].tolist(), values.tolist()
+
+
+def get_neighbors(graph, node, num_of_neighbors, neighborhood_index=None):
     """
-    Get first $num_of_neighbors neighbors of a given node and the edges in between them
+    Get first $num_of_neighbors neighbors of a given node
     :param graph:
     :param node:
     :param num_of_neighbors:
-    :return:
+    :param neighborhood_index: NeighborhoodIndex of the graph, built for this call if not given
+    :return: neighbor nodes per degree, where the keys are the degrees starting from "0" for the 1-hop neighbors
     """
-    list_of_nodes_to_scan = [node['properties']['name']]
-    for pointer in range(num_of_neighbors):
-        for pointer2 in range(len(list_of_nodes_to_scan)):
-            node_name = list_of_nodes_to_scan[pointer2]
-            if not node_name.startswith('s_'):
-                list_of_nodes_to_scan += [node_name[1] + "--" + str(pointer) for node_name in
-                                          list(graph.edges(node_name, data=True))]
-
-    unique_neighbor_name_list = np.unique(list_of_nodes_to_scan)
+    if neighborhood_index is None or neighborhood_index.max_degree < num_of_neighbors:
+        neighborhood_index = NeighborhoodIndex(graph, num_of_neighbors)
     neighbors = {}
-    unique_neighbor_name_list = list(unique_neighbor_name_list)
-    unique_neighbor_name_list.remove(node['properties']['name'])
-    for node_name in unique_neighbor_name_list:
-        if not node_name.startswith('s_'):
-            split = node_name.split("--")
-            neighbor_degree = split[1]
-            node_name = split[0]
-            if neighbor_degree not in neighbors:
-                neighbors[neighbor_degree] = []
-            neighbors[neighbor_degree].append(graph.nodes[node_name])
+    for degree, node_names in enumerate(neighborhood_index.get_neighbors(node['properties']['name'])):
+        if degree < num_of_neighbors and len(node_names) > 0:
+            neighbors[str(degree)] = [graph.nodes[node_name] for node_name in node_names]
     return neighbors
 
 
@@ -46,17 +179,20 @@ def get_topology(node, neighbor_list):
      strings
     """
     topology = []
+    # relations that are already in the topology, and the next index to try per relation
+    used_relations = set()
+    next_index = {}
     for edge in neighbor_list:
         relation = node['labels'] + "_" + edge['neighbor']['labels'] + "_" + edge['edge_props']['type']
-        index = 2
-        if relation in topology:
+        if relation in used_relations:
             temp = relation
-            while relation in topology:
+            index = next_index.get(temp, 2)
+            while relation in used_relations:
                 relation = temp + '_' + str(index)
                 index += 1
-            topology.append(relation)
-        else:
-            topology.append(relation)
+            next_index[temp] = index
+        topology.append(relation)
+        used_relations.add(relation)
 
     return topology
 
@@ -68,12 +204,12 @@ def get_attributes(subgraph):
     :return:
     """
     attributes = []
-    unique_ids = []
+    unique_ids = set()
     for edge_list in subgraph:
         for edge in edge_list:
             if edge['neighbor']['properties']['id'] not in unique_ids:
                 attributes += [('d_' + str(value)) for value in edge['neighbor']['properties'].values()]
-                unique_ids.append(edge['neighbor']['properties']['id'])
+                unique_ids.add(edge['neighbor']['properties']['id'])
 
     return attributes
 
@@ -85,49 +221,47 @@ def get_unique_values(graph, attribute):
     :para attribute: key of an attribute in the graph
     :return: a lit of unique values for the given attribute in the graph
     """
-    unique_values = []
+    unique_values = {}
     for node_id in graph.nodes:
         if attribute in graph.nodes[node_id]['properties']:
-            if graph.nodes[node_id]['properties'][attribute] not in unique_values:
-                unique_values.append(graph.nodes[node_id]['properties'][attribute])
+            unique_values.setdefault(graph.nodes[node_id]['properties'][attribute])
 
-    return unique_values
+    return list(unique_values)
 
 
-def discretize_numerical_attributes(knowledge_graph, numerical_attribute_list, num_bins):
+def discretize_numerical_attributes(knowledge_graph, numerical_attribute_list, num_bins, discretizer=None):
     """
     discretize the numerical attributes inside the knowledge graph based on equal-frequency binning method
     :param knowledge_graph: a knowledge graph in NetworkX format
     :param numerical_attribute_list: list of numerical property keys in string
     :param num_bins: number of bins to discretize the numerical attributes in
+    :param discretizer: Discretizer with already fitted boundaries per attribute, attributes that are not fitted yet
+    are fitted on the knowledge graph
     :return: the same knowledge graph with discrete (range) numeric values instead of continuous values
     """
-    # initialize empty lists per numerical values
-    numerical_value_map = {}
-    for attribute in numerical_attribute_list:
-        numerical_value_map[attribute] = []
+    if discretizer is None:
+        discretizer = Discretizer(num_bins)
 
-    # collect all numerical values per attribute
+    # collect all numerical values and the nodes they belong to per attribute, in a single pass over the nodes
+    numerical_value_map = {attribute: [] for attribute in numerical_attribute_list}
+    node_map = {attribute: [] for attribute in numerical_attribute_list}
     for node_id in knowledge_graph.nodes:
+        properties = knowledge_graph.nodes[node_id]['properties']
         for attribute in numerical_attribute_list:
-            if attribute in knowledge_graph.nodes[node_id]['properties']:
-                numerical_value_map[attribute].append(knowledge_graph.nodes[node_id]['properties'][attribute])
+            if attribute in properties:
+                numerical_value_map[attribute].append(properties[attribute])
+                node_map[attribute].append(node_id)
 
     for numerical_attribute in numerical_value_map:
-        # sort values in increasing order
-        sorted_values = np.sort(numerical_value_map[numerical_attribute])
+        if len(numerical_value_map[numerical_attribute]) == 0:
+            continue
         # define boundaries based on num_bins
-        boundaries = np.interp(np.linspace(0, len(sorted_values), num_bins + 1),
-                               np.arange(len(sorted_values)),
-                               sorted_values)
+        if numerical_attribute not in discretizer:
+            discretizer.fit(numerical_attribute, numerical_value_map[numerical_attribute])
 
         # assign each numerical value of the numerical_attribute in the knowledge_graph to one of the boundary sets
-        for node_id in knowledge_graph.nodes:
-            if numerical_attribute in knowledge_graph.nodes[node_id]['properties']:
-                attr_value = knowledge_graph.nodes[node_id]['properties'][numerical_attribute]
-                for i in range(len(boundaries) - 1):
-                    if boundaries[i] <= attr_value <= boundaries[i + 1]:
-                        knowledge_graph.nodes[node_id]['properties'][numerical_attribute] = \
-                            str(boundaries[i]) + "_" + str(boundaries[i + 1])
-                        break
+        labels = discretizer.get_labels(numerical_attribute)
+        bin_indices = discretizer.transform(numerical_attribute, numerical_value_map[numerical_attribute])
+        for node_id, bin_index in zip(node_map[numerical_attribute], bin_indices.tolist()):
+            knowledge_graph.nodes[node_id]['properties'][numerical_attribute] = labels[bin_index]
     return knowledge_graph
@@ -0,0 +1,41 @@
+"""
+This Python script includes the item vocabulary that is used to encode transaction items as compact integer ids
+"""
+
+
+class ItemVocabulary:
+    """
+    Interned vocabulary of the items that appear in the transactions, e.g. sensor ids, sensor types, measurement
+    ranges and knowledge graph attributes. Each item is a tuple whose first element is the kind of the item,
+    e.g. ('sensor', 'Junction_3') or ('attribute', 'diameter', '0.1_0.2'), and is mapped to an integer id.
+    The vocabulary is built once per run, and items are decoded back only when the rules are formatted.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.item_ids = {}
+
+    def encode(self, item):
+        """
+        get the integer id of the given item, the item is added to the vocabulary if it is not seen before
+        :param item: an item in the form of a tuple, e.g. ('sensor_type', 'pressure')
+        :return: integer id of the item
+        """
+        item_id = self.item_ids.get(item)
+        if item_id is None:
+            item_id = len(self.items)
+            self.item_ids[item] = item_id
+            self.items.append(item)
+        return item_id
+
+    def decode(self, item_id):
+        """
+        get the item with the given integer id
+        """
+        return self.items[item_id]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.item_ids
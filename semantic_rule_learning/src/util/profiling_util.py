@@ -0,0 +1,130 @@
+"""
+This Python script includes a lightweight instrumentation layer to measure the time and memory usage of the pipeline
+stages, e.g. fetching the data, preprocessing, enrichment, rule mining and rule quality calculation
+"""
+import cProfile
+import csv
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+def get_rss():
+    """
+    :return: current resident set size of the process in bytes, None if it is not available (only on Linux)
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_max_rss():
+    """
+    :return: peak resident set size of the process so far in bytes, None if it is not available (e.g. on Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class StageProfiler:
+    """
+    Measures the wall time, CPU time and memory usage of the stages that are run within its stage() context manager,
+    and stores them as records. Stages can be nested, e.g. the enrichment within an algorithm. The peak Python heap
+    memory of a stage is measured with tracemalloc only when trace_memory is enabled, as it slows down pure Python
+    code, while the resident set size (RSS) is always recorded. Optionally, each top-level stage is profiled with
+    cProfile, and the statistics are dumped into the profile directory
+    """
+
+    def __init__(self, trace_memory=False, profile_directory=None):
+        """
+        :param trace_memory: measure the peak Python heap memory of each stage with tracemalloc
+        :param profile_directory: directory to dump the cProfile statistics of the top-level stages into
+        """
+        self.trace_memory = trace_memory
+        self.profile_directory = profile_directory
+        self.records = []
+        # peak traced memory of the active stages, from the outermost to the innermost stage
+        self.peaks = []
+        if profile_directory:
+            os.makedirs(profile_directory, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name, algorithm="", run=""):
+        """
+        measure the stage that is run within the context
+        :param name: name of the stage
+        :param algorithm: algorithm that the stage belongs to, empty for the shared preprocessing stages
+        :param run: index of the run that the stage belongs to
+        """
+        profiler = None
+        if self.profile_directory and len(self.peaks) == 0:
+            profiler = cProfile.Profile()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if len(self.peaks) > 0:
+                # the peak of the enclosing stage until now, before the peak is reset for this stage
+                self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.peaks.append(0)
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record = {'run': run, 'algorithm': algorithm, 'stage': name, 'depth': len(self.peaks) - 1,
+                      'wall_time': time.perf_counter() - wall_start, 'cpu_time': time.process_time() - cpu_start,
+                      'peak_memory': None, 'rss': get_rss(), 'max_rss': get_max_rss()}
+            peak = self.peaks.pop()
+            if self.trace_memory:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record['peak_memory'] = peak
+                if len(self.peaks) > 0:
+                    self.peaks[-1] = max(self.peaks[-1], peak)
+                else:
+                    tracemalloc.stop()
+            self.records.append(record)
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(self.profile_directory, "_".join(
+                    str(label) for label in [name, algorithm, run] if label != "") + ".prof"))
+
+    def save(self, path):
+        """
+        write the records into a CSV file, in the order that the stages are finished
+        """
+        with open(path, 'w+', newline='') as csvfile:
+            writer = csv.writer(csvfile, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(["Run", "Algorithm", "Stage", "Depth", "Wall Time (s)", "CPU Time (s)",
+                             "Peak Python Memory (MB)", "RSS (MB)", "Max RSS (MB)"])
+            for record in self.records:
+                writer.writerow([record['run'] if record['run'] == "" else record['run'] + 1, record['algorithm'],
+                                 record['stage'], record['depth'], round(record['wall_time'], 4),
+                                 round(record['cpu_time'], 4), self.to_megabytes(record['peak_memory']),
+                                 self.to_megabytes(record['rss']), self.to_megabytes(record['max_rss'])])
+
+    def get_summary(self):
+        """
+        total wall time per (algorithm, stage) over all the runs
+        """
+        summary = {}
+        for record in self.records:
+            key = (record['algorithm'], record['stage'])
+            summary[key] = summary.get(key, 0) + record['wall_time']
+        return summary
+
+    @staticmethod
+    def to_megabytes(size):
+        return round(size / 2 ** 20, 2) if size is not None else ""
@@ -3,7 +3,12 @@ This script implements helper functions relevant to logical association rule qua
 """
 from statistics import mean
 
+import numpy as np
 import pandas as pd
+from scipy.sparse import issparse
+
+# number of set bits for each possible byte value, used to count transactions in packed bitsets
+POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
 
 
 def calculate_average_rule_quality(rule_stats):
@@ -79,24 +84,205 @@ def calculate_zhangs_metric(support, support_ant, support_cons):
     return numerator / denominator
 
 
+def pack_item_matrix(item_matrix, chunk_size=1024):
+    """
+    pack a boolean item x transaction matrix into bitsets, one row of bits per item
+    an additional row with all the bits set is appended, which is used to pad antecedents of different lengths
+    :param item_matrix: boolean NumPy array or SciPy sparse matrix with a row per item and a column per transaction
+    :param chunk_size: number of rows of a sparse matrix that are densified at once
+    :return: packed bitsets in the form of uint8 array
+    """
+    all_transactions = np.ones((1, item_matrix.shape[1]), dtype=bool)
+    if issparse(item_matrix):
+        item_matrix = item_matrix.tocsr()
+        return np.vstack([np.packbits(item_matrix[start:start + chunk_size].toarray().astype(bool), axis=1) for start
+                          in range(0, item_matrix.shape[0], chunk_size)] + [np.packbits(all_transactions, axis=1)])
+    item_matrix = np.asarray(item_matrix, dtype=bool)
+    return np.packbits(np.vstack([item_matrix, all_transactions]), axis=1)
+
+
+def calculate_rule_stats(item_matrix, antecedents, consequents, packed_items=None, chunk_size=4096):
+    """
+    calculate rule quality stats for a set of rules at once, based on bitwise AND and popcount over the transactions
+    :param item_matrix: boolean NumPy array or SciPy sparse matrix with a row per item and a column per transaction
+    :param antecedents: list of antecedents per rule, each antecedent is a list of item (row) indices
+    :param consequents: list of consequent item (row) indices per rule
+    :param packed_items: packed form of the item_matrix from pack_item_matrix, if it is already calculated
+    :param chunk_size: number of rules that are evaluated together
+    :return: list of stats per rule and a boolean array marking the transactions that are covered by any rule
+    """
+    num_transactions = np.shape(item_matrix)[1]
+    if packed_items is None:
+        packed_items = pack_item_matrix(item_matrix)
+    covered_transactions = np.zeros(packed_items.shape[1], dtype=np.uint8)
+    if len(antecedents) == 0:
+        return [], np.zeros(num_transactions, dtype=bool)
+
+    # antecedents are padded with the all transactions row, which doesn't change the result of the AND operation
+    max_antecedents = max(len(antecedent) for antecedent in antecedents)
+    antecedent_indices = np.full((len(antecedents), max(max_antecedents, 1)), len(packed_items) - 1)
+    for rule_index, antecedent in enumerate(antecedents):
+        antecedent_indices[rule_index, :len(antecedent)] = antecedent
+    consequents = np.asarray(consequents)
+
+    antecedent_counts = []
+    consequent_counts = []
+    co_occurrence_counts = []
+    for chunk_start in range(0, len(antecedents), chunk_size):
+        chunk = antecedent_indices[chunk_start:chunk_start + chunk_size]
+        antecedent_bits = np.bitwise_and.reduce(packed_items[chunk], axis=1)
+        consequent_bits = packed_items[consequents[chunk_start:chunk_start + chunk_size]]
+        antecedent_counts.append(POPCOUNT_TABLE[antecedent_bits].sum(axis=1))
+        consequent_counts.append(POPCOUNT_TABLE[consequent_bits].sum(axis=1))
+        co_occurrence_counts.append(POPCOUNT_TABLE[antecedent_bits & consequent_bits].sum(axis=1))
+        covered_transactions |= np.bitwise_or.reduce(antecedent_bits, axis=0)
+
+    antecedent_counts = np.concatenate(antecedent_counts).astype(float)
+    consequent_counts = np.concatenate(consequent_counts).astype(float)
+    co_occurrence_counts = np.concatenate(co_occurrence_counts).astype(float)
+
+    support = co_occurrence_counts / num_transactions
+    support_body = antecedent_counts / num_transactions
+    support_head = consequent_counts / num_transactions
+    with np.errstate(divide='ignore', invalid='ignore'):
+        confidence = np.where(support_body != 0, support / support_body, 0)
+        interestingness = np.where(support_head != 0, confidence * (support / support_head), 0) * \
+                          (1 - (support / num_transactions))
+    # see calculate_zhangs_metric and calculate_yulesq for the formulas
+    zhangs_metric = (support - support_body * support_head) / (
+            np.maximum(support * (1 - support_body), support_body * (support_head - support)) + 2.220446049250313e-16)
+    ad = co_occurrence_counts * (num_transactions - antecedent_counts - consequent_counts + co_occurrence_counts)
+    bc = (consequent_counts - co_occurrence_counts) * (antecedent_counts - co_occurrence_counts)
+    yulesq = (ad - bc) / (ad + bc + 2.220446049250313e-16)
+
+    stats = [{'support': values[0], 'confidence': values[1], 'coverage': values[2], 'zhangs_metric': values[3],
+              'yulesq': values[4], 'interestingness': values[5]} for values in
+             np.stack([support, confidence, support_body, zhangs_metric, yulesq, interestingness], axis=1).tolist()]
+    return stats, np.unpackbits(covered_transactions, count=num_transactions).astype(bool)
+
+
+def get_canonical_item(item):
+    """
+    convert an item of a rule (e.g. a dictionary of a measurement range and node attributes, or an item id) into a
+    hashable form that doesn't depend on the order of its elements
+    """
+    if isinstance(item, dict):
+        return frozenset((key, get_canonical_item(value)) for key, value in item.items())
+    if isinstance(item, (list, tuple, set, frozenset)):
+        return frozenset(get_canonical_item(element) for element in item)
+    if hasattr(item, '__slots__') or hasattr(item, '__dict__'):
+        # objects, e.g. the features of the NiaARM rules, are compared by their attributes
+        attributes = getattr(item, '__slots__', None) or vars(item)
+        return get_canonical_item({attribute: getattr(item, attribute) for attribute in attributes})
+    if isinstance(item, np.generic):
+        return item.item()
+    return item
+
+
+def get_rule_key(rule):
+    """
+    canonical, hashable key of a rule: the set of antecedents and the consequent. If the consequent belongs to the
+    same sensor as one of the antecedents (consequent_index), that antecedent is part of the consequent of the key
+    :param rule: rule as a dictionary with "antecedents" and "consequent" keys, or a NiaARM rule
+    """
+    if isinstance(rule, dict):
+        antecedents, consequent = rule['antecedents'], rule['consequent']
+    else:
+        antecedents, consequent = rule.antecedent, rule.consequent
+    antecedent_keys = [get_canonical_item(antecedent) for antecedent in antecedents]
+    consequent_index = rule.get('consequent_index') if isinstance(rule, dict) else None
+    consequent_owner = antecedent_keys[consequent_index] if consequent_index is not None and \
+        consequent_index < len(antecedent_keys) else None
+    return frozenset(antecedent_keys), (get_canonical_item(consequent), consequent_owner)
+
+
+class RuleIndex:
+    """
+    Hash index of the rules by their canonical key (see get_rule_key), for constant time deduplication and
+    membership tests, and overlap calculations between the rules of different algorithms. The rules are also
+    indexed by their antecedents to find the rules whose antecedents are a subset of given items
+    """
+
+    def __init__(self, rules=()):
+        """
+        :param rules: rules to index, only the first one of the rules with the same key is kept
+        """
+        self.rules = []
+        self.keys = {}
+        # rule keys per antecedent
+        self.antecedent_index = {}
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __contains__(self, rule):
+        return get_rule_key(rule) in self.keys
+
+    def add(self, rule):
+        """
+        :return: True if the rule is added, False if a rule with the same key is already in the index
+        """
+        key = get_rule_key(rule)
+        if key in self.keys:
+            return False
+        self.keys[key] = len(self.rules)
+        self.rules.append(rule)
+        for antecedent in key[0]:
+            self.antecedent_index.setdefault(antecedent, []).append(key)
+        return True
+
+    def get_subset_rules(self, items):
+        """
+        find the rules whose antecedents are all in the given items
+        :param items: items (in the same form as the antecedents of the rules)
+        """
+        counts = {}
+        for item in set(get_canonical_item(item) for item in items):
+            for key in self.antecedent_index.get(item, []):
+                counts[key] = counts.get(key, 0) + 1
+        return [self.rules[self.keys[key]] for key, count in counts.items() if count == len(key[0])]
+
+    def get_overlap(self, other):
+        """
+        ratio of the rules in this index that are also in the other index
+        """
+        if len(self) == 0:
+            return 0
+        return len(self.keys.keys() & other.keys.keys()) / len(self)
+
+    def get_jaccard(self, other):
+        """
+        Jaccard similarity of the rule sets of the two indexes
+        """
+        union = len(self.keys.keys() | other.keys.keys())
+        return len(self.keys.keys() & other.keys.keys()) / union if union > 0 else 0
+
+
 def calculate_rule_overlap(results):
+    """
+    calculate the ratio of the rules of each algorithm that are also found by each of the other algorithms
+    :param results: rules per algorithm as {algorithm: {'rules': rules}}, where the rules can also be a list of rule
+    lists (e.g. of multiple runs) that are merged
+    :return: overlap per algorithm pair as {algorithm: {algorithm2: overlap}}
+    """
+    rule_indexes = {}
+    for algorithm in results:
+        rules = results[algorithm]['rules'] or []
+        if len(rules) > 0 and isinstance(rules[0], list):
+            rules = [rule for run_rules in rules for rule in run_rules]
+        if len(rules) > 0:
+            rule_indexes[algorithm] = RuleIndex(rules)
+
     overlap_list = {}
-    for dataset in results:
-        for algorithm in results[dataset]:
-            overlap_list[algorithm] = {}
-            for algorithm2 in results[dataset]:
-                if algorithm == algorithm2:
-                    continue
-                match = 0
-                if results[dataset][algorithm]['rules'] and len(results[dataset][algorithm]['rules']) > 0 and \
-                        results[dataset][algorithm2]['rules'] and len(results[dataset][algorithm2]['rules']) > 0:
-                    for rule in results[dataset][algorithm]['rules']:
-                        for rule2 in results[dataset][algorithm2]['rules']:
-                            if set(rule["antecedents"]) == set(rule2["antecedents"]) and \
-                                    set(rule["consequent"]) == set(rule2["consequent"]):
-                                match += 1
-                    overlap_list[algorithm][algorithm2] = match / len(results[dataset][algorithm]['rules'])
+    for algorithm in rule_indexes:
+        overlap_list[algorithm] = {}
+        for algorithm2 in rule_indexes:
+            if algorithm != algorithm2:
+                overlap_list[algorithm][algorithm2] = rule_indexes[algorithm].get_overlap(rule_indexes[algorithm2])
     print("Rule overlaps:", overlap_list)
+    return overlap_list
 
 
 def evaluate_rules(association_rules, exec_time, training_time):
@@ -2,64 +2,72 @@
 Includes utility functions for processing transaction(s)
 """
 from src.util.graph_util import *
-from src.repository.timescaledb.sensor_data_repository import SensorDataRepository
+from src.util.converter_util import SensorTransactions
 from src.util.discretization_util import *
 
 
 def get_transactions_by_subgraph(transactions, subgraph):
     """
     Filter given transactions by nodes in the given subgraph
-    :param transactions:
+    :param transactions: SensorTransactions
     :param subgraph:
-    :return: A list of transactions for the nodes in the given subgraph only
+    :return: transactions for the sensors of the nodes in the given subgraph only
     """
-    subset = []
-    for transaction in transactions:
-        new_transaction = []
-        for item in transaction:
-            sensor_id = item.split("_", 1)[1].split('__')[0]
+    node_ids = set()
+    for edge_list in subgraph:
+        for edge in edge_list:
+            node_ids.add(edge['source']['properties']['id'])
+            node_ids.add(edge['destination']['properties']['id'])
 
-            for edge_list in subgraph:
-                for edge in edge_list:
-                    if sensor_id == edge['source']['properties']['id'] or sensor_id == \
-                            edge['destination']['properties']['id']:
-                        new_transaction.append(item)
-        subset.append(list(dict.fromkeys(new_transaction)))
+    columns = [column for column in range(len(transactions.sensors)) if
+               transactions.get_sensor_name(column) in node_ids]
+    return SensorTransactions(transactions.vocabulary, transactions.sensors[columns],
+                              transactions.sensor_types[columns], transactions.values[:, columns],
+                              transactions.timestamps,
+                              transactions.bin_indices[:, columns] if transactions.bin_indices is not None else None,
+                              transactions.discretizer)
 
-    return subset
 
-
-def calculate_discrete_boundaries(transactions, num_bins):
+def calculate_discrete_boundaries(transactions, num_bins, method='equal_frequency'):
     """
     calculate discrete boundaries for each type of sensor data in the transaction set
-    :param transactions: transactions in the form of list of lists
+    :param transactions: SensorTransactions
     :param num_bins: number of bins to discretize the transactions in
+    :param method: 'equal_frequency' or 'equal_width' binning
+    :return: Discretizer with boundaries per sensor type
     """
-    sensor_data_repository = SensorDataRepository()
-    sensor_types = sensor_data_repository.get_unique_sensor_types()
+    # the boundaries of the transactions that are already discretized (in the database) are reused
+    discretizer = transactions.discretizer
+    if discretizer is not None and discretizer.num_bins == num_bins and discretizer.method == method:
+        return discretizer
 
-    sensor_values_per_type = {}
-    for sensor_type in sensor_types:
-        sensor_values_per_type[sensor_type[0]] = []
+    discretizer = Discretizer(num_bins, method)
+    for sensor_type_id in dict.fromkeys(transactions.sensor_types.tolist()):
+        sensor_values = transactions.values[:, transactions.sensor_types == sensor_type_id].ravel()
+        sensor_values = sensor_values[~np.isnan(sensor_values)]
+        if len(sensor_values) == 0:
+            continue
+        discretizer.fit(transactions.vocabulary.decode(sensor_type_id)[1], sensor_values)
 
-    for transaction in transactions:
-        for item in transaction:
-            measurement = item.split("_", 1)[0]
-            sensor_type = item.split("_type_", 1)[1].split('_end_')[0]
-            sensor_values_per_type[sensor_type].append(float(measurement))
+    return discretizer
 
-    boundary_map = {'label': {}}
-    for sensor_type in sensor_values_per_type:
-        # sort values in increasing order
-        if len(sensor_values_per_type[sensor_type]) == 0:
-            continue
-        boundaries = equal_frequency_discretization(sensor_values_per_type[sensor_type], num_bins)
 
-        boundary_map[sensor_type] = boundaries
-        boundary_map['label'][sensor_type] = []
-        for index in range(len(boundaries) - 1):
-            boundary_map['label'][sensor_type].append(
-                "sensor_type_" + sensor_type + "_end__range_" + str(boundaries[index]) + "_" + str(
-                    boundaries[index + 1]) + "_end_")
+def discretize_transactions(transactions, discretizer):
+    """
+    assign the measurements of each sensor to a bin of its sensor type
+    :param transactions: SensorTransactions
+    :param discretizer: Discretizer with boundaries per sensor type
+    :return: transactions x sensors matrix of bin indices, -1 for missing measurements
+    """
+    if transactions.bin_indices is not None and transactions.discretizer is discretizer:
+        return transactions.bin_indices
+
+    bin_indices = np.full(transactions.values.shape, -1)
+    for sensor_type_id in dict.fromkeys(transactions.sensor_types.tolist()):
+        sensor_type = transactions.vocabulary.decode(sensor_type_id)[1]
+        if sensor_type not in discretizer:
+            continue
+        columns = transactions.sensor_types == sensor_type_id
+        bin_indices[:, columns] = discretizer.transform(sensor_type, transactions.values[:, columns])
 
-    return boundary_map
+    return bin_indices
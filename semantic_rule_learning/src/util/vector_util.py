@@ -1,58 +1,36 @@
 import numpy as np
 
 
-def create_vector_rep_node(node, postfix):
+def create_vector_rep_node(node_name, node_encoder, position, vocabulary):
     """
     create a vector representation for the given node based on the node types
     each vector contains space for all possible node types, and only the type which the given node corresponds
     to is filled (this means sparsity in the input), this is done to avoid permutation
-    :param node: a node in the knowledge graph in the NetworkX format
-    :param postfix:
+    :param node_name: name of a node in the knowledge graph
+    :param node_encoder: NodeFeatureEncoder with the one-hot encoded attributes of the nodes
+    :param position: position of the item (sensor) in the transaction
+    :param vocabulary: ItemVocabulary to encode the vector indices with
     """
-    values = []
-    indices = []
-
-    for key in node['properties'].keys():
-        if key == 'name':
-            continue
-        indices.append(key + postfix)
-        values.append(node['properties'][key])
+    features, values = node_encoder.get_node_features(node_name)
+    indices = [vocabulary.encode(('column', position, feature)) for feature in features]
 
     return values, indices
 
 
-def create_vector_rep_measurement(sensor_measurement, boundaries, sensor_type, postfix):
-    vector = []
-    indices = []
-    partial_vector = np.zeros(len(boundaries[sensor_type]) - 1)
-    indices += boundaries['label'][sensor_type]
-    for index in range(len(indices)):
-        indices[index] = indices[index] + postfix
-    for index in range(len(boundaries[sensor_type]) - 1):
-        if boundaries[sensor_type][index] <= sensor_measurement <= boundaries[sensor_type][index + 1]:
-            partial_vector[index] = 1
-            break
-    vector += partial_vector.tolist()
-
-    return vector, indices
-
-
-def get_category_boundaries(vector_category_tracker):
+def create_vector_rep_measurement(bin_index, discretizer, sensor_type, position, vocabulary):
     """
-    each input vector consists of one-hot encoded data for multiple categorical input
-    at the last step of the AE, a softmax will be applied to each category individually
-    therefore, this method returns the indices of input categories
+    create a one-hot encoded vector representation for the given discrete sensor measurement
+    :param bin_index: index of the bin (range) that the measurement falls into, -1 if it is missing
+    :param discretizer: Discretizer with boundaries per sensor type
+    :param sensor_type: type of the sensor
+    :param position: position of the item (sensor) in the transaction
+    :param vocabulary: ItemVocabulary to encode the vector indices with
     """
-    boundaries_per_transaction = []
-    for category_vector in vector_category_tracker:
-        indices = []
-        start = 0
-        for index in range(1, len(category_vector)):
-            if category_vector[start].split('_')[0] != category_vector[index].split('_')[0]:
-                indices.append({'start': start, 'end': index})
-                start = index
-
-        indices.append({'start': start, 'end': len(category_vector)})
-        boundaries_per_transaction.append(indices)
-
-    return boundaries_per_transaction
+    labels = discretizer.get_labels(sensor_type)
+    indices = [vocabulary.encode(('column', position, vocabulary.encode(('range', sensor_type, label)))) for label in
+               labels]
+    partial_vector = np.zeros(len(labels))
+    if bin_index >= 0:
+        partial_vector[bin_index] = 1
+
+    return partial_vector.tolist(), indices
@@ -0,0 +1,121 @@
+"""
+Common bulk ingest helpers for the sensor data importers. Sensor data is read in chunks, converted to the long
+(time, value, name, sensor_type) format of the sensor tables with vectorized pandas operations, and loaded into
+TimescaleDB using COPY FROM STDIN, or execute_values as a fallback
+"""
+import io
+import time
+
+import pandas as pd
+import psycopg2
+from openpyxl import load_workbook
+from psycopg2.extras import execute_values
+
+COLUMNS = ['time', 'value', 'name', 'sensor_type']
+
+
+def read_csv_chunks(path, chunk_size=100000, **kwargs):
+    """
+    stream a CSV file in chunks of DataFrames
+    :param path: path to the CSV file
+    :param chunk_size: number of rows per chunk
+    :param kwargs: additional arguments passed to pandas.read_csv
+    """
+    with pd.read_csv(path, chunksize=chunk_size, **kwargs) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def read_excel_chunks(path, sheet_name, chunk_size=10000):
+    """
+    stream an Excel sheet in chunks of DataFrames, the first row of the sheet is used as the header. The workbook is
+    opened in read-only mode so that the whole sheet is never loaded into memory at once
+    :param path: path to the Excel file
+    :param sheet_name: name of the sheet to read
+    :param chunk_size: number of rows per chunk
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = [str(column) for column in next(rows)]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if len(chunk) > 0:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def wide_to_long(frame, time_column, sensor_type=None, name_prefix="s_"):
+    """
+    convert a wide DataFrame with one column per sensor into the long format of the sensor tables
+    :param frame: DataFrame with a time column and one value column per sensor
+    :param time_column: name of the time column
+    :param sensor_type: sensor type of all the sensors in the frame, the column name is used if not given
+    :param name_prefix: prefix of the sensor names, sensors are stored as "s_" + column name
+    :return: DataFrame with time, value, name and sensor_type columns
+    """
+    long_frame = frame.melt(id_vars=[time_column], var_name='column', value_name='value')
+    long_frame['time'] = pd.to_datetime(long_frame[time_column])
+    long_frame['value'] = pd.to_numeric(long_frame['value'], errors='coerce')
+    long_frame['name'] = name_prefix + long_frame['column'].astype(str)
+    long_frame['sensor_type'] = long_frame['column'].astype(str) if sensor_type is None else sensor_type
+    return long_frame[COLUMNS]
+
+
+def copy_frame(cursor, table, frame):
+    """
+    load a long format DataFrame into the given table using COPY FROM STDIN
+    """
+    buffer = io.StringIO()
+    frame.to_csv(buffer, columns=COLUMNS, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+    buffer.seek(0)
+    cursor.copy_expert("COPY {} (time, value, NAME, sensor_type) FROM STDIN WITH (FORMAT csv)".format(table),
+                       buffer)
+
+
+def insert_frame(cursor, table, frame, page_size=10000):
+    """
+    load a long format DataFrame into the given table using multi-row INSERT statements
+    """
+    values = frame[COLUMNS].astype(object).where(frame[COLUMNS].notna(), None)
+    execute_values(cursor, "INSERT INTO {} (time, value, NAME, sensor_type) VALUES %s".format(table),
+                   values.itertuples(index=False, name=None), page_size=page_size)
+
+
+def ingest(connection, table, frames, use_copy=True):
+    """
+    load the given long format DataFrames into the given table, committing once per DataFrame, and report the
+    ingestion speed in rows/sec
+    :param connection: psycopg2 connection
+    :param table: name of the sensor table, e.g. leakdb
+    :param frames: iterable of DataFrames with time, value, name and sensor_type columns
+    :param use_copy: whether to use COPY FROM STDIN, execute_values is used instead if False or if the server does
+    not support COPY
+    :return: total number of rows that are loaded
+    """
+    total_rows = 0
+    start = time.time()
+    with connection.cursor() as cursor:
+        for frame in frames:
+            if len(frame) == 0:
+                continue
+            if use_copy:
+                try:
+                    copy_frame(cursor, table, frame)
+                except psycopg2.NotSupportedError:
+                    connection.rollback()
+                    print("COPY is not supported, falling back to execute_values")
+                    use_copy = False
+            if not use_copy:
+                insert_frame(cursor, table, frame)
+            connection.commit()
+            total_rows += len(frame)
+            elapsed = time.time() - start
+            print("Imported", total_rows, "rows into", table, "-",
+                  round(total_rows / elapsed, 2) if elapsed > 0 else total_rows, "rows/sec")
+    return total_rows
@@ -1,11 +1,8 @@
-import json
-import os.path
 import psycopg2
-import csv
+import pandas as pd
 
-from datetime import datetime
-from dateutil import parser
 from os import listdir
+from bulk_ingest import *
 
 # TimescaleDB confing
 host = "145.109.95.190"
@@ -15,94 +12,36 @@ password = "password"
 
 connection = "postgres://{}:{}@{}:{}".format(username, password, host, port)
 
-if __name__ == '__main__':
-    with psycopg2.connect(connection) as timescaledb_connection:
-        cursor = timescaledb_connection.cursor()
-        main_data_path = '../data/sensor/LeakDB_Hanoi_CMH_Scenario-1/'
-
-        # read timestamps
-        timestamps = []
-        with open(main_data_path + 'Timestamps.csv') as file:
-            timestamps_csv = csv.reader(file, delimiter=',', quotechar='|')
-            # ignore header row
-            next(timestamps_csv)
-            for row in timestamps_csv:
-                timestamps.append(row[1])
-
-        # read demands (junctions)
-        demands = []
-        demand_files = listdir(main_data_path + 'Demands')
-        for demand_file_name in demand_files:
-            junction_id = "Junction_" + str(demand_file_name.replace('Node_', '').replace('.csv', ''))
-            with open(main_data_path + 'Demands/' + demand_file_name) as file:
-                demands_csv = csv.reader(file, delimiter=',', quotechar='|')
-                # ignore header row
-                next(demands_csv)
-                values = []
-                for row in demands_csv:
-                    values.append({'timestamp': timestamps[int(row[0]) - 1], 'value': row[1]})
-            demands.append({'id': junction_id, 'values': values})
 
-        # read flows (pipes)
-        flows = []
-        flow_files = listdir(main_data_path + 'Flows')
-        for flow_file_name in flow_files:
-            pipe_id = "Pipe_" + str(flow_file_name.replace('Link_', '').replace('.csv', ''))
-            with open(main_data_path + 'Flows/' + flow_file_name) as file:
-                flows_csv = csv.reader(file, delimiter=',', quotechar='|')
-                # ignore header row
-                next(flows_csv)
-                values = []
-                for row in flows_csv:
-                    values.append({'timestamp': timestamps[int(row[0]) - 1], 'value': row[1]})
-            flows.append({'id': pipe_id, 'values': values})
+def read_measurements(directory, file_prefix, object_prefix, sensor_type, timestamps):
+    """
+    read the measurement files of one sensor type, each file contains (timestamp index, value) rows of one object
+    """
+    for file_name in listdir(directory):
+        object_id = object_prefix + str(file_name.replace(file_prefix, '').replace('.csv', ''))
+        measurements = pd.read_csv(directory + file_name)
+        # timestamp indices start from 1
+        yield pd.DataFrame({
+            'time': timestamps[measurements.iloc[:, 0].to_numpy() - 1],
+            'value': pd.to_numeric(measurements.iloc[:, 1], errors='coerce').to_numpy(),
+            'name': "s_" + object_id,
+            'sensor_type': sensor_type
+        })
 
-        # read flows (junctions)
-        pressures = []
-        pressure_files = listdir(main_data_path + 'Pressures')
-        for pressure_file_name in pressure_files:
-            junction_id = "Junction_" + str(pressure_file_name.replace('Node_', '').replace('.csv', ''))
-            with open(main_data_path + 'Pressures/' + pressure_file_name) as file:
-                pressures_csv = csv.reader(file, delimiter=',', quotechar='|')
-                # ignore header row
-                next(pressures_csv)
-                values = []
-                for row in pressures_csv:
-                    values.append({'timestamp': timestamps[int(row[0]) - 1], 'value': row[1]})
-            pressures.append({'id': junction_id, 'values': values})
 
-        # store the data in timescaledb
-        with psycopg2.connect(connection) as timescaledb_connection:
-            cursor = timescaledb_connection.cursor()
-
-            for demand in demands:
-                object_id = demand['id']
-                for measurement in demand['values']:
-                    cursor.execute("INSERT INTO leakdb (time, value, NAME, sensor_type) values (%s, %s, %s, %s)", (
-                        parser.parse(measurement['timestamp']).isoformat(),
-                        float(measurement['value']),
-                        "s_" + object_id,
-                        "demand"
-                    ))
-
-            for flow in flows:
-                object_id = flow['id']
-                for measurement in flow['values']:
-                    cursor.execute("INSERT INTO leakdb (time, value, NAME, sensor_type) values (%s, %s, %s, %s)", (
-                        parser.parse(measurement['timestamp']).isoformat(),
-                        float(measurement['value']),
-                        "s_" + object_id,
-                        "flow"
-                    ))
+if __name__ == '__main__':
+    main_data_path = '../data/sensor/LeakDB_Hanoi_CMH_Scenario-1/'
 
-            for pressure in pressures:
-                object_id = pressure['id']
-                for measurement in pressure['values']:
-                    cursor.execute("INSERT INTO leakdb (time, value, NAME, sensor_type) values (%s, %s, %s, %s)", (
-                        parser.parse(measurement['timestamp']).isoformat(),
-                        float(measurement['value']),
-                        "s_" + object_id,
-                        "pressure"
-                    ))
+    # read timestamps, parsed once for all the measurements
+    timestamps = pd.to_datetime(pd.read_csv(main_data_path + 'Timestamps.csv').iloc[:, 1]).to_numpy()
 
-            timescaledb_connection.commit()
+    with psycopg2.connect(connection) as timescaledb_connection:
+        # demands (junctions)
+        ingest(timescaledb_connection, "leakdb",
+               read_measurements(main_data_path + 'Demands/', 'Node_', 'Junction_', 'demand', timestamps))
+        # flows (pipes)
+        ingest(timescaledb_connection, "leakdb",
+               read_measurements(main_data_path + 'Flows/', 'Link_', 'Pipe_', 'flow', timestamps))
+        # pressures (junctions)
+        ingest(timescaledb_connection, "leakdb",
+               read_measurements(main_data_path + 'Pressures/', 'Node_', 'Junction_', 'pressure', timestamps))
@@ -1,12 +1,6 @@
-import json
-import os.path
 import psycopg2
-import csv
 
-from datetime import datetime
-from dateutil import parser
-from os import listdir
-import pandas as pd
+from bulk_ingest import *
 
 # TimescaleDB confing
 host = "192.168.1.249"
@@ -18,44 +12,17 @@ connection = "postgres://{}:{}@{}:{}".format(username, password, host, port)
 
 if __name__ == '__main__':
     with psycopg2.connect(connection) as timescaledb_connection:
-        cursor = timescaledb_connection.cursor()
         main_data_path = '../data/sensor/L-TOWN_Real/'
+        excel_file = main_data_path + '2018_SCADA.xlsx'
 
-        excel_file = pd.ExcelFile(main_data_path + '2018_SCADA.xlsx')
-        flows_sheet = pd.read_excel(excel_file, 'Flows (m3_h)')
-
-        for i, row in flows_sheet.iterrows():
-            for column in flows_sheet.columns[1:]:
-                cursor.execute("INSERT INTO ltown (time, value, NAME, sensor_type) values (%s, %s, %s, %s)", (
-                    row['Timestamp'],
-                    row[column],
-                    "s_" + column,
-                    "flow"
-                ))
-        timescaledb_connection.commit()
+        ingest(timescaledb_connection, "ltown",
+               (wide_to_long(chunk, 'Timestamp', 'flow') for chunk in read_excel_chunks(excel_file, 'Flows (m3_h)')))
         print("Flow values are imported")
 
-        demands_sheet = pd.read_excel(excel_file, 'Demands (L_h)')
-        for i, row in demands_sheet.iterrows():
-            for column in demands_sheet.columns[1:]:
-                cursor.execute("INSERT INTO ltown (time, value, NAME, sensor_type) values (%s, %s, %s, %s)", (
-                    row['Timestamp'],
-                    row[column],
-                    "s_" + column,
-                    "demand"
-                ))
-        timescaledb_connection.commit()
+        ingest(timescaledb_connection, "ltown",
+               (wide_to_long(chunk, 'Timestamp', 'demand') for chunk in read_excel_chunks(excel_file, 'Demands (L_h)')))
         print("Demand values are imported")
 
-        pressures_sheet = pd.read_excel(excel_file, 'Pressures (m)')
-        for i, row in pressures_sheet.iterrows():
-            for column in pressures_sheet.columns[1:]:
-                cursor.execute("INSERT INTO ltown (time, value, NAME, sensor_type) values (%s, %s, %s, %s)", (
-                    row['Timestamp'],
-                    row[column],
-                    "s_" + column,
-                    "pressure"
-                ))
-
-        timescaledb_connection.commit()
+        ingest(timescaledb_connection, "ltown",
+               (wide_to_long(chunk, 'Timestamp', 'pressure') for chunk in read_excel_chunks(excel_file, 'Pressures (m)')))
         print("Pressure values are imported")